@@ -18,16 +18,6 @@ PATH_DATA_DB="$PATH_DATA/piot.sqlite"
 source $PATH_CONFIG
 
 # Define common functions
-function json_read_key {
-    local json=$1
-    local key=$2
-    local default_value=$3
-    local value="$(echo $json | jq -c .\"$key\")"
-    [ $? -ne 0 ] && value=$default_value
-    [ "x$value" == "xnull" ] && value=$default_value
-    echo $value
-}
-
 function log_param {
     local name=$1
     local value=$2
@@ -48,27 +38,55 @@ function prepare_action {
     echo "  $description"
 }
 
-__piot_data=""
+# Actions are run with --format=shell, i.e. they print one <key>=<value> per line,
+# which is parsed by bash builtins only, no forks or JSON parsing per key
+declare -A __piot_out
+__piot_keys=()
 function process_action {
     local out=$1
     local rc=$2
-    local success=$(json_read_key "$out" "success" "false")
-    local error=$(json_read_key "$out" "error" "null")
+    local success="false"
+    local error=""
+    local key
+    local value
 
-    # Save "out" in global variable
-    __piot_data=$(json_read_key "$out" "out" "{}")
+    # Save "out" keys in global map, e.g. ${__piot_out[size]}
+    __piot_out=()
+    __piot_keys=()
+    while IFS='=' read -r key value; do
+        case "$key" in
+            success) success=$value ;;
+            error)   error=$value ;;
+            out.*)   __piot_out[${key#out.}]=$value; __piot_keys+=("${key#out.}") ;;
+        esac
+    done <<< "$out"
 
     # Log generic parameters
     log_param "success" "$success"
     [ $rc -ne 0 ] &&
       log_param "rc" "$rc"
-    log_param "error" "$error"
-    log_param "data" "$__piot_data"
+    [ -n "$error" ] &&
+      log_param "error" "$error"
+    for key in "${__piot_keys[@]}"; do
+        log_param "$key" "${__piot_out[$key]}"
+    done
 
     # Early exit if failed
     [ "x$success" != "xtrue" ] && exit 42
 }
 
+# Compose JSON object of "out" keys with numeric values, e.g. sensor reading,
+# into global variable, so that no subshell is needed
+__piot_json=""
+function out_to_json {
+    local key
+    local json=""
+    for key in "${__piot_keys[@]}"; do
+        json+="${json:+,}\"$key\":${__piot_out[$key]}"
+    done
+    __piot_json="{$json}"
+}
+
 # Show config
 prepare_action "Starting piot2 wrapper ::\
 
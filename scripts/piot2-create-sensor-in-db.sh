@@ -18,7 +18,8 @@ function main {
         prepare_action "Creating DB :: path=$PATH_DATA_DB"
         out=`$PATH_PIOT --action=db-create \
                         --db-path=$PATH_DATA_DB \
-                        --auth-token=$SERVER_AUTH_TOKEN`
+                        --auth-token=$SERVER_AUTH_TOKEN \
+                        --format=shell`
         process_action "$out" $?
     fi
 
@@ -28,7 +29,9 @@ function main {
                     --db-path=$PATH_DATA_DB \
                     --auth-token=$SERVER_AUTH_TOKEN \
                     --sensor-name=$SENSOR_NAME \
-                    --sensor-type=$SENSOR_TYPE`
+                    --sensor-type=$SENSOR_TYPE \
+                    --backlog-filter=$BACKLOG_FILTER \
+                    --format=shell`
     process_action "$out" $?
 }
 main
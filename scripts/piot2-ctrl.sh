@@ -8,6 +8,7 @@ HOOK_CLIENT="$HOOKS_DIR/piot2-client-hook.sh"
 HOOK_SERVER="$HOOKS_DIR/piot2-server-hook.sh"
 CONFIG_DIR="$SCRIPTS_DIR/cfg"
 DB_PATH="$CONFIG_DIR/piot.sqlite"
+AGENT_STATUS="/tmp/piot2-client-agent.json"
 
 # Parse arguments
 for i in "$@"; do
@@ -48,8 +49,9 @@ _hook_write() {
     local config_name=$1
     local hook_name=$2
     local hook_path=$3
+    local hook_args=${4:+ $4}
 
-    echo "\$SCRIPTS_DIR/$hook_name \$CONFIG_DIR/$config_name" >> $hook_path
+    echo "\$SCRIPTS_DIR/$hook_name \$CONFIG_DIR/$config_name$hook_args" >> $hook_path
 }
 
 _hook_cleanup() {
@@ -82,6 +84,7 @@ _hook_client_apply() {
         echo "Applying client hooks for serverless deployment:"
         _hook_write "$config_name" "piot2-create-sensor-in-db.sh" "$HOOK_CLIENT"
         _hook_write "$config_name" "piot2-write-sensor-ds18b20-to-db.sh" "$HOOK_CLIENT"
+        _hook_write "$config_name" "piot2-seal-db.sh" "$HOOK_CLIENT"
     fi
 }
 
@@ -92,9 +95,12 @@ _hook_server_apply() {
     # Remove old hooks
     _hook_cleanup $config_name $HOOK_SERVER
 
-    # Apply hooks from config
+    # Apply hooks from config, server:
+    #  * Drains backlog received from clients to DB
+    #  * Seals old points of DB, sealed range is skipped by later drains
     echo "Applying server hooks"
-    _hook_write "$config_name" "piot2-write-sensor-to-db.sh" "$HOOK_SERVER"
+    _hook_write "$config_name" "piot2-write-backlog-to-db.sh" "$HOOK_SERVER"
+    _hook_write "$config_name" "piot2-seal-db.sh" "$HOOK_SERVER" "server"
 }
 
 _service_enable() {
@@ -133,6 +139,27 @@ _service_disable() {
     fi
 }
 
+_agent_enable() {
+    echo "Enabling piot client agent service"
+
+    # Agent samples & uploads by itself, so client hooks must be off
+    _service_disable "client"
+
+    systemctl enable piot2-client-agent
+    systemctl start piot2-client-agent
+}
+
+_agent_disable() {
+    echo "Disabling piot client agent service"
+    systemctl stop piot2-client-agent
+    systemctl disable piot2-client-agent
+}
+
+_agent_reload() {
+    echo "Reloading piot client agent config"
+    systemctl reload piot2-client-agent
+}
+
 # ------------------------------------------------------------------------------
 # PUBLIC METHODS
 # ------------------------------------------------------------------------------
@@ -141,6 +168,13 @@ hook_server_start() {
     $SCRIPTS_DIR/piot2-start-server.sh $CONFIG_DIR/server.cfg
 }
 
+hook_client_agent_start() {
+    echo "Starting piot2 client agent"
+
+    # Replace shell so that systemd signals reach the agent
+    exec $SCRIPTS_DIR/piot2.py --action=client-agent --config=$CONFIG_DIR
+}
+
 config_create() {
     local mode=$1
     local path=$2
@@ -156,10 +190,21 @@ CONFIG_VERSION=\"$CONFIG_VERSION\"""" > $path
 SENSOR_ID=\"00000000000\"
 SENSOR_NAME=\"br5-bsmt-temp-heater-in\"
 SENSOR_TYPE=\"temperature\"
-SENSOR_RANDOM=\"--random\"""" >> $path
+SENSOR_RANDOM=\"--random\"
+SENSOR_SOURCE=\"ds18b20\"
+SENSOR_INTERVAL=\"60\"
+UPLOAD_INTERVAL=\"60\"
+UPLOAD_JITTER=\"10\"
+UPLOAD_RETRY=\"attempts:1\"
+BACKLOG_STORE=\"\"
+BACKLOG_SYNC=\"none\"
+BACKLOG_CAPS=\"entries:100000,age:604800\"
+BACKLOG_FILTER=\"\"
+BACKLOG_REORDER=\"\"""" >> $path
 
         # Common stuff
         echo """
+DB_SEAL_AGE=\"\"
 SERVER_ENABLED=\"false\"
 SERVER_PROTO=\"http\"
 SERVER_ADDR=\"localhost\"
@@ -219,6 +264,14 @@ status_show() {
         fi
     done
 
+    # Client agent
+    local unit="piot2-client-agent"
+    local state_active=$(_systemd_get_unit_status $unit "ActiveState")
+    local state_sub=$(_systemd_get_unit_status $unit "SubState")
+    json=$(echo $json | jq -Mc ".\"client-agent\".state = \"$state_active:$state_sub\"")
+    [ -f "$AGENT_STATUS" ] && \
+        json=$(echo $json | jq -Mc ".\"client-agent\".status = $(cat $AGENT_STATUS)")
+
     # Http server
     local unit="piot2-server.timer"
     local state_active=$(_systemd_get_unit_status $unit "ActiveState")
@@ -283,6 +336,11 @@ PIOT2 Controller:
     $0 --action=client-disable
     $0 --action=config-client-create --config=br5-bsmt-temp-heater-in
 
+  Client agent:
+    $0 --action=client-agent-enable
+    $0 --action=client-agent-disable
+    $0 --action=client-agent-reload
+
   Server:
     $0 --action=server-enable
     $0 --action=server-disable
@@ -313,6 +371,9 @@ main() {
         hook-server-start)
             hook_server_start
         ;;
+        hook-client-agent-start)
+            hook_client_agent_start
+        ;;
 
         # ----------------------------------------------------------------------
         # CONFIG
@@ -344,6 +405,18 @@ main() {
             status_show
         ;;
 
+        # ----------------------------------------------------------------------
+        # CLIENT AGENT
+        client-agent-enable)
+            _agent_enable
+        ;;
+        client-agent-disable)
+            _agent_disable
+        ;;
+        client-agent-reload)
+            _agent_reload
+        ;;
+
         # ----------------------------------------------------------------------
         # SERVICE UNIT STATUS
         client-enable|client-disable|server-enable|server-disable)
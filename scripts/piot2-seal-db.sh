@@ -0,0 +1,30 @@
+#!/bin/bash
+
+# Validate arguments
+if [ "$#" -ne 1 ] && [ "$#" -ne 2 ]; then
+    echo "Usage: $0 [CONFIG-PATH] [client|server]"
+    exit 42
+fi
+
+# Include common script
+PATH_SCRIPTS=`dirname "$(readlink -f "$0")"`
+PATH_PIOT="$PATH_SCRIPTS/piot2.py"
+source $PATH_SCRIPTS/piot2-common.sh "$1" "${2:-client}"
+
+# Main
+function main {
+    # Sealing is optional, configs without sensor have nothing to seal
+    [ -z "$DB_SEAL_AGE" ] && exit 0
+    [ -z "$SENSOR_NAME" ] && exit 0
+
+    # Pack old points of sensor into compressed chunks
+    prepare_action "Sealing DB :: name=$SENSOR_NAME age=$DB_SEAL_AGE"
+    out=`$PATH_PIOT --action=db-sensor-seal \
+                    --db-path=$PATH_DATA_DB \
+                    --auth-token=$SERVER_AUTH_TOKEN \
+                    --sensor-name=$SENSOR_NAME \
+                    --seal-age=$DB_SEAL_AGE \
+                    --format=shell`
+    process_action "$out" $?
+}
+main
@@ -21,6 +21,9 @@ function main {
                      --addr=$SERVER_ADDR \
                      --port=$SERVER_PORT \
                      --backlog-path=$PATH_DATA_BACKLOG \
+                     --backlog-store=$BACKLOG_STORE \
+                     --backlog-sync=${BACKLOG_SYNC:-none} \
+                     --backlog-reorder=$BACKLOG_REORDER \
                      --db-path=$PATH_DATA_DB"
     process_action "$out" $?
 }
@@ -17,16 +17,16 @@ function main {
     prepare_action "Reading backlog :: name=$SENSOR_NAME"
     out=`$PATH_PIOT --action=backlog-read \
                     --backlog-path=$PATH_DATA_BACKLOG \
-                    --sensor-name=$SENSOR_NAME`
+                    --backlog-store=$BACKLOG_STORE \
+                    --sensor-name=$SENSOR_NAME \
+                    --format=shell --fields=data,size,time-cur,time-first,time-last`
     process_action "$out" $?
-    backlog_data=$(json_read_key "$__piot_data" "data" "[]")
-    backlog_size=$(json_read_key "$__piot_data" "size" 0)
-    time_cur=$(json_read_key "$__piot_data" "time-cur" 0)
-    time_first=$(json_read_key "$__piot_data" "time-first" 0)
-    time_last=$(json_read_key "$__piot_data" "time-last" 0)
+    backlog_data=${__piot_out[data]:-[]}
+    time_cur=${__piot_out[time-cur]:-0}
+    time_first=${__piot_out[time-first]:-0}
+    time_last=${__piot_out[time-last]:-0}
     log_param "age-first" "$(($time_cur - $time_first))"
     log_param "age-last" "$(($time_cur - $time_last))"
-    log_param "backlog-size" "$backlog_size"
 
     # Write backlog to DB
     prepare_action "Writing DB :: name=$SENSOR_NAME"
@@ -34,18 +34,17 @@ function main {
                     --db-path=$PATH_DATA_DB \
                     --auth-token=$SERVER_AUTH_TOKEN \
                     --sensor-name=$SENSOR_NAME \
-                    --data=$backlog_data`
+                    --format=shell --fields=size,new-entries \
+                    --data="$backlog_data"`
     process_action "$out" $?
-    db_size=$(json_read_key "$__piot_data" "size" 0)
-    new_entries=$(json_read_key "$__piot_data" "new-entries" 0)
-    log_param "db-size" "$db_size"
-    log_param "new-entries" "$new_entries"
 
     # Clear backlog after successfully writing it to db
     prepare_action "Clearing local backlog :: name=$SENSOR_NAME"
     out=`$PATH_PIOT --action=backlog-clear \
                     --backlog-path=$PATH_DATA_BACKLOG \
-                    --sensor-name=$SENSOR_NAME`
+                    --backlog-store=$BACKLOG_STORE \
+                    --sensor-name=$SENSOR_NAME \
+                    --format=shell`
     process_action "$out" $?
 }
 main
@@ -16,25 +16,29 @@ function main {
     # Read sensor value
     prepare_action "Reading wttrin sensor :: id=$SENSOR_ID"
     out=`$PATH_PIOT --action=read-sensor-wttrin \
-                    --sensor-id=$SENSOR_ID`
+                    --sensor-id=$SENSOR_ID \
+                    --sensor-type=${SENSOR_TYPE:-temperature} \
+                    --format=shell`
     process_action "$out" $?
+    out_to_json
 
     # Write sensor value to backlog
     prepare_action "Writing backlog :: name=$SENSOR_NAME"
     out=`$PATH_PIOT --action=backlog-write \
                     --backlog-path=$PATH_DATA_BACKLOG \
+                    --backlog-store=$BACKLOG_STORE \
                     --sensor-name=$SENSOR_NAME \
-                    --data=[$__piot_data]`
+                    --backlog-sync=${BACKLOG_SYNC:-none} \
+                    --backlog-caps=$BACKLOG_CAPS \
+                    --backlog-filter=$BACKLOG_FILTER \
+                    --backlog-reorder=$BACKLOG_REORDER \
+                    --format=shell --fields=size,new-entries,time-cur,time-first,time-last,late-entries \
+                    --data=[$__piot_json]`
     process_action "$out" $?
-    backlog_data=$(json_read_key "$__piot_data" "data" "[]")
-    backlog_size=$(json_read_key "$__piot_data" "size" 0)
-    new_entries=$(json_read_key "$__piot_data" "new-entries" 0)
-    time_cur=$(json_read_key "$__piot_data" "time-cur" 0)
-    time_first=$(json_read_key "$__piot_data" "time-first" 0)
-    time_last=$(json_read_key "$__piot_data" "time-last" 0)
+    time_cur=${__piot_out[time-cur]:-0}
+    time_first=${__piot_out[time-first]:-0}
+    time_last=${__piot_out[time-last]:-0}
     log_param "age-first" "$(($time_cur - $time_first))"
     log_param "age-last" "$(($time_cur - $time_last))"
-    log_param "backlog-size" "$backlog_size"
-    log_param "new-entries" "$new_entries"
 }
 main
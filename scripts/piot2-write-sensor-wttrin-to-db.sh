@@ -16,8 +16,11 @@ function main {
     # Read sensor value
     prepare_action "Reading wttrin sensor :: id=$SENSOR_ID"
     out=`$PATH_PIOT --action=read-sensor-wttrin \
-                    --sensor-id=$SENSOR_ID`
+                    --sensor-id=$SENSOR_ID \
+                    --sensor-type=${SENSOR_TYPE:-temperature} \
+                    --format=shell`
     process_action "$out" $?
+    out_to_json
 
     # Write value to DB
     prepare_action "Writing DB :: name=$SENSOR_NAME"
@@ -25,11 +28,8 @@ function main {
                     --db-path=$PATH_DATA_DB \
                     --auth-token=$SERVER_AUTH_TOKEN \
                     --sensor-name=$SENSOR_NAME \
-                    --data=[$__piot_data]`
+                    --format=shell --fields=size,new-entries \
+                    --data=[$__piot_json]`
     process_action "$out" $?
-    db_size=$(json_read_key "$__piot_data" "size" 0)
-    new_entries=$(json_read_key "$__piot_data" "new-entries" 0)
-    log_param "db-size" "$db_size"
-    log_param "new-entries" "$new_entries"
 }
 main
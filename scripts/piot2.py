@@ -85,21 +85,141 @@ class Utils:
             pass
         return body
 
-    def WriteFile(path, body, clear_file):
+    def WriteFile(path, body, clear_file, sync=False):
+        mode = ("w" if clear_file else "a") + ("b" if isinstance(body, bytes) else "")
         try:
-            with open(path, "w" if clear_file else "a") as f:
+            with open(path, mode) as f:
                 f.write(body)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
         except:
             return False
         return True
 
+    def SyncFile(path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except:
+            return False
+        return True
+
+    def GetFileSize(path):
+        try:
+            return os.path.getsize(path)
+        except:
+            return 0
+
+    def ReplaceFile(path, body, sync=False):
+        # Write temporary file and atomically move it in place
+        path_tmp = path + ".tmp"
+        if not Utils.WriteFile(path_tmp, body, True, sync):
+            return False
+        try:
+            os.replace(path_tmp, path)
+        except:
+            return False
+        return True
+
+    def LockFile(path, timeout):
+        import fcntl
+
+        # Create lock file if missing
+        if not Utils.IsFilePresent(path):
+            Utils.WriteFile(path, "", True)
+
+        # Try lock until timeout expires
+        wait_stop = Utils.GetTimestamp() + timeout
+        while True:
+            lock = None
+            try:
+                lock = open(path, 'r')
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock
+            except:
+                if lock:
+                    lock.close()
+
+            # Stop trying if timeout is over
+            if Utils.GetTimestamp() > wait_stop:
+                return None
+
+            # Wait and try again later
+            time.sleep(0.1)
+
+    def GetFileTime(path):
+        try:
+            return os.stat(path).st_mtime
+        except:
+            return 0
+
+    def ReadConfig(path):
+        # Parse shell-style config, e.g. SENSOR_NAME="br5-bsmt-temp-heater-in"
+        cfg = OrderedDict()
+        for line in Utils.ReadFileLines(path):
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, _, value = line.partition("=")
+            cfg[key.strip()] = value.strip().strip('"')
+        return cfg
+
+    # Faster JSON codec (orjson) is used when available, stdlib otherwise
+    _json_fast = None
+
+    def GetJsonFast():
+        if Utils._json_fast == None:
+            try:
+                import orjson
+                Utils._json_fast = orjson
+            except ImportError:
+                Utils._json_fast = False
+        return Utils._json_fast
+
+    _numpy = None
+
+    def GetNumpy():
+        if Utils._numpy == None:
+            try:
+                import numpy
+                Utils._numpy = numpy
+            except ImportError:
+                Utils._numpy = False
+        return Utils._numpy
+
+    def JsonToBytes(json_obj):
+        fast = Utils.GetJsonFast()
+        if fast:
+            try:
+                return fast.dumps(json_obj, option=fast.OPT_NON_STR_KEYS)
+            except:
+                # E.g. integers over 64 bits, stdlib decides
+                pass
+        try:
+            return json.dumps(json_obj).encode("utf-8")
+        except:
+            return b"{}"
+
     def JsonToStr(json_obj, indent=None):
+        if indent == None:
+            return Utils.JsonToBytes(json_obj).decode("utf-8")
         try:
             return str(json.dumps(json_obj, indent=indent))
         except:
             return "{}"
 
     def StrToJson(str):
+        # Accepts both str & bytes, stdlib decides what fast codec rejects, e.g. NaN
+        fast = Utils.GetJsonFast()
+        if fast:
+            try:
+                return fast.loads(str)
+            except:
+                pass
         try:
             return json.loads(str)
         except:
@@ -239,11 +359,581 @@ class DataValidator:
             DataValidator.ValidateKeyType(d, "size", int)               \
         else None
 
+    def ValidateBacklogIndex(d):
+        if not d or not isinstance(d, dict) or \
+           not DataValidator.ValidateKeyType(d, "generation", int) or \
+           not DataValidator.ValidateKeyType(d, "streams", dict):
+            return None
+        for s in d["streams"].values():
+            if not DataValidator.ValidateCommon(s, 5) or \
+               not DataValidator.ValidateBacklogMeta(OrderedDict(
+                 [(k, s.get(k)) for k in ["time-first", "time-last", "size"]])) or \
+               not DataValidator.ValidateKeyType(s, "offset", int) or \
+               not DataValidator.ValidateKeyType(s, "bytes", int):
+                return None
+        return d
+
     def ValidateBacklogEntry(d):
         return d if d and isinstance(d, dict) and len(d) > 1 and        \
             DataValidator.ValidateKeyType(d, "time", int)               \
         else None
 
+    # Schemas of batches, i.e. lists of entries:
+    #   (types of keys, number of keys, whether number of keys is exact or minimal)
+    BATCH_SCHEMAS = {
+        "backlog-entry" : (OrderedDict({"time" : (int,)}), 2, False),
+        "value"         : (OrderedDict({"time" : (int,), "value" : (int, float)}), 2, True),
+    }
+    _batch_validators = {}
+
+    def CompileBatch(keys, length, exact):
+        # Returns validator of whole batch, that returns index of the first bad entry
+        # or None. Types are compared exactly, so e.g. bool is not accepted as int.
+        import operator
+
+        columns = [(operator.itemgetter(k), frozenset(t)) for k, t in keys.items()]
+        dict_types = frozenset([dict, OrderedDict])
+
+        def IsEntryValid(d):
+            return isinstance(d, dict) and \
+                   (len(d) == length if exact else len(d) >= length) and \
+                   all([k in d and type(d[k]) in t for k, t in keys.items()])
+
+        def Validate(batch):
+            # Whole columns are tested at once, entries are inspected one by one
+            # only to find the bad one
+            try:
+                if set(map(type, batch)) <= dict_types and \
+                  (set(map(len, batch)) <= {length} if exact else \
+                   min(map(len, batch), default=length) >= length) and \
+                  all([set(map(type, map(get, batch))) <= t for get, t in columns]):
+                    return None
+            except (KeyError, TypeError):
+                pass
+            for idx, d in enumerate(batch):
+                if not IsEntryValid(d):
+                    return idx
+            return None
+        return Validate
+
+    def ValidateBatch(schema, batch):
+        # Validators are compiled on first use, schema is either one of the above
+        # or a sensor type
+        validator = DataValidator._batch_validators.get(schema)
+        if not validator:
+            validator = DataValidator.CompileBatch(
+              *(DataValidator.BATCH_SCHEMAS.get(schema) or SensorType.GetSchema(schema)))
+            DataValidator._batch_validators[schema] = validator
+        return validator(batch)
+
+#---------------------------------------------------------------------------------------------------
+class SensorType:
+    # Registry of sensor types, each declares columns of its DB table, i.e. keys of
+    # its entries besides time, & their SQL types. Entries are validated by types
+    # of the columns, multi-value readings of one device are stored in one row.
+    TYPES = OrderedDict({
+        "temperature" : OrderedDict({"value" : "real"}),
+        "humidity"    : OrderedDict({"value" : "real"}),
+        "pressure"    : OrderedDict({"value" : "real"}),
+        "counter"     : OrderedDict({"value" : "integer"}),
+        "weather"     : OrderedDict({"temp" : "real", "humidity" : "real",
+                                     "pressure" : "real", "wind" : "real",
+                                     "precip" : "real"}),
+    })
+    SQL_TYPES = {"real" : (int, float), "integer" : (int,)}
+
+    def IsValid(name):
+        return name in SensorType.TYPES
+
+    def GetColumns(name):
+        return list(SensorType.TYPES[name].keys())
+
+    def GetScheme(name):
+        # Scheme of the DB table
+        return ", ".join(["time integer unique"] + \
+          [c + " " + t for c, t in SensorType.TYPES[name].items()])
+
+    def GetSchema(name):
+        # Schema of batch validator
+        keys = OrderedDict({"time" : (int,)})
+        for c, t in SensorType.TYPES[name].items():
+            keys[c] = SensorType.SQL_TYPES[t]
+        return keys, len(keys), True
+
+    def EntriesToRows(name, entries):
+        import operator
+
+        get = operator.itemgetter(*(["time"] + SensorType.GetColumns(name)))
+        return list(map(get, entries))
+
+    def RowsToEntries(name, rows):
+        keys = ["time"] + SensorType.GetColumns(name)
+        return [OrderedDict(zip(keys, row)) for row in rows]
+
+#---------------------------------------------------------------------------------------------------
+class DbLayout:
+    # Storage layouts of sensor points, layout of the sensor is kept in its options:
+    #  * table     - table per sensor, rowid b-tree plus unique index on time
+    #  * clustered - table per sensor stored in time order (WITHOUT ROWID), one b-tree
+    #  * points    - one table shared by single value sensors, keyed by sensor & time
+    LAYOUTS = ["table", "clustered", "points"]
+    DEFAULT = "table"
+    POINTS = "points"
+    # Value has no type affinity, so that integer & real values are kept as written
+    POINTS_SCHEME = "sensor integer, time integer, value, primary key (sensor, time)"
+
+    def IsValid(layout, sensor_type):
+        if layout == "points":
+            return SensorType.GetColumns(sensor_type) == ["value"]
+        return layout in DbLayout.LAYOUTS
+
+    def GetTable(layout, sensor_id):
+        return DbLayout.POINTS if layout == "points" else "sensor_" + str(sensor_id)
+
+    def GetCond(layout, sensor_id):
+        # Condition selecting points of the sensor
+        return "sensor=" + str(int(sensor_id)) if layout == "points" else "1"
+
+    def GetScheme(layout, sensor_type):
+        if layout == "points":
+            return DbLayout.POINTS_SCHEME
+        if layout == "clustered":
+            return SensorType.GetScheme(sensor_type).replace("unique", "primary key", 1)
+        return SensorType.GetScheme(sensor_type)
+
+    def CreateTable(db, layout, sensor_type, table):
+        # Shared table is created by first sensor that uses it
+        return db.CreateTable(table, DbLayout.GetScheme(layout, sensor_type),
+                              layout == "points", layout != "table")
+
+    def GetRows(layout, sensor_id, rows):
+        # Rows of shared table start with id of the sensor
+        if layout == "points":
+            return [(sensor_id,) + row for row in rows]
+        return rows
+
+#---------------------------------------------------------------------------------------------------
+class BacklogSync:
+    # Durability policy of backlog files:
+    #   none        - never fsync, flushing is left to the kernel
+    #   always      - fsync data & meta on every write
+    #   interval:N  - fsync at most once per N milliseconds
+    #   entries:N   - fsync once per N written entries
+    DEFAULT = "none"
+
+    # Group commit state of long-running processes
+    _mutex = None
+    _dirty = set()
+    _flusher = None
+    _sync_on_exit = False
+
+    def Parse(policy):
+        mode, _, value = str(policy).partition(":")
+        if mode in ("none", "always") and not value:
+            return mode, 0
+        if mode in ("interval", "entries"):
+            value = Utils.StrToInt(value)
+            if value > 0:
+                return mode, value
+        return None
+
+    def __init__(self, policy):
+        self._mode, self._value = \
+            BacklogSync.Parse(policy) or BacklogSync.Parse(BacklogSync.DEFAULT)
+
+    def IsSyncNeeded(self, paths, size_prev, size_cur, time_prev):
+        mode = self._mode
+        value = self._value
+
+        # Sync on every write
+        if mode == "always":
+            return True
+
+        # Sync when size crosses the next multiple of N
+        if mode == "entries":
+            return size_prev // value != size_cur // value
+
+        if mode == "interval":
+            # Let the flusher coalesce writes of all backlogs into one flush
+            if BacklogSync._flusher:
+                with BacklogSync._mutex:
+                    BacklogSync._dirty.update(paths)
+                return False
+
+            # Sync when the write is the first one in the current interval, following
+            # ones are synced once the process exits, e.g. after one-shot CLI write
+            time_cur = int(Utils.GetTimestamp() * 1000) // value
+            if time_cur != int(time_prev * 1000) // value:
+                return True
+            BacklogSync.SyncOnExit(paths)
+        return False
+
+    def SyncOnExit(paths):
+        import threading
+        import atexit
+
+        if not BacklogSync._mutex:
+            BacklogSync._mutex = threading.Lock()
+        with BacklogSync._mutex:
+            BacklogSync._dirty.update(paths)
+            if not BacklogSync._sync_on_exit:
+                BacklogSync._sync_on_exit = True
+                atexit.register(BacklogSync.Flush)
+
+    def StartFlusher(interval):
+        import threading
+        import atexit
+
+        if BacklogSync._flusher:
+            return
+        BacklogSync._mutex = BacklogSync._mutex or threading.Lock()
+
+        def cb():
+            while True:
+                time.sleep(interval / 1000)
+                BacklogSync.Flush()
+
+        BacklogSync._flusher = threading.Thread(target=cb, daemon=True)
+        BacklogSync._flusher.start()
+        atexit.register(BacklogSync.Flush)
+
+    def Flush():
+        # Swap dirty set so that writers are not blocked by fsync
+        with BacklogSync._mutex:
+            dirty = BacklogSync._dirty
+            BacklogSync._dirty = set()
+
+        for path in dirty:
+            if not Utils.SyncFile(path):
+                log.Err("Failed to sync backlog :: path=" + path)
+        return len(dirty)
+
+#---------------------------------------------------------------------------------------------------
+class BacklogCaps:
+    # Size limits of the backlog, comma-separated list of:
+    #   entries:N   - max number of entries
+    #   bytes:N     - max size of the data file
+    #   age:N       - max age in seconds of full-resolution entries
+    DEFAULT = ""
+    KEYS = ["entries", "bytes", "age"]
+
+    # Entries older than max age are averaged into buckets of this width
+    AGE_BUCKET = 3600
+
+    # Size caps compact the backlog down to this fraction of the limit
+    COMPACT_RATIO = 0.75
+
+    def Parse(caps):
+        d = OrderedDict([(k, 0) for k in BacklogCaps.KEYS])
+        for cap in filter(None, str(caps).split(",")):
+            key, _, value = cap.partition(":")
+            value = Utils.StrToInt(value)
+            if key not in d or value <= 0:
+                return None
+            d[key] = value
+        return d
+
+    def __init__(self, caps):
+        self._caps = BacklogCaps.Parse(caps) or BacklogCaps.Parse(BacklogCaps.DEFAULT)
+
+    def GetEntriesLimit(self, size, size_bytes):
+        # Convert byte limit to entries limit using average size of the entry
+        limit = self._caps["entries"]
+        max_bytes = self._caps["bytes"]
+        if max_bytes and size and size_bytes > max_bytes:
+            limit_bytes = max(1, int(max_bytes * size / size_bytes))
+            limit = min(limit, limit_bytes) if limit else limit_bytes
+        return limit
+
+    def GetAgeCut(self, time_cur, time_prev):
+        # Entries older than cut are compacted once per bucket
+        age = self._caps["age"]
+        if not age:
+            return 0
+        cut = (time_cur - age) // BacklogCaps.AGE_BUCKET
+        if cut == int(time_prev - age) // BacklogCaps.AGE_BUCKET:
+            return 0
+        return cut * BacklogCaps.AGE_BUCKET
+
+    def Average(entries, time):
+        # Average numeric values, keep last value of everything else
+        entry = OrderedDict()
+        for key, value in entries[-1].items():
+            if key == "time":
+                value = time
+            elif len(entries) > 1 and isinstance(value, (int, float)) \
+              and not isinstance(value, bool):
+                values = [e.get(key) for e in entries]
+                if all(isinstance(v, (int, float)) for v in values):
+                    value = sum(values) / len(values)
+            entry[key] = value
+        return entry
+
+    def Compact(self, entries, size_bytes, time_cur, time_prev):
+        size = len(entries)
+
+        # Average entries older than max age into buckets
+        cut = self.GetAgeCut(time_cur, time_prev)
+        if cut:
+            old = []
+            idx = 0
+            while idx < len(entries) and entries[idx]["time"] < cut:
+                bucket = entries[idx]["time"] // BacklogCaps.AGE_BUCKET
+                end = idx
+                while end < len(entries) and entries[end]["time"] < cut and \
+                  entries[end]["time"] // BacklogCaps.AGE_BUCKET == bucket:
+                    end += 1
+                old.append(BacklogCaps.Average(entries[idx:end],
+                  bucket * BacklogCaps.AGE_BUCKET))
+                idx = end
+            entries = old + entries[idx:]
+
+        # Halve resolution of the older half until backlog fits into the limit
+        limit = self.GetEntriesLimit(size, size_bytes)
+        if limit and len(entries) > limit:
+            limit = max(1, int(limit * BacklogCaps.COMPACT_RATIO))
+            while len(entries) > limit:
+                half = len(entries) // 2
+                if half < 2:
+                    break
+                old = [BacklogCaps.Average(entries[i:min(i + 2, half)], entries[i]["time"])
+                    for i in range(0, half, 2)]
+                entries = old + entries[half:]
+        return entries
+
+    def IsExceeded(self, size, size_bytes, time_cur, time_prev):
+        caps = self._caps
+        return (caps["entries"] and size > caps["entries"]) or \
+               (caps["bytes"] and size_bytes > caps["bytes"]) or \
+               (self.GetAgeCut(time_cur, time_prev) != 0)
+
+#---------------------------------------------------------------------------------------------------
+class BacklogFilter:
+    # Change-based compression of sensor values, comma-separated list of:
+    #   deadband:T       - keep entry when value departs from the last kept one by more
+    #                      than T, values in between are reconstructed as steps
+    #   swinging-door:T  - keep entry when value departs from the line between kept entries
+    #                      by more than T, values in between are reconstructed linearly
+    #   heartbeat:N      - always keep entry N seconds after the last kept one, filters
+    #                      without it keep one every HEARTBEAT seconds, so that steady
+    #                      sensor is not mistaken for offline one
+    DEFAULT = ""
+    MODES = ["deadband", "swinging-door"]
+    HEARTBEAT = 3600
+    STATE_EXTENSION = ".piot2.filter"
+
+    def Parse(policy):
+        d = OrderedDict({"mode" : "none", "tolerance" : 0, "heartbeat" : 0})
+        for item in filter(None, str(policy).split(",")):
+            key, _, value = item.partition(":")
+            if key in BacklogFilter.MODES and d["mode"] == "none":
+                try:
+                    value = float(value)
+                except:
+                    return None
+                if value < 0:
+                    return None
+                d["mode"] = key
+                d["tolerance"] = value
+            elif key == "heartbeat" and Utils.StrToInt(value) > 0:
+                d["heartbeat"] = Utils.StrToInt(value)
+            else:
+                return None
+        if d["mode"] != "none" and not d["heartbeat"]:
+            d["heartbeat"] = BacklogFilter.HEARTBEAT
+        return d
+
+    def GetReconstruction(policy):
+        # How values between kept entries are restored
+        d = BacklogFilter.Parse(policy) or BacklogFilter.Parse(BacklogFilter.DEFAULT)
+        return "linear" if d["mode"] == "swinging-door" else "step"
+
+    def __init__(self, policy, path):
+        self._policy = BacklogFilter.Parse(policy) or BacklogFilter.Parse(BacklogFilter.DEFAULT)
+        self._path = path
+        self._state = None
+
+    def IsEnabled(self):
+        return self._policy["mode"] != "none"
+
+    def LoadState(self):
+        # State of other policy is not reusable
+        state = Utils.StrToJson(Utils.ReadFile(self._path) or "")
+        if not isinstance(state, dict) or state.get("policy") != self._policy:
+            state = OrderedDict({"policy" : self._policy})
+        return state
+
+    def Apply(self, entries):
+        # Returns entries to keep, new state is saved by Commit() once they are written
+        state = self.LoadState()
+        kept = []
+        for entry in entries:
+            value = entry.get("value") if isinstance(entry, dict) else None
+            time_last = state.get("time-last", 0)
+
+            # Pass through whatever can not be filtered, backlog rejects bad entries
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or \
+              not isinstance(entry.get("time"), int) or entry["time"] <= time_last:
+                kept.append(entry)
+                continue
+
+            if self._policy["mode"] == "deadband":
+                kept += self.PushDeadband(state, entry)
+            else:
+                kept += self.PushSwingingDoor(state, entry)
+            state["time-last"] = entry["time"]
+        self._state = state
+        return kept
+
+    def PushDeadband(self, state, entry):
+        tolerance = self._policy["tolerance"]
+        heartbeat = self._policy["heartbeat"]
+        time, value = entry["time"], entry["value"]
+        kept = state.get("kept")
+        if not kept or abs(value - kept[1]) > tolerance or \
+          (heartbeat and time - kept[0] >= heartbeat):
+            state["kept"] = [time, value]
+            return [entry]
+        return []
+
+    def PushSwingingDoor(self, state, entry):
+        tolerance = self._policy["tolerance"]
+        heartbeat = self._policy["heartbeat"]
+        time, value = entry["time"], entry["value"]
+
+        # First entry opens the doors
+        pivot = state.get("pivot")
+        if not pivot:
+            state.update({"pivot" : [time, value], "last" : None,
+                          "upper" : None, "lower" : None})
+            return [entry]
+
+        # Narrow the corridor of slopes that keep all skipped entries within tolerance
+        dt = time - pivot[0]
+        upper = (value + tolerance - pivot[1]) / dt
+        lower = (value - tolerance - pivot[1]) / dt
+        if state["upper"] != None:
+            upper = min(upper, state["upper"])
+            lower = max(lower, state["lower"])
+
+        # Doors closed, previous entry is kept & becomes new pivot
+        kept = []
+        if lower > upper:
+            last = state["last"]
+            kept.append(last)
+            pivot = [last["time"], last["value"]]
+            dt = time - pivot[0]
+            upper = (value + tolerance - pivot[1]) / dt
+            lower = (value - tolerance - pivot[1]) / dt
+
+        # Heartbeat keeps current entry, which restarts the doors
+        if heartbeat and time - pivot[0] >= heartbeat:
+            kept.append(entry)
+            state.update({"pivot" : [time, value], "last" : None,
+                          "upper" : None, "lower" : None})
+        else:
+            state.update({"pivot" : pivot, "last" : entry, "upper" : upper, "lower" : lower})
+        return kept
+
+    def Commit(self):
+        if self._state != None and not Utils.ReplaceFile(self._path, Utils.JsonToStr(self._state)):
+            return False
+        self._state = None
+        return True
+
+#---------------------------------------------------------------------------------------------------
+class BacklogReorder:
+    # Tolerance of entries arriving out of order, e.g. after clock is corrected by NTP:
+    #   window:N  - entries are held back until they are N seconds older than the newest
+    #               one & then written sorted by time, entries older than what was written
+    #               already are appended to side file instead of failing the whole batch
+    DEFAULT = ""
+    STATE_EXTENSION = ".piot2.reorder"
+    LATE_EXTENSION = ".piot2.late"
+
+    def Parse(policy):
+        d = OrderedDict({"window" : 0})
+        for item in filter(None, str(policy).split(",")):
+            key, _, value = item.partition(":")
+            if key != "window" or Utils.StrToInt(value) <= 0:
+                return None
+            d["window"] = Utils.StrToInt(value)
+        return d
+
+    def __init__(self, policy, path):
+        self._policy = BacklogReorder.Parse(policy) or \
+                       BacklogReorder.Parse(BacklogReorder.DEFAULT)
+        self._state_path = path + BacklogReorder.STATE_EXTENSION
+        self._late_path = path + BacklogReorder.LATE_EXTENSION
+        self._state = None
+        self._late = []
+        self._buffer_size = 0
+
+    def IsEnabled(self):
+        return self._policy["window"] > 0
+
+    def LoadState(self):
+        state = Utils.StrToJson(Utils.ReadFile(self._state_path) or "")
+        if not isinstance(state, dict) or not isinstance(state.get("buffer"), list):
+            state = OrderedDict({"time-flushed" : 0, "buffer" : []})
+        return state
+
+    def Apply(self, entries, time_last):
+        # Returns entries to write, new state & late entries are saved by Commit()
+        # once they are written
+        state = self.LoadState()
+        time_flushed = max(state["time-flushed"], time_last)
+        buffer = state["buffer"]
+        buffered = dict([(entry["time"], entry) for entry in buffer])
+        passed = []
+        late = []
+        for entry in entries:
+            time = entry.get("time") if isinstance(entry, dict) else None
+
+            # Pass through whatever can not be ordered, backlog rejects bad entries
+            if type(time) is not int:
+                passed.append(entry)
+
+            # Entries held already are sent again by uploads, as they are above watermark
+            elif buffered.get(time) == entry:
+                continue
+            elif time <= time_flushed or time in buffered:
+                late.append(entry)
+            else:
+                buffer.append(entry)
+                buffered[time] = entry
+
+        # Entries that left the window are written in time order
+        buffer.sort(key=lambda entry: entry["time"])
+        horizon = buffer[-1]["time"] - self._policy["window"] if buffer else 0
+        size = 0
+        while size < len(buffer) and buffer[size]["time"] <= horizon:
+            size += 1
+        if size:
+            state["time-flushed"] = buffer[size - 1]["time"]
+        state["buffer"] = buffer[size:]
+        self._state = state
+        self._late = late
+        self._buffer_size = len(state["buffer"])
+        return passed + buffer[:size]
+
+    def GetBufferSize(self):
+        return self._buffer_size
+
+    def GetLateSize(self):
+        return len(self._late)
+
+    def Commit(self):
+        # Late entries are only appended, they are never read back by backlog
+        if self._late and not Utils.WriteFile(self._late_path,
+          "".join([Utils.JsonToStr(entry) + "\n" for entry in self._late]), False):
+            return False
+        if self._state != None and \
+          not Utils.ReplaceFile(self._state_path, Utils.JsonToStr(self._state)):
+            return False
+        self._state = None
+        return True
+
 #---------------------------------------------------------------------------------------------------
 class Backlog(LogTab):
     DATA_EXTENSION = ".piot2"
@@ -251,14 +941,18 @@ class Backlog(LogTab):
     LOCK_EXTENSION = ".piot2.lock"
     LOCK_TIMEOUT = 5
 
-    def __init__(self, dir, name):
+    def __init__(self, dir, name, sync=BacklogSync.DEFAULT, caps=BacklogCaps.DEFAULT):
         super(Backlog, self).__init__()
         self._dir = dir
         self._name = name
         self._lock = None
-        self._data_path = self._dir + "/" + name + Backlog.DATA_EXTENSION
-        self._meta_path = self._dir + "/" + name + Backlog.META_EXTENSION
-        self._lock_path = self._dir + "/" + name + Backlog.LOCK_EXTENSION
+        self._sync = BacklogSync(sync)
+        self._caps = BacklogCaps(caps)
+        self._compacted = 0
+        self._err = None
+        self._data_path = self._dir + "/" + name + self.DATA_EXTENSION
+        self._meta_path = self._dir + "/" + name + self.META_EXTENSION
+        self._lock_path = self._dir + "/" + name + self.LOCK_EXTENSION
 
         # Validate data & meta
         data_exists = Utils.IsFilePresent(self._data_path)
@@ -284,6 +978,36 @@ class Backlog(LogTab):
         if Utils.IsFilePresent(self._meta_path):
             self._meta = self.ReadMeta()
 
+    def ValidateEntries(self, data):
+        import operator
+
+        err = None
+        time_first = time_last = 0
+        if self._meta:
+            time_first = self._meta["time-first"]
+            time_last = self._meta["time-last"]
+
+        while True:
+            # Validate all data entries at once
+            idx = DataValidator.ValidateBatch("backlog-entry", data)
+            if idx != None:
+                err = "entry not valid :: index=" + str(idx); break
+            if not data:
+                break
+
+            # Make sure that time always increases
+            times = [entry["time"] for entry in data]
+            times_prev = [time_last] + times[:-1]
+            if not all(map(operator.lt, times_prev, times)):
+                idx = next(i for i, t in enumerate(times) if t <= times_prev[i])
+                err = "time does not increase :: index=" + str(idx) + \
+                                              " time=" + str(times[idx]) + \
+                                              " time_last=" + str(times_prev[idx]); break
+            time_first = time_first or times[0]
+            time_last = times[-1]
+            break # while
+        return err, time_first, time_last
+
     def Write(self, data):
         path = self._data_path
         err = None
@@ -296,58 +1020,110 @@ class Backlog(LogTab):
                 err = "data is not a list"; break
 
             # Get backlog config
-            time_first = time_last = backlog_size = 0
-            if self._meta:
-                time_first = self._meta["time-first"]
-                time_last = self._meta["time-last"]
-                backlog_size = self._meta["size"]
+            backlog_size = self._meta["size"] if self._meta else 0
 
             # Parse all data entries
-            data_str = None
-            for entry in data:
-                if not DataValidator.ValidateBacklogEntry(entry):
-                    err = "entry not valid"; break
-
-                # MAke sure that time always increases
-                time = entry["time"]
-                if time <= time_last:
-                    err = "time does not increase :: time=" + str(time) + \
-                                                   " time_last=" + str(time_last); break
-                time_last = time
-
-                if time_first == 0:
-                    time_first = time
-
-                # Convert entry to string
-                if not data_str:
-                    data_str = "  " if not Utils.IsFilePresent(path) \
-                                        or Utils.IsFileEmpty(path) else ", "
-                else:
-                    data_str += ", "
-                data_str += Utils.JsonToStr(entry) + "\n"
+            err, time_first, time_last = self.ValidateEntries(data)
             if err: break
 
+            # Convert entries to string
+            data_str = self.EntriesToStr(data, self.IsDataEmpty())
+
+            # Decide whether this write must be flushed to the storage
+            time_prev = self.GetMetaTime()
+            sync = self._sync.IsSyncNeeded(self.GetSyncPaths(),
+              backlog_size, backlog_size + len(data), time_prev)
+
             # Write data
-            if not Utils.WriteFile(path, data_str, False):
+            if not self.WriteData(data_str, False, sync):
                 err = "write error"; break
 
             # Update meta
             self._meta = self.UpdateMeta(time_first, time_last,
-              backlog_size + len(data))
+              backlog_size + len(data), sync)
+
+            # Compact old entries if backlog grew over its caps
+            if not self.ApplyCaps(time_prev, sync):
+                err = "compact error"; break
 
             break # while
         if err:
             self.LogErr("Failed to write backlog :: " + err + " :: path=" + path)
+        self._err = err
         return not err, \
                len(data) if (data and isinstance(data, list)) else 0
 
+    def EntriesToStr(self, entries, first):
+        # One record per line, lines are joined at once instead of appended one by one
+        if not entries:
+            return ""
+        return ("  " if first else ", ") + \
+               "\n, ".join([Utils.JsonToStr(entry) for entry in entries]) + "\n"
+
+    def IsDataEmpty(self):
+        path = self._data_path
+        return not Utils.IsFilePresent(path) or Utils.IsFileEmpty(path)
+
+    def WriteData(self, data_str, clear, sync):
+        return Utils.WriteFile(self._data_path, data_str, clear, sync)
+
+    def ReadData(self):
+        return Utils.ReadFile(self._data_path)
+
+    def GetDataSize(self):
+        return os.path.getsize(self._data_path)
+
+    def GetMetaTime(self):
+        return Utils.GetFileTime(self._meta_path)
+
+    def GetSyncPaths(self):
+        return [self._data_path, self._meta_path]
+
+    def ApplyCaps(self, time_prev, sync):
+        err = None
+        path = self._data_path
+        while True:
+            if not self._meta:
+                break
+
+            # Test caps
+            size = self._meta["size"]
+            size_bytes = self.GetDataSize()
+            time_cur = Utils.GetUnixTimestamp()
+            if not self._caps.IsExceeded(size, size_bytes, time_cur, time_prev):
+                break
+
+            # Read full backlog
+            data = self.Read()
+            if not data:
+                err = "read error"; break
+
+            # Nothing to do when compacting does not reduce size
+            data = self._caps.Compact(data, size_bytes, time_cur, time_prev)
+            if len(data) == size:
+                break
+
+            # Overwrite backlog with compacted entries
+            if not self.WriteData(self.EntriesToStr(data, True), True, sync):
+                err = "write error"; break
+
+            # Update meta
+            self._compacted += size - len(data)
+            self._meta = self.UpdateMeta(data[0]["time"], data[-1]["time"], len(data), sync)
+            self.LogInf("Compacted backlog :: size=" + str(size) + \
+                                           " size-new=" + str(len(data)))
+            break # while
+        if err:
+            self.LogErr("Failed to compact backlog :: " + err + " :: path=" + path)
+        return not err
+
     def Read(self):
         data_json = None
         path = self._data_path
         err = None
         while True:
             # Read data as sting
-            data = Utils.ReadFile(path)
+            data = self.ReadData()
             if not data:
                 data = ""
 
@@ -361,76 +1137,188 @@ class Backlog(LogTab):
             self.LogErr("Failed to read backlog :: " + err + " :: path=" + path)
         return data_json
 
+    def GetLineTime(mm, start, end):
+        # Parse time of the record without decoding the whole line,
+        # records may be encoded with or without spaces
+        pos = mm.find(b'"time":', start, end)
+        if pos < 0:
+            return None
+        pos += 7
+        while pos < end and mm[pos:pos + 1] == b" ":
+            pos += 1
+        pos_end = pos
+        while pos_end < end and mm[pos_end] in b"-0123456789":
+            pos_end += 1
+        return Utils.StrToInt(mm[pos:pos_end])
+
+    def FindTime(self, mm, time):
+        # Binary search for the first line with time >= given time
+        def line_start(pos):
+            return 0 if pos == 0 else mm.find(b"\n", pos - 1) + 1 or len(mm)
+
+        # Time of the first complete line with time from given position, lines without
+        # time are skipped, unterminated tail, e.g. truncated by crash, is past any time
+        def line_time(start):
+            while True:
+                end = mm.find(b"\n", start)
+                if end < 0:
+                    return None
+                t = Backlog.GetLineTime(mm, start, end)
+                if t != None:
+                    return t
+                start = end + 1
+
+        lo = 0
+        hi = len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = line_start(mid)
+            t = line_time(start) if start < len(mm) else None
+            if t == None or t >= time:
+                hi = mid
+            else:
+                lo = mid + 1
+        return line_start(lo)
+
+    def ReadRange(self, time_from, time_to):
+        import mmap
+
+        data_json = None
+        path = self._data_path
+        err = None
+        while True:
+            # Empty backlog
+            if self.IsDataEmpty():
+                data_json = []; break
+
+            # Map data file instead of reading it
+            try:
+                with open(path, "rb") as f, \
+                     mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Records are sorted by time, so range is found by bisecting,
+                    # unterminated tail is left out
+                    start = self.FindTime(mm, time_from) if time_from else 0
+                    end = self.FindTime(mm, time_to + 1) if time_to else mm.rfind(b"\n") + 1
+
+                    # Strip leading separator of the first record & decode range only
+                    body = mm[start + 2:end] if end > start else b""
+            except:
+                err = "mmap error"; break
+
+            # Convert data to json
+            data_json = Utils.StrToJson(b"[" + body + b"]")
+            if data_json == None:
+                err = "json parsing failed"; break
+
+            break # while
+        if err:
+            self.LogErr("Failed to read backlog range :: " + err + " :: path=" + path)
+        return data_json
+
+    def ReadChunks(self, size, time_from=0):
+        import mmap
+
+        # Yield raw JSON arrays of up to given number of records together with time of
+        # the last record, only one chunk is held in memory at a time
+        if self.IsDataEmpty():
+            return
+        with open(self._data_path, "rb") as f, \
+             mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = pos = self.FindTime(mm, time_from) if time_from else 0
+            count = 0
+            while pos < len(mm):
+                end = mm.find(b"\n", pos)
+                end = len(mm) if end < 0 else end + 1
+                count += 1
+                if count == size or end == len(mm):
+                    # Strip leading separator of the first record
+                    yield b"[" + mm[start + 2:end] + b"]", count, \
+                          Backlog.GetLineTime(mm, pos, end)
+                    start = end
+                    count = 0
+                pos = end
+
     def Clear(self):
         path = self._data_path
         err = None
         while True:
             # Overwrite backlog
-            if not Utils.WriteFile(path, "", True):
+            sync = self._sync.IsSyncNeeded(self.GetSyncPaths(),
+              0, 0, self.GetMetaTime())
+            if not self.WriteData("", True, sync):
                 err = "write failed"; break
     
-            # Update meta
-            self._meta = self.UpdateMeta(0, 0, 0)
+            # Update meta, time of the last entry is kept so that entries
+            # resent after a lost acknowledgement are still rejected
+            time_last = self._meta["time-last"] if self._meta else 0
+            self._meta = self.UpdateMeta(0, time_last, 0, sync)
 
             break # while
         if err:
             self.LogErr("Faild to clear backlog :: err=" + err + " path=" + path)
         return not err
 
-    def Lock(self, timeout=LOCK_TIMEOUT):
-        import fcntl
-
-        # Create lock file if missing
-        path = self._lock_path
-        if not Utils.IsFilePresent(path):
-            Utils.WriteFile(path, "", True)
-
-        # Try lock until timeout expires
-        wait_start = Utils.GetUnixTimestamp()
-        wait_stop = wait_start + timeout
-        try_num = 0
+    def Trim(self, time):
+        # Drop entries up to given time, e.g. after server acknowledged them
+        path = self._data_path
         err = None
         while True:
-            # Try lock
-            try:
-                try_num += 1
-                self._lock = open(path, 'r')
-                fcntl.flock(self._lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-
-                if try_num > 0:
-                    self.LogDbg("Locking backlog ::" +
-                        " lock-path=" + path +
-                        " try-num=" + str(try_num) +
-                        " wait-time=" + str(Utils.GetUnixTimestamp() - wait_start)) 
-                # Success
+            if not self._meta or not self._meta["size"] or time < self._meta["time-first"]:
                 break
-            except:
-                pass
 
-            # Stop trying if timeout is over
-            if Utils.GetUnixTimestamp() > wait_stop:
-                self.Unlock()
-                err = "failed to acquire lock"; break
+            # Nothing left
+            if time >= self._meta["time-last"]:
+                if not self.Clear():
+                    err = "clear error"
+                break
 
-            # Wait and try again later
-            time.sleep(0.1)
+            # Read remaining entries
+            data = self.ReadRange(time + 1, 0)
+            if not data:
+                err = "read error"; break
 
+            # Overwrite backlog with remaining entries
+            sync = self._sync.IsSyncNeeded(self.GetSyncPaths(),
+              0, 0, self.GetMetaTime())
+            if not self.WriteData(self.EntriesToStr(data, True), True, sync):
+                err = "write error"; break
+
+            # Update meta
+            self._meta = self.UpdateMeta(data[0]["time"], data[-1]["time"], len(data), sync)
+            break # while
         if err:
-            self.LogErr("Lock error :: " + err + " :: lock-path=" + path)
+            self.LogErr("Failed to trim backlog :: err=" + err + " path=" + path)
         return not err
 
+    def SetPolicy(self, sync, caps):
+        self._sync = BacklogSync(sync)
+        self._caps = BacklogCaps(caps)
+
+    def Lock(self, timeout=LOCK_TIMEOUT):
+        path = self._lock_path
+        wait_start = Utils.GetUnixTimestamp()
+        self._lock = Utils.LockFile(path, timeout)
+        if not self._lock:
+            self.LogErr("Lock error :: failed to acquire lock :: lock-path=" + path)
+            return False
+
+        self.LogDbg("Locking backlog ::" +
+            " lock-path=" + path +
+            " wait-time=" + str(Utils.GetUnixTimestamp() - wait_start)) 
+        return True
+
     def Unlock(self):
         if self._lock:
             self.LogDbg("Unlocking backlog :: lock-path=" + self._lock_path)
             self._lock.close()
             self._lock = None
 
-    def WriteMeta(self, time_first, time_last, size):
+    def WriteMeta(self, time_first, time_last, size, sync=False):
         data = OrderedDict({            \
             "time-first" : time_first,
             "time-last"  : time_last,
             "size"       : size})
-        Utils.WriteFile(self._meta_path, Utils.JsonToStr(data), True)
+        Utils.WriteFile(self._meta_path, Utils.JsonToStr(data), True, sync)
 
     def ReadMeta(self):
         data = None
@@ -460,21 +1348,488 @@ class Backlog(LogTab):
             data = None
         return data
 
-    def UpdateMeta(self, time_first, time_last, size):
-        self.WriteMeta(time_first, time_last, size)
+    def UpdateMeta(self, time_first, time_last, size, sync=False):
+        self.WriteMeta(time_first, time_last, size, sync)
         return self.ReadMeta()
 
     def GetStatus(self):
-        status = None
-        if self._meta:
-            return OrderedDict({"size" : self._meta["size"],
-                                "time-cur" : Utils.GetUnixTimestamp(),
-                                "time-first" : self._meta["time-first"],
-                                "time-last" : self._meta["time-last"]})
-        return status
+        # Backlog that was never written is empty
+        meta = self._meta or OrderedDict({"time-first" : 0, "time-last" : 0, "size" : 0})
+        return OrderedDict({"size" : meta["size"],
+                            "time-cur" : Utils.GetUnixTimestamp(),
+                            "time-first" : meta["time-first"],
+                            "time-last" : meta["time-last"]})
+
+#---------------------------------------------------------------------------------------------------
+class BacklogBinary(Backlog):
+    # Entries are packed as little-endian int64 time & float64 value
+    DATA_EXTENSION = ".piot2b"
+    META_EXTENSION = ".piot2b.meta"
+    LOCK_EXTENSION = ".piot2b.lock"
+    RECORD_FORMAT = "<qd"
+    RECORD_SIZE = 16
+
+    def ValidateEntries(self, data):
+        # Only entries of known layout can be packed
+        idx = DataValidator.ValidateBatch("value", data)
+        if idx != None:
+            return "entry not valid for binary format :: index=" + str(idx), 0, 0
+        return Backlog.ValidateEntries(self, data)
+
+    def EntriesToStr(self, entries, first):
+        import struct
+
+        values = []
+        for entry in entries:
+            values.append(entry["time"])
+            values.append(float(entry["value"]))
+        return struct.pack("<" + "qd" * len(entries), *values)
+
+    def ReadData(self):
+        try:
+            with open(self._data_path, "rb") as f:
+                return f.read()
+        except:
+            return None
+
+    def DecodeArrays(body):
+        from array import array
+
+        # Ignore partially written record at the end
+        body = body[:len(body) - len(body) % BacklogBinary.RECORD_SIZE]
+
+        # Decode all records at once, time & value are interleaved
+        times = array("q")
+        times.frombytes(body)
+        values = array("d")
+        values.frombytes(body)
+        if sys.byteorder == "big":
+            times.byteswap()
+            values.byteswap()
+        return times[0::2], values[1::2]
+
+    def ArraysToEntries(times, values):
+        return [OrderedDict((("time", t), ("value", v))) for t, v in zip(times, values)]
+
+    def FindRecord(mm, time):
+        import struct
+
+        # Bisect fixed-size records for the first one with time >= given time
+        lo = 0
+        hi = len(mm) // BacklogBinary.RECORD_SIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from("<q", mm, mid * BacklogBinary.RECORD_SIZE)[0] >= time:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo * BacklogBinary.RECORD_SIZE
+
+    def ReadArrays(self, time_from=0, time_to=0):
+        import mmap
+
+        arrays = None
+        path = self._data_path
+        err = None
+        while True:
+            # Empty backlog
+            if self.IsDataEmpty():
+                arrays = BacklogBinary.DecodeArrays(b""); break
+
+            try:
+                with open(path, "rb") as f, \
+                     mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    start = BacklogBinary.FindRecord(mm, time_from) if time_from else 0
+                    end = BacklogBinary.FindRecord(mm, time_to + 1) if time_to else len(mm)
+                    arrays = BacklogBinary.DecodeArrays(mm[start:end])
+            except:
+                err = "mmap error"; break
+
+            break # while
+        if err:
+            self.LogErr("Failed to read backlog arrays :: " + err + " :: path=" + path)
+        return arrays
+
+    def Read(self):
+        arrays = self.ReadArrays()
+        return BacklogBinary.ArraysToEntries(*arrays) if arrays else None
+
+    def ReadRange(self, time_from, time_to):
+        arrays = self.ReadArrays(time_from, time_to)
+        return BacklogBinary.ArraysToEntries(*arrays) if arrays else None
+
+    def ReadChunks(self, size, time_from=0):
+        import mmap
+
+        # Records are decoded chunk by chunk, server accepts JSON only
+        if self.IsDataEmpty():
+            return
+        step = size * BacklogBinary.RECORD_SIZE
+        with open(self._data_path, "rb") as f, \
+             mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = BacklogBinary.FindRecord(mm, time_from) if time_from else 0
+            for pos in range(start, len(mm) - len(mm) % BacklogBinary.RECORD_SIZE, step):
+                times, values = BacklogBinary.DecodeArrays(mm[pos:pos + step])
+                entries = BacklogBinary.ArraysToEntries(times, values)
+                yield Utils.JsonToStr(entries).encode("utf-8"), len(times), times[-1]
+
+#---------------------------------------------------------------------------------------------------
+class BacklogStore(LogTab):
+    DATA_EXTENSION = ".piot2s"
+    INDEX_EXTENSION = ".piot2s.index"
+    LOCK_EXTENSION = ".piot2s.lock"
+    LOCK_TIMEOUT = Backlog.LOCK_TIMEOUT
+
+    # Rewrite data file when it holds more dead bytes than this
+    VACUUM_SIZE = 64 * 1024
+
+    def __init__(self, dir, name, sync=BacklogSync.DEFAULT, caps=BacklogCaps.DEFAULT):
+        super(BacklogStore, self).__init__()
+        self._dir = dir
+        self._name = name
+        self._lock = None
+        self._sync = sync
+        self._caps = caps
+        self._index_path = self._dir + "/" + name + BacklogStore.INDEX_EXTENSION
+        self._lock_path = self._dir + "/" + name + BacklogStore.LOCK_EXTENSION
+
+        # Pending writes of the batch
+        self._pending = None
+        self._pending_sync = False
+        self._err = None
+        self._pending_caps = []
+
+        # Create backlog dir
+        if not Utils.IsDirPresent(self._dir):
+            Utils.CreateDir(self._dir)
+
+        # Read index
+        self.ReadIndex()
+
+    def IsNameValid(name):
+        return isinstance(name, str) and len(name) > 0 and \
+               "\t" not in name and "\n" not in name
+
+    def GetDataPath(self, generation):
+        return self._dir + "/" + self._name + "-" + str(generation) + BacklogStore.DATA_EXTENSION
+
+    def ReadIndex(self):
+        index = DataValidator.ValidateBacklogIndex(
+          Utils.StrToJson(Utils.ReadFile(self._index_path) or "null"))
+        if not index:
+            index = OrderedDict({"generation" : 0, "streams" : OrderedDict()})
+        self._index = index
+        self._data_path = self.GetDataPath(index["generation"])
+
+    def WriteIndex(self, sync):
+        # Drop dead data before it outgrows live data
+        live = sum(s["bytes"] for s in self._index["streams"].values())
+        size = Utils.GetFileSize(self._data_path)
+        if size - live > BacklogStore.VACUUM_SIZE and size - live > live or \
+           size and not live:
+            if not self.Vacuum():
+                return False
+        return Utils.ReplaceFile(self._index_path, Utils.JsonToStr(self._index), sync)
+
+    def Vacuum(self):
+        import shutil
+
+        err = None
+        generation = self._index["generation"] + 1
+        path = self.GetDataPath(generation)
+        streams = self._index["streams"]
+        while True:
+            # Copy live lines only
+            try:
+                with open(self._data_path, "rb") as f_in, open(path, "wb") as f_out:
+                    pos = min([s["offset"] for s in streams.values()] or [0])
+                    f_in.seek(pos)
+                    for line in f_in:
+                        name = line[:line.find(b"\t")].decode("utf-8")
+                        if name in streams and pos >= streams[name]["offset"]:
+                            f_out.write(line)
+                        pos += len(line)
+                    f_out.flush()
+                    os.fsync(f_out.fileno())
+            except:
+                err = "copy error"; break
+
+            # All lines of the new file are live
+            for s in streams.values():
+                s["offset"] = 0
+            self._index["generation"] = generation
+            if not Utils.ReplaceFile(self._index_path, Utils.JsonToStr(self._index), True):
+                err = "index error"; break
+
+            # Switch to new file
+            Utils.DelFile(self._data_path)
+            self._data_path = path
+            break # while
+        if err:
+            self.LogErr("Failed to vacuum backlog store :: " + err + " :: path=" + path)
+            self.ReadIndex()
+        return not err
+
+    def SetPolicy(self, sync, caps):
+        # Streams take policies of the store when they are opened
+        self._sync = sync
+        self._caps = caps
+
+    def Lock(self, timeout=LOCK_TIMEOUT):
+        # Streams share lock of the store
+        if self._lock:
+            return True
+
+        path = self._lock_path
+        self._lock = Utils.LockFile(path, timeout)
+        if not self._lock:
+            self.LogErr("Lock error :: failed to acquire lock :: lock-path=" + path)
+            return False
+
+        # Index might have been updated by other process
+        self.ReadIndex()
+        return True
+
+    def Unlock(self):
+        if self._lock:
+            self._lock.close()
+            self._lock = None
+
+    def Stream(self, name):
+        LogTab.PushLogTab(self)
+        return BacklogStream(self, name)
+
+    def GetStreamMeta(self, name):
+        s = self._index["streams"].get(name)
+        return OrderedDict({"time-first" : s["time-first"],
+                            "time-last" : s["time-last"],
+                            "size" : s["size"]}) if s else None
+
+    def GetStreamNames(self):
+        return list(self._index["streams"].keys())
+
+    def WriteStreams(self, writes, sync):
+        # Append data of all streams with a single write
+        pos = Utils.GetFileSize(self._data_path)
+        body = ""
+        for name, data_str, clear in writes:
+            s = self._index["streams"].setdefault(name, OrderedDict({
+              "time-first" : 0, "time-last" : 0, "size" : 0, "offset" : 0, "bytes" : 0}))
+            if clear:
+                s["offset"] = pos
+                s["bytes"] = 0
+            size = len(data_str.encode("utf-8"))
+            s["bytes"] += size
+            pos += size
+            body += data_str
+        return Utils.WriteFile(self._data_path, body, False, sync) if body else True
+
+    def WriteStream(self, name, data_str, clear, sync):
+        if self._pending != None:
+            self._pending.append((name, data_str, clear))
+            self._pending_sync = self._pending_sync or sync
+            return True
+        return self.WriteStreams([(name, data_str, clear)], sync)
+
+    def UpdateStreamMeta(self, name, time_first, time_last, size, sync):
+        s = self._index["streams"].setdefault(name, OrderedDict({
+          "time-first" : 0, "time-last" : 0, "size" : 0, "offset" : 0, "bytes" : 0}))
+        s["time-first"] = time_first
+        s["time-last"] = time_last
+        s["size"] = size
+        if self._pending == None and not self.WriteIndex(sync):
+            return None
+        return self.GetStreamMeta(name)
+
+    def ReadStream(self, name, time_from=0, time_to=0):
+        import mmap
+
+        s = self._index["streams"].get(name)
+        if not s or not s["bytes"]:
+            return []
+
+        # Scan mapped data file starting from first live line of the stream,
+        # decode only lines of the stream that fall into requested range
+        prefix = name.encode("utf-8") + b"\t"
+        lines = []
+        try:
+            with open(self._data_path, "rb") as f, \
+                 mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = s["offset"]
+                size = len(mm)
+                while pos < size:
+                    end = mm.find(b"\n", pos)
+                    end = size if end < 0 else end + 1
+                    if mm[pos:pos + len(prefix)] == prefix:
+                        time = Backlog.GetLineTime(mm, pos, end) \
+                                 if time_from or time_to else 0
+                        if time_to and time > time_to:
+                            break
+                        if time >= time_from:
+                            lines.append(mm[pos + len(prefix):end])
+                    pos = end
+        except:
+            return None
+        return Utils.StrToJson(b"[" + b",".join(lines) + b"]")
+
+    def ReadStreamChunks(self, name, size, time_from=0):
+        import mmap
+
+        s = self._index["streams"].get(name)
+        if not s or not s["bytes"]:
+            return
+
+        # Same scan as ReadStream, lines are yielded as raw JSON arrays of given size
+        prefix = name.encode("utf-8") + b"\t"
+        with open(self._data_path, "rb") as f, \
+             mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lines = []
+            pos = s["offset"]
+            while pos < len(mm):
+                end = mm.find(b"\n", pos)
+                end = len(mm) if end < 0 else end + 1
+                if mm[pos:pos + len(prefix)] == prefix and \
+                  (not time_from or Backlog.GetLineTime(mm, pos, end) >= time_from):
+                    lines.append(mm[pos + len(prefix):end])
+                    if len(lines) == size:
+                        yield b"[" + b",".join(lines) + b"]", len(lines), \
+                              Backlog.GetLineTime(mm, pos, end)
+                        lines = []
+                    last = (pos, end)
+                pos = end
+            if lines:
+                yield b"[" + b",".join(lines) + b"]", len(lines), \
+                      Backlog.GetLineTime(mm, *last)
+
+    def Begin(self):
+        self._pending = []
+        self._pending_sync = False
+        self._pending_caps = []
+
+    def Commit(self):
+        err = None
+        while True:
+            # Write data & index of all streams at once
+            writes = self._pending
+            sync = self._pending_sync
+            self._pending = None
+            if not self.WriteStreams(writes, sync):
+                err = "write error"; break
+            if not self.WriteIndex(sync):
+                err = "index error"; break
+
+            # Apply caps now that data is in place
+            for stream, time_prev in self._pending_caps:
+                if not stream.ApplyCaps(time_prev, sync):
+                    err = "compact error"; break
+            break # while
+        if err:
+            self.LogErr("Failed to commit backlog store :: " + err + " :: path=" + self._data_path)
+        return not err
+
+    def WriteMulti(self, streams):
+        err = None
+        status = OrderedDict()
+        while True:
+            # Data must be a dict of lists
+            if not streams or not isinstance(streams, dict):
+                err = "data is not a dict"; break
+
+            # Validate all streams before writing anything
+            self.Begin()
+            for name, data in streams.items():
+                stream = self.Stream(name)
+                rc, entries_num = stream.Write(data) if data != [] else (True, 0)
+                if not rc:
+                    err = "stream write error :: name=" + str(name) + \
+                          " :: " + str(stream._err); break
+                status[name] = stream.GetStatus()
+                status[name]["new-entries"] = entries_num
+            if err:
+                self._pending = None
+                self.ReadIndex()
+                break
+
+            if not self.Commit():
+                err = "commit error"; break
+            break # while
+        if err:
+            self.LogErr("Failed to write backlog store :: " + err)
+        self._err = err
+        return status if not err else None
+
+#---------------------------------------------------------------------------------------------------
+class BacklogStream(Backlog):
+    def __init__(self, store, name):
+        LogTab.__init__(self)
+        self._store = store
+        self._dir = store._dir
+        self._name = name
+        self._sync = BacklogSync(store._sync)
+        self._caps = BacklogCaps(store._caps)
+        self._compacted = 0
+        self._err = None
+        self._data_path = store._data_path + ":" + name
+        self._meta = store.GetStreamMeta(name)
+
+    def EntriesToStr(self, entries, first):
+        prefix = self._name + "\t"
+        return "".join([prefix + Utils.JsonToStr(entry) + "\n" for entry in entries])
+
+    def IsDataEmpty(self):
+        return not self._meta or not self._meta["size"]
+
+    def WriteData(self, data_str, clear, sync):
+        return self._store.WriteStream(self._name, data_str, clear, sync)
+
+    def Read(self):
+        data = self._store.ReadStream(self._name)
+        if not data:
+            self.LogErr("Failed to read backlog :: no data :: path=" + self._data_path)
+        return data
+
+    def ReadRange(self, time_from, time_to):
+        data = self._store.ReadStream(self._name, time_from, time_to)
+        if data == None:
+            self.LogErr("Failed to read backlog range :: path=" + self._data_path)
+        return data
+
+    def ReadChunks(self, size, time_from=0):
+        return self._store.ReadStreamChunks(self._name, size, time_from)
+
+    def GetDataSize(self):
+        s = self._store._index["streams"].get(self._name)
+        return s["bytes"] if s else 0
+
+    def GetMetaTime(self):
+        return Utils.GetFileTime(self._store._index_path)
+
+    def GetSyncPaths(self):
+        return [self._store._data_path, self._store._index_path]
+
+    def ApplyCaps(self, time_prev, sync):
+        # Caps of batched writes are applied on commit
+        if self._store._pending != None:
+            self._store._pending_caps.append((self, time_prev))
+            return True
+        return Backlog.ApplyCaps(self, time_prev, sync)
+
+    def Lock(self, timeout=Backlog.LOCK_TIMEOUT):
+        if not self._store.Lock(timeout):
+            return False
+        self._meta = self._store.GetStreamMeta(self._name)
+        return True
+
+    def Unlock(self):
+        self._store.Unlock()
+
+    def UpdateMeta(self, time_first, time_last, size, sync=False):
+        return self._store.UpdateStreamMeta(self._name, time_first, time_last, size, sync)
 
 #---------------------------------------------------------------------------------------------------
 class Db(LogTab):
+    FETCH_SIZE = 1024
+
     def __init__(self, path):
         super(Db, self).__init__()
         self._path = path
@@ -541,6 +1896,19 @@ class Db(LogTab):
             self.Log("close", err)
         return not err
 
+    def Rollback(self):
+        import sqlite3
+
+        # Drop changes since last commit
+        def cb():
+            self._connection.rollback()
+        err = Utils.Try(cb, "rollback error")
+        if not err:
+            self._dirty = False
+
+        self.Log("rollback", err)
+        return not err
+
     def Commit(self):
         import sqlite3
 
@@ -549,20 +1917,23 @@ class Db(LogTab):
             # Connect to DB
             def cb():
                 self._connection.commit()
-            err = Utils.Try(cb, "commit error"); break
+            err = Utils.Try(cb, "commit error")
+            if err: break
 
             # Make clean
             self._dirty = False
+            break # while
 
         # Log
         self.Log("commit", err)
         return not err
 
-    def CreateTable(self, name, scheme):
+    def CreateTable(self, name, scheme, if_not_exists=False, without_rowid=False):
         import sqlite3
 
         # Create table
-        sql = "CREATE TABLE " + name + " (" + scheme + ")"
+        sql = "CREATE TABLE " + ("IF NOT EXISTS " if if_not_exists else "") + \
+              name + " (" + scheme + ")" + (" WITHOUT ROWID" if without_rowid else "")
         def cb():
             self._cursor.execute(sql)
         err = Utils.Try(cb, "cursor error");
@@ -574,7 +1945,7 @@ class Db(LogTab):
         self.Log("create-table", err, "sql=" + sql)
         return not err
 
-    def WriteRow(self, name, data):
+    def WriteRow(self, name, data, replace=False):
         import sqlite3
 
         err = sql = None
@@ -588,7 +1959,8 @@ class Db(LogTab):
 
             # Insert table
             scheme = ("?," * len(data))[:-1]
-            sql = "INSERT INTO " + name + " VALUES (" + scheme + ")"
+            sql = "INSERT " + ("OR REPLACE " if replace else "") + \
+                  "INTO " + name + " VALUES (" + scheme + ")"
             def cb():
                 self._cursor.execute(sql, data)
             err = Utils.Try(cb, "cursor error");
@@ -598,6 +1970,31 @@ class Db(LogTab):
         self.Log("write-row", err, "sql=" + sql + " sql-params=" + str(data))
         return not err
 
+    def WriteRows(self, name, rows, ignore=False):
+        import sqlite3
+
+        err = sql = None
+        while True:
+            # Rows must be passed as list of tuples of the same size
+            if not rows or not isinstance(rows, list) or not isinstance(rows[0], tuple):
+                err = "bad data"; break
+
+            # Make dirty
+            self._dirty = True
+
+            # Insert all rows at once
+            scheme = ("?," * len(rows[0]))[:-1]
+            sql = "INSERT " + ("OR IGNORE " if ignore else "") + \
+                  "INTO " + name + " VALUES (" + scheme + ")"
+            def cb():
+                self._cursor.executemany(sql, rows)
+            err = Utils.Try(cb, "cursor error");
+            break # while
+
+        # Log
+        self.Log("write-rows", err, "sql=" + str(sql) + " rows=" + str(len(rows or [])))
+        return not err
+
     def ReadRow(self, name, query):
         import sqlite3
 
@@ -611,27 +2008,99 @@ class Db(LogTab):
             sql = "SELECT rowid, * FROM " + name + " WHERE " + query[0] + "=?"
             sql_param = (query[1],)
             def cb():
-                self._cursor.execute(sql, sql_param)
+                self._cursor.execute(sql, sql_param)
+            err = Utils.Try(cb, "execute error");
+            if err: break
+
+            # Read response
+            def cb():
+                nonlocal row
+                row = self._cursor.fetchone()
+            err = Utils.Try(cb, "fetchone error");
+            break # while
+
+        self.Log("read-row", err, "sql=" + sql + " query=" + str(query))
+        return row
+
+    def ReadRows(self, sql, sql_params=()):
+        import sqlite3
+
+        err = rows = None
+        while True:
+            def cb():
+                self._cursor.execute(sql, sql_params)
             err = Utils.Try(cb, "execute error");
             if err: break
 
             # Read response
             def cb():
-                nonlocal row
-                row = self._cursor.fetchone()
-            err = Utils.Try(cb, "fetchone error");
+                nonlocal rows
+                rows = self._cursor.fetchall()
+            err = Utils.Try(cb, "fetchall error");
             break # while
 
-        self.Log("read-row", err, "sql=" + sql + " query=" + str(query))
-        return row
+        self.Log("read-rows", err, "sql=" + sql + " sql-params=" + str(sql_params))
+        return rows
+
+    def IterRows(self, sql, sql_params=(), err_cb=None):
+        import sqlite3
+
+        # Rows are fetched in batches by own cursor, so that several queries can be
+        # consumed side by side without holding all rows in memory, failed fetch
+        # ends iteration & is reported to the callback
+        cursor = None
+        def cb():
+            nonlocal cursor
+            cursor = self._connection.cursor()
+            cursor.execute(sql, sql_params)
+        err = Utils.Try(cb, "execute error");
+
+        self.Log("iter-rows", err, "sql=" + sql + " sql-params=" + str(sql_params))
+        if err:
+            return None
+        def rows():
+            while True:
+                batch = []
+                def cb():
+                    batch.extend(cursor.fetchmany(Db.FETCH_SIZE))
+                err = Utils.Try(cb, "fetch error")
+                if err:
+                    self.Log("iter-rows", err, "sql=" + sql + " sql-params=" + str(sql_params))
+                    if err_cb:
+                        err_cb(err)
+                    break
+                if not batch:
+                    break
+                yield from batch
+            cursor.close()
+        return rows()
+
+    def IsTablePresent(self, name):
+        rows = self.ReadRows("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                             (name,))
+        return bool(rows)
+
+    def Execute(self, sql, sql_params=()):
+        import sqlite3
+
+        # Make dirty
+        self._dirty = True
+
+        # Run statement that changes data, e.g. DELETE
+        def cb():
+            self._cursor.execute(sql, sql_params)
+        err = Utils.Try(cb, "execute error");
+
+        self.Log("execute", err, "sql=" + sql + " sql-params=" + str(sql_params))
+        return not err
 
-    def GetTableSize(self, name):
+    def GetTableSize(self, name, cond=None):
         import sqlite3
 
         err = sql = sql_params = row_num = None
         while True:
-            # Select from table
-            sql = "SELECT COUNT(rowid) FROM " + name
+            # Select from table, tables WITHOUT ROWID have no rowid to count
+            sql = "SELECT COUNT(*) FROM " + name + (" WHERE " + cond if cond else "")
             def cb():
                 self._cursor.execute(sql)
             err = Utils.Try(cb, "execute error");
@@ -659,6 +2128,819 @@ class Db(LogTab):
         self.Log("get-table-size", err, "sql=" + sql)
         return row_num
 
+#---------------------------------------------------------------------------------------------------
+class DbChunk:
+    # Sealed points of sensor table packed into one blob: times are delta-of-delta
+    # encoded, float64 values of every column are XOR-ed with the previous value of the
+    # column & stripped of trailing zero bits. Columns that hold only integers, e.g.
+    # counters, are delta-of-delta encoded like times, so that they stay exact beyond
+    # 2^53. All numbers are byte-aligned varints, runs of equal deltas & values are then
+    # squeezed by zlib. Version 1 chunks have float64 columns only.
+    VERSION = 2
+    SIZE = 1024
+    SEAL_AGE = 86400
+    SCHEME = "time_first integer primary key, time_last integer, size integer, data blob"
+
+    def GetTable(sensor_id):
+        return "sensor_" + str(sensor_id) + "_chunks"
+
+    def PutVarint(out, n):
+        while n > 0x7f:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def GetVarint(body, pos):
+        n = shift = 0
+        while True:
+            b = body[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n, pos
+            shift += 7
+
+    def PutDeltas(out, values):
+        # Delta-of-delta of integers, zig-zag mapped to unsigned varints
+        prev = delta_prev = 0
+        for v in values:
+            delta = v - prev
+            dod = delta - delta_prev
+            DbChunk.PutVarint(out, dod * 2 if dod >= 0 else -dod * 2 - 1)
+            prev, delta_prev = v, delta
+
+    def GetDeltas(body, pos, size):
+        values = []
+        prev = delta_prev = 0
+        for i in range(size):
+            z, pos = DbChunk.GetVarint(body, pos)
+            delta = delta_prev + (z >> 1 if not z & 1 else -(z >> 1) - 1)
+            prev += delta
+            delta_prev = delta
+            values.append(prev)
+        return values, pos
+
+    def Encode(rows, columns):
+        import struct
+        import zlib
+        from array import array
+
+        out = bytearray()
+        put = DbChunk.PutVarint
+        put(out, DbChunk.VERSION)
+        put(out, len(rows))
+        put(out, columns)
+
+        # Times, deltas of regular sampling are equal, so their deltas are zeros
+        DbChunk.PutDeltas(out, [row[0] for row in rows])
+
+        # Values, bits of the same or close values mostly cancel out
+        for c in range(1, columns + 1):
+            ints = all([isinstance(row[c], int) for row in rows])
+            put(out, int(ints))
+            if ints:
+                DbChunk.PutDeltas(out, [row[c] for row in rows])
+                continue
+            bits = array("Q")
+            bits.frombytes(struct.pack("<" + str(len(rows)) + "d",
+                                       *[float(row[c]) for row in rows]))
+            if sys.byteorder == "big":
+                bits.byteswap()
+            prev = 0
+            for b in bits:
+                x = b ^ prev
+                prev = b
+                if not x:
+                    put(out, 0)
+                    continue
+                tz = (x & -x).bit_length() - 1
+                put(out, tz + 1)
+                put(out, x >> tz)
+        return zlib.compress(bytes(out))
+
+    def Decode(blob):
+        import struct
+        import zlib
+        from array import array
+
+        # Returns rows of time & values of all columns, or None if chunk is corrupted
+        try:
+            body = zlib.decompress(blob)
+            get = DbChunk.GetVarint
+            version, pos = get(body, 0)
+            if version not in [1, DbChunk.VERSION]:
+                return None
+            size, pos = get(body, pos)
+            columns, pos = get(body, pos)
+
+            times, pos = DbChunk.GetDeltas(body, pos, size)
+
+            values = []
+            for c in range(columns):
+                ints = 0
+                if version > 1:
+                    ints, pos = get(body, pos)
+                if ints:
+                    column, pos = DbChunk.GetDeltas(body, pos, size)
+                    values.append(column)
+                    continue
+                bits = array("Q")
+                prev = 0
+                for i in range(size):
+                    tz, pos = get(body, pos)
+                    if tz:
+                        x, pos = get(body, pos)
+                        prev ^= x << (tz - 1)
+                    bits.append(prev)
+                if sys.byteorder == "big":
+                    bits.byteswap()
+                values.append(struct.unpack("<" + str(size) + "d", bits.tobytes()))
+            return list(zip(times, *values))
+        except:
+            return None
+
+#---------------------------------------------------------------------------------------------------
+class SensorStats:
+    # Aggregates of points grouped into time buckets aligned to multiples of group size,
+    # all points form one bucket if group is 0. Points are loaded into contiguous arrays,
+    # NumPy does the math when available, array module & builtins otherwise.
+    #  * count, min, max, sum, mean, std
+    #  * p<N>       - percentile, linear interpolation between closest ranks
+    #  * rate       - change per hour between first & last point of the bucket
+    #  * rate-min,
+    #    rate-max   - extremes of change per hour between consecutive points
+    #  * hdd:<base> - degree-days below base, each value lasts until next point
+    DEFAULT = "count,min,max,mean"
+    SIMPLE = ["count", "min", "max", "sum", "mean", "std", "rate", "rate-min", "rate-max"]
+
+    # Results are cached in memory of the process, DB is never written by reads
+    CACHE_SIZE = 256
+    _cache = OrderedDict()
+
+    def GetDbStamp(path):
+        # Any commit, also of other processes, changes DB file or its write-ahead log
+        return [(s.st_mtime_ns, s.st_size) for s in \
+                [os.stat(p) for p in [path, path + "-wal"] if Utils.IsFilePresent(p)]]
+
+    def Parse(stats):
+        # Returns list of (key, name, param) or None
+        parsed = []
+        for key in (stats or "").split(","):
+            name, _, param = key.partition(":")
+            if name in SensorStats.SIMPLE and not param:
+                parsed.append((key, name, None))
+            elif name[:1] == "p" and name[1:].isdigit() and int(name[1:]) <= 100 and not param:
+                parsed.append((key, "p", int(name[1:])))
+            elif name == "hdd":
+                try:
+                    parsed.append((key, name, float(param)))
+                except:
+                    return None
+            else:
+                return None
+        return parsed
+
+    def GetBounds(times, group):
+        # Start & end index of every bucket, times are sorted
+        if not group:
+            return [0], [len(times)]
+        starts = [0] + [i for i in range(1, len(times)) \
+                        if times[i] // group != times[i - 1] // group]
+        return starts, starts[1:] + [len(times)]
+
+    def Compute(points, columns, group, stats):
+        # Returns buckets & aggregates of every column
+        from array import array
+
+        out = OrderedDict({"time" : []})
+        if not points:
+            for c in columns:
+                out[c] = OrderedDict([(key, []) for key, _, _ in stats])
+            return out
+        np = Utils.GetNumpy()
+        if np:
+            data = np.array(points, dtype=np.float64)
+            times = data[:, 0].astype(np.int64)
+            keys = times // group if group else np.zeros(len(times), dtype=np.int64)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+            ends = np.append(starts[1:], len(times))
+            out["time"] = (times[starts] - times[starts] % group if group else \
+                           times[starts]).tolist()
+            for i, c in enumerate(columns):
+                out[c] = SensorStats.ComputeNumpy(np, times, data[:, i + 1], starts, ends, stats)
+        else:
+            times = array("q", [p[0] for p in points])
+            starts, ends = SensorStats.GetBounds(times, group)
+            out["time"] = [times[s] - times[s] % group if group else times[s] for s in starts]
+            for i, c in enumerate(columns):
+                values = array("d", [p[i + 1] for p in points])
+                out[c] = SensorStats.ComputeArray(times, values, starts, ends, stats)
+        return out
+
+    def ComputeNumpy(np, t, v, starts, ends, stats):
+        import math
+
+        counts = ends - starts
+        sums = np.add.reduceat(v, starts)
+        means = sums / counts
+        idx = np.repeat(np.arange(len(starts)), counts)
+        dt = np.diff(t)
+        # Rate of pair i belongs to bucket of point i, pairs across buckets are masked
+        same = np.append(idx[1:] == idx[:-1], False)
+        rates = np.append(np.diff(v) / np.where(dt > 0, dt, 1) * 3600, 0.0)
+        order = None
+        out = OrderedDict()
+        for key, name, param in stats:
+            if name == "count":
+                res = counts
+            elif name == "min":
+                res = np.minimum.reduceat(v, starts)
+            elif name == "max":
+                res = np.maximum.reduceat(v, starts)
+            elif name == "sum":
+                res = sums
+            elif name == "mean":
+                res = means
+            elif name == "std":
+                res = np.sqrt(np.add.reduceat((v - means[idx]) ** 2, starts) / counts)
+            elif name == "rate":
+                span = t[ends - 1] - t[starts]
+                res = np.where(span > 0, (v[ends - 1] - v[starts]) / np.where(span > 0, span, 1) \
+                               * 3600, np.nan)
+            elif name == "rate-min":
+                res = np.minimum.reduceat(np.where(same, rates, np.inf), starts)
+            elif name == "rate-max":
+                res = np.maximum.reduceat(np.where(same, rates, -np.inf), starts)
+            elif name == "p":
+                # Values sorted within buckets
+                if order is None:
+                    order = v[np.lexsort((v, idx))]
+                pos = (counts - 1) * param / 100.0
+                lo = np.floor(pos).astype(np.int64)
+                hi = np.minimum(lo + 1, counts - 1)
+                res = order[starts + lo] + (order[starts + hi] - order[starts + lo]) * (pos - lo)
+            elif name == "hdd":
+                w = np.maximum(param - v, 0) * np.append(dt, 0)
+                res = np.add.reduceat(w, starts) / 86400
+            out[key] = [x if isinstance(x, int) or math.isfinite(x) else None \
+                        for x in res.tolist()]
+        return out
+
+    def ComputeArray(t, v, starts, ends, stats):
+        import math
+
+        out = OrderedDict([(key, []) for key, _, _ in stats])
+        for s, e in zip(starts, ends):
+            seg = v[s:e]
+            n = e - s
+            mean = sum(seg) / n
+            rates = [(v[i + 1] - v[i]) / (t[i + 1] - t[i] or 1) * 3600 for i in range(s, e - 1)]
+            ordered = None
+            for key, name, param in stats:
+                if name == "count":
+                    res = n
+                elif name == "min":
+                    res = min(seg)
+                elif name == "max":
+                    res = max(seg)
+                elif name == "sum":
+                    res = sum(seg)
+                elif name == "mean":
+                    res = mean
+                elif name == "std":
+                    res = math.sqrt(sum([(x - mean) ** 2 for x in seg]) / n)
+                elif name == "rate":
+                    span = t[e - 1] - t[s]
+                    res = (v[e - 1] - v[s]) / span * 3600 if span > 0 else None
+                elif name == "rate-min":
+                    res = min(rates) if rates else None
+                elif name == "rate-max":
+                    res = max(rates) if rates else None
+                elif name == "p":
+                    ordered = ordered or sorted(seg)
+                    pos = (n - 1) * param / 100.0
+                    lo = int(pos)
+                    hi = min(lo + 1, n - 1)
+                    res = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+                elif name == "hdd":
+                    res = sum([max(param - v[i], 0) * (t[i + 1] - t[i]) \
+                               for i in range(s, min(e, len(t) - 1))]) / 86400
+                out[key].append(res)
+        return out
+
+#---------------------------------------------------------------------------------------------------
+class Pool:
+    # Resources shared by all actions of the process when enabled, e.g. in batch mode.
+    # Pooled DBs stay open and pooled backlogs stay locked until pool is closed.
+    _enabled = False
+    _dbs = OrderedDict()
+    _backlogs = OrderedDict()
+
+    def Enable():
+        Pool._enabled = True
+
+    def IsEnabled():
+        return Pool._enabled
+
+    def GetDb(path):
+        db = Pool._dbs.get(path)
+        if not db:
+            db = Db(path)
+            if not db.Open():
+                return None
+            Pool._dbs[path] = db
+        return db
+
+    def GetBacklog(key, create_cb):
+        backlog = Pool._backlogs.get(key)
+        if not backlog:
+            backlog = create_cb()
+            if not backlog.Lock():
+                return None
+            Pool._backlogs[key] = backlog
+        return backlog
+
+    def Close():
+        for backlog in Pool._backlogs.values():
+            backlog.Unlock()
+        for db in Pool._dbs.values():
+            if db._dirty:
+                db.Commit()
+            db.Close()
+        Pool._backlogs = OrderedDict()
+        Pool._dbs = OrderedDict()
+        Pool._enabled = False
+
+#---------------------------------------------------------------------------------------------------
+class LastValues:
+    # Latest entry of every sensor. Long running server keeps the map in memory, updates
+    # it on every ingest & a saver thread persists changed entries once per save interval
+    # to small table of the DB, so that they survive restarts. DB writers keep the table
+    # current too.
+    TABLE = "sensors_current"
+    SCHEME = "name text primary key, time integer, data text"
+    SAVE_INTERVAL = 5
+    _enabled = False
+    _db_path = None
+    _values = OrderedDict()
+    _dirty = set()
+    _lock = None
+    _saver = None
+
+    def Enable(db_path):
+        import threading
+        import atexit
+
+        if LastValues._enabled:
+            return
+        LastValues._lock = threading.Lock()
+        LastValues._db_path = db_path
+        LastValues._values = LastValues.Load(db_path)
+        LastValues._enabled = True
+
+        def cb():
+            while True:
+                time.sleep(LastValues.SAVE_INTERVAL)
+                LastValues.Flush()
+
+        LastValues._saver = threading.Thread(target=cb, daemon=True)
+        LastValues._saver.start()
+        atexit.register(LastValues.Flush)
+
+    def IsEnabled():
+        return LastValues._enabled
+
+    def GetLatest(entries):
+        # Entry with the latest time or None
+        if not isinstance(entries, list) or not entries:
+            return None
+        return max(entries, key=lambda e: e["time"])
+
+    def Update(name, entries):
+        entry = LastValues.GetLatest(entries)
+        if not LastValues._enabled or not entry:
+            return
+        with LastValues._lock:
+            current = LastValues._values.get(name)
+            if current and current["time"] >= entry["time"]:
+                return
+            LastValues._values[name] = entry
+            LastValues._dirty.add(name)
+
+    def Flush():
+        # Swap dirty set so that ingest is not blocked by DB, failed entries are kept dirty
+        with LastValues._lock:
+            values = OrderedDict([(n, LastValues._values[n]) for n in LastValues._dirty])
+            LastValues._dirty = set()
+        if values and not LastValues.Save(LastValues._db_path, values):
+            log.Err("Failed to save last values :: path=" + str(LastValues._db_path))
+            with LastValues._lock:
+                LastValues._dirty.update(values.keys())
+        return len(values)
+
+    def Get():
+        if not LastValues._enabled:
+            return OrderedDict()
+        with LastValues._lock:
+            return OrderedDict(LastValues._values)
+
+    def Write(db, values):
+        # Entry replaces stored one only if it is newer
+        if not db.CreateTable(LastValues.TABLE, LastValues.SCHEME, True):
+            return False
+        for name, entry in values.items():
+            data = OrderedDict([(k, v) for k, v in entry.items() if k != "time"])
+            if not db.Execute("INSERT INTO " + LastValues.TABLE + " VALUES (?, ?, ?) " + \
+              "ON CONFLICT(name) DO UPDATE SET time=excluded.time, data=excluded.data " + \
+              "WHERE excluded.time > time", (name, entry["time"], Utils.JsonToStr(data))):
+                return False
+        return True
+
+    def Read(db):
+        if not db.IsTablePresent(LastValues.TABLE):
+            return OrderedDict()
+        rows = db.ReadRows("SELECT name, time, data FROM " + LastValues.TABLE + " ORDER BY name")
+        if rows == None:
+            return None
+        values = OrderedDict()
+        for name, time, data in rows:
+            values[name] = OrderedDict({"time" : time})
+            values[name].update(Utils.StrToJson(data) or {})
+        return values
+
+    def Load(db_path):
+        # DB file is never created here
+        if not db_path or not Utils.IsFilePresent(db_path):
+            return OrderedDict()
+        db = Db(db_path)
+        values = LastValues.Read(db) if db.Open() else None
+        db.Close()
+        return values or OrderedDict()
+
+    def Save(db_path, values):
+        if not db_path or not Utils.IsFilePresent(db_path):
+            return True
+        db = Db(db_path)
+        ok = db.Open() and LastValues.Write(db, values) and db.Commit()
+        db.Close()
+        return ok
+
+#---------------------------------------------------------------------------------------------------
+class Subscription:
+    # Bounded buffer of entries waiting for one subscriber. When subscriber can't keep up:
+    #   drop      - oldest entries are dropped
+    #   coalesce  - only latest entry of every sensor is kept, then oldest are dropped
+    # Dropped entries are counted per sensor & reported to subscriber.
+    POLICIES = ["drop", "coalesce"]
+
+    def __init__(self, names, size, policy):
+        import threading
+        import collections
+
+        self._names = set(names)
+        self._size = size
+        self._policy = policy
+        self._queue = collections.deque()
+        self._dropped = OrderedDict()
+        self._cond = threading.Condition()
+
+    def Drop(self, name, num):
+        self._dropped[name] = self._dropped.get(name, 0) + num
+
+    def Push(self, name, entries):
+        if name not in self._names:
+            return
+        with self._cond:
+            self._queue.extend([(name, e) for e in entries])
+            if len(self._queue) > self._size and self._policy == "coalesce":
+                latest = OrderedDict()
+                for n, e in self._queue:
+                    latest.pop(n, None)
+                    latest[n] = e
+                    self.Drop(n, 1)
+                for n in latest.keys():
+                    self.Drop(n, -1)
+                self._queue.clear()
+                self._queue.extend(latest.items())
+            while len(self._queue) > self._size:
+                self.Drop(self._queue.popleft()[0], 1)
+            self._cond.notify()
+
+    def Pop(self, timeout):
+        # Returns buffered entries & dropped counts, waits for entries up to timeout
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            items = list(self._queue)
+            dropped = OrderedDict([(n, d) for n, d in self._dropped.items() if d])
+            self._queue.clear()
+            self._dropped = OrderedDict()
+        return items, dropped
+
+#---------------------------------------------------------------------------------------------------
+class Subscribers:
+    # Live subscriptions of the server, entries written to backlogs are pushed to all
+    # subscriptions interested in the sensor
+    BUFFER_SIZE = 1024
+    BUFFER_MAX = 65536
+    KEEPALIVE = 15
+    _lock = None
+    _subs = []
+
+    def Subscribe(names, size, policy):
+        import threading
+
+        if not Subscribers._lock:
+            Subscribers._lock = threading.Lock()
+        sub = Subscription(names, size, policy)
+        with Subscribers._lock:
+            Subscribers._subs = Subscribers._subs + [sub]
+        return sub
+
+    def Unsubscribe(sub):
+        with Subscribers._lock:
+            Subscribers._subs = [s for s in Subscribers._subs if s is not sub]
+
+    def Publish(name, entries):
+        # List of subscriptions is replaced, never changed, so it is read without lock
+        if not Subscribers._subs or not isinstance(entries, list) or not entries:
+            return
+        for sub in Subscribers._subs:
+            sub.Push(name, entries)
+
+    def FormatEvent(event, data, event_id=None):
+        # Server-Sent Events record
+        return (("id: " + str(event_id) + "\n" if event_id != None else "") + \
+                "event: " + event + "\n" + \
+                "data: " + Utils.JsonToStr(data) + "\n\n").encode("utf-8")
+
+    def Stream(names, size, policy, time_from, read_replay):
+        # Yields events of replayed entries & then of live entries, entries not newer than
+        # the last sent one of the sensor are skipped. Subscription lives as long as the
+        # stream is consumed, it is made before replay, so that nothing written during
+        # replay is missed.
+        sub = Subscribers.Subscribe(names, size, policy)
+        time_last = OrderedDict()
+        try:
+            replay = read_replay() if time_from else []
+            for name, entries in replay:
+                entries = [e for e in entries if e["time"] > time_last.get(name, time_from)]
+                if entries:
+                    time_last[name] = entries[-1]["time"]
+                    yield Subscribers.FormatEvent("entries",
+                      OrderedDict({"sensor" : name, "data" : entries}), entries[-1]["time"])
+            while True:
+                items, dropped = sub.Pop(Subscribers.KEEPALIVE)
+                if dropped:
+                    yield Subscribers.FormatEvent("dropped", dropped)
+                if not items and not dropped:
+                    yield b": keepalive\n\n"
+                groups = OrderedDict()
+                for name, e in items:
+                    if e["time"] > time_last.get(name, time_from):
+                        groups.setdefault(name, []).append(e)
+                        time_last[name] = e["time"]
+                for name, entries in groups.items():
+                    yield Subscribers.FormatEvent("entries",
+                      OrderedDict({"sensor" : name, "data" : entries}), entries[-1]["time"])
+        finally:
+            Subscribers.Unsubscribe(sub)
+
+#---------------------------------------------------------------------------------------------------
+class Wttrin(LogTab):
+    # Weather of a location fetched from wttr.in, cached per location & shared by processes
+    URL = "https://wttr.in"
+    CACHE_DIR = "/tmp/" + APP_NAME + "-wttrin"
+    TTL = 600
+    TIMEOUT = 30
+    FIELDS = OrderedDict({
+        "temp" : "temp_C",
+        "feels-like" : "FeelsLikeC",
+        "humidity" : "humidity",
+        "pressure" : "pressure",
+        "precip" : "precipMM",
+        "wind" : "windspeedKmph",
+        "cloud-cover" : "cloudcover"})
+
+    def __init__(self, location, url=URL, ttl=TTL):
+        super(Wttrin, self).__init__()
+        from urllib.parse import quote
+        import hashlib
+
+        self._location = location
+        self._url = url.rstrip("/") + "/" + quote(location) + "?format=j1"
+        self._ttl = ttl
+        # Servers do not share cached bodies & validators
+        self._cache_path = Wttrin.CACHE_DIR + "/" + quote(location, safe="") + "-" + \
+          hashlib.sha1(self._url.encode("utf-8")).hexdigest()[:12] + ".json"
+
+    def Fetch(self):
+        from urllib import request
+        from urllib import error
+
+        # Truncated or foreign cache is ignored
+        cache = Utils.StrToJson(Utils.ReadFile(self._cache_path) or "")
+        if not isinstance(cache, dict) or cache.get("url") != self._url or \
+          not isinstance(cache.get("body"), dict):
+            cache = None
+
+        # Fresh cache is used without touching network
+        time_cur = Utils.GetUnixTimestamp()
+        if cache and time_cur - cache.get("time", 0) < self._ttl:
+            return cache.get("body"), None
+
+        err = None
+        while True:
+            # Ask server to skip body when cached one is still valid
+            headers = {}
+            if cache and cache.get("etag"):
+                headers["If-None-Match"] = cache["etag"]
+            if cache and cache.get("last-modified"):
+                headers["If-Modified-Since"] = cache["last-modified"]
+
+            body = None
+            try:
+                resp = request.urlopen(request.Request(self._url, headers=headers),
+                                       timeout=Wttrin.TIMEOUT)
+                body = Utils.StrToJson(resp.read())
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+            except error.HTTPError as e:
+                if e.code != 304 or not cache:
+                    err = "fetch error :: status=" + str(e.code); break
+                body = cache.get("body")
+                etag = cache.get("etag")
+                last_modified = cache.get("last-modified")
+            except:
+                err = "fetch error"; break
+
+            if not body or not isinstance(body, dict):
+                err = "json parse error"; break
+
+            # Update cache
+            cache = OrderedDict({
+                "time" : time_cur,
+                "url" : self._url,
+                "etag" : etag,
+                "last-modified" : last_modified,
+                "body" : body})
+            if not Utils.IsDirPresent(Wttrin.CACHE_DIR):
+                Utils.CreateDir(Wttrin.CACHE_DIR)
+            if not Utils.ReplaceFile(self._cache_path, Utils.JsonToStr(cache)):
+                self.LogErr("Failed to write wttr.in cache :: path=" + self._cache_path)
+
+            break # while
+        if err:
+            self.LogErr("Failed to fetch wttr.in :: " + err + " :: url=" + self._url)
+            return None, err
+        return body, None
+
+    def GetFields(body, fields):
+        # Values are reported as strings
+        values = OrderedDict()
+        try:
+            current = body["current_condition"][0]
+            for field in fields:
+                value = current[Wttrin.FIELDS[field]]
+                values[field] = int(value) if value.lstrip("-").isdigit() else float(value)
+        except:
+            return None
+        return values
+
+#---------------------------------------------------------------------------------------------------
+class Scheduler:
+    # Periodic ticks aligned to wall-clock multiples of the interval. Next slot is derived
+    # from the previous slot rather than from the time the tick ran, so slow ticks do not
+    # accumulate drift, and slots that already passed are skipped & counted as missed.
+    MIN_INTERVAL = 1
+
+    def __init__(self, interval, jitter=0):
+        self._interval = max(interval, Scheduler.MIN_INTERVAL)
+        self._jitter = min(max(jitter, 0), self._interval)
+        self._time_slot = 0
+        self._time_due = 0
+        self._lag = 0
+
+    def Start(self, time_cur):
+        # First tick runs immediately, following ones on slot boundaries
+        self._time_slot = time_cur // self._interval * self._interval
+        self._time_due = time_cur
+
+    def IsSame(self, sched):
+        return self._interval == sched._interval and self._jitter == sched._jitter
+
+    def IsDue(self, time_cur):
+        return time_cur >= self._time_due
+
+    def GetTimeDue(self):
+        return self._time_due
+
+    def GetLag(self):
+        return self._lag
+
+    def Advance(self, time_cur):
+        # Returns number of missed slots
+        self._lag = time_cur - self._time_due
+        self._time_slot += self._interval
+        missed = 0
+        if self._time_slot <= time_cur:
+            missed = int((time_cur - self._time_slot) // self._interval) + 1
+            self._time_slot += missed * self._interval
+
+        # Random delay within slot spreads e.g. uploads of many clients
+        self._time_due = self._time_slot + random.uniform(0, self._jitter)
+        return missed
+
+#---------------------------------------------------------------------------------------------------
+class Retry:
+    # Retry policy of requests to server, comma-separated list of:
+    #   attempts:N      - max attempts of one request within one run
+    #   backoff:N       - delay in ms after the first failure, doubled by every next one
+    #   backoff-max:N   - max delay in ms
+    #   breaker:N       - consecutive failures that open the circuit, i.e. pause requests
+    #   cooldown:N      - seconds for which open circuit pauses requests
+    # State is persisted per server, so that one-shot invocations honor it too.
+    DEFAULT = "attempts:3,backoff:1000,backoff-max:30000,breaker:5,cooldown:300"
+    KEYS = ["attempts", "backoff", "backoff-max", "breaker", "cooldown"]
+    STATE_DIR = "/tmp/" + APP_NAME + "-retry"
+
+    def Parse(policy):
+        # Missing keys are taken from default policy
+        d = OrderedDict()
+        for item in filter(None, (Retry.DEFAULT + "," + str(policy)).split(",")):
+            key, _, value = item.partition(":")
+            value = Utils.StrToInt(value)
+            if key not in Retry.KEYS or value <= 0:
+                return None
+            d[key] = value
+        return d
+
+    def __init__(self, policy, addr, port):
+        self._policy = Retry.Parse(policy) or Retry.Parse(Retry.DEFAULT)
+        self._path = Retry.STATE_DIR + "/" + str(addr) + "_" + str(port) + ".json"
+        self._state = Utils.StrToJson(Utils.ReadFile(self._path) or "")
+        if not isinstance(self._state, dict):
+            self._state = OrderedDict({"failures" : 0, "time-next" : 0, "time-open" : 0})
+
+    def SaveState(self):
+        if not self._state["failures"]:
+            if Utils.IsFilePresent(self._path):
+                Utils.DelFile(self._path)
+            return
+        if not Utils.IsDirPresent(Retry.STATE_DIR):
+            Utils.CreateDir(Retry.STATE_DIR)
+        Utils.ReplaceFile(self._path, Utils.JsonToStr(self._state))
+
+    def IsOpen(self, time_cur):
+        # Open circuit lets single request through once cooldown passes
+        return self._state["failures"] >= self._policy["breaker"] and \
+               time_cur < self._state["time-open"] + self._policy["cooldown"]
+
+    def GetBlocker(self, time_cur):
+        # Returns reason why no request may be sent now
+        if self.IsOpen(time_cur):
+            return "circuit open :: retry-in=" + \
+              str(int(self._state["time-open"] + self._policy["cooldown"] - time_cur))
+        if time_cur < self._state["time-next"]:
+            return "backoff :: retry-in=" + str(round(self._state["time-next"] - time_cur, 3))
+        return None
+
+    def OnFailure(self, time_cur):
+        # Bounded exponential backoff with jitter
+        state = self._state
+        state["failures"] += 1
+        delay = min(self._policy["backoff-max"],
+                    self._policy["backoff"] * 2 ** min(state["failures"] - 1, 32)) / 1000
+        state["time-next"] = time_cur + random.uniform(delay / 2, delay)
+        if state["failures"] >= self._policy["breaker"]:
+            state["time-open"] = time_cur
+        self.SaveState()
+
+    def OnSuccess(self):
+        if self._state["failures"]:
+            self._state = OrderedDict({"failures" : 0, "time-next" : 0, "time-open" : 0})
+            self.SaveState()
+
+    def Run(self, cb):
+        # Calls cb until it returns no error, returns error of the last attempt
+        err = self.GetBlocker(Utils.GetTimestamp())
+        if err:
+            return err
+        attempts = 0
+        while True:
+            attempts += 1
+            err = cb()
+            if not err:
+                self.OnSuccess()
+                return None
+
+            time_cur = Utils.GetTimestamp()
+            self.OnFailure(time_cur)
+            if attempts >= self._policy["attempts"] or self.IsOpen(time_cur):
+                return err + " :: attempts=" + str(attempts) + \
+                             " failures=" + str(self._state["failures"])
+            time.sleep(max(0, self._state["time-next"] - Utils.GetTimestamp()))
+
 #---------------------------------------------------------------------------------------------------
 class CmdResult(LogTab):
     def __init__(self):
@@ -753,6 +3035,7 @@ class Action(Cmd):
         self._status = OrderedDict()
         self._status["action"] = cmd
         self._status["args"] = OrderedDict({})
+        self._status_bytes = None
         super(Action, self).__init__(cmd)
 
     def Prepare(self):
@@ -760,7 +3043,9 @@ class Action(Cmd):
         is_ok = True
         dest_args = self._status["args"]
         for k, v in self._args.items():
-            dest_args[k] = str(v)
+            # Parsed data, e.g. of HTTP requests, is not echoed back as a whole
+            dest_args[k] = str(v) if not isinstance(v, (list, dict)) else \
+                           type(v).__name__ + " :: size=" + str(len(v))
             if v == None:
                 is_ok = False
 
@@ -784,6 +3069,38 @@ class Action(Cmd):
         # Set output
         self._status["out"] = self.OutJson()
 
+    def StatusToBytes(self):
+        # Status is encoded once, e.g. for both terminal & HTTP response
+        if self._status_bytes == None:
+            self._status_bytes = Utils.JsonToBytes(self._status)
+        return self._status_bytes
+
+    def FormatValue(value):
+        # Scalars are written as-is, everything else as single-line JSON
+        return value.replace("\n", " ") if isinstance(value, str) else Utils.JsonToStr(value)
+
+    def FormatStatus(self, fmt, fields):
+        # Output can be limited to comma-separated list of keys, so that callers
+        # do not have to parse it whole, e.g. data of backlog
+        keys = list(filter(None, str(fields or "").split(",")))
+        status = self._status
+        out = status.get("out")
+        if fmt != "shell" and not keys:
+            return self.StatusToBytes().decode("utf-8")
+        if keys and isinstance(out, dict):
+            out = OrderedDict([(k, out[k]) for k in keys if k in out])
+            status = OrderedDict(status)
+            status["out"] = out
+
+        if fmt != "shell":
+            return Utils.JsonToStr(status)
+
+        # Shell format is one <key>=<value> per line, keys of output are prefixed by "out."
+        lines = [("success", status.get("success")), ("error", status.get("error", ""))]
+        if isinstance(out, dict):
+            lines += [("out." + k, v) for k, v in out.items()]
+        return "\n".join([k + "=" + Action.FormatValue(v) for k, v in lines])
+
 #---------------------------------------------------------------------------------------------------
 class ActionError(Action):
     def __init__(self, msg, args):
@@ -800,8 +3117,10 @@ class ActionDb(Action):
         self._path = args["db-path"]
         self._auth_token = args["auth-token"]
         self._db = None
+        self._db_pooled = False
         self._user = None
         self._delete_db_file = False
+        self._iter_err = None
         super(ActionDb, self).__init__(cmd, args)
 
     def Prepare(self):
@@ -812,13 +3131,14 @@ class ActionDb(Action):
 
         # Create db object
         LogTab.PushLogTab(self)
-        self._db = Db(self._path)
+        create_new = (self._cmd == "db-create")
+        self._db_pooled = Pool.IsEnabled() and not create_new
+        self._db = Db(self._path) if not self._db_pooled else None
 
         # Connect to db and authenticate user
         err = None
         while True:
             # Make sure that file is present when referencing existing db
-            create_new = (self._cmd == "db-create")
             if create_new and Utils.IsFilePresent(self._path):
                 err = "db file is already present"; break
 
@@ -826,8 +3146,12 @@ class ActionDb(Action):
             if not create_new and not Utils.IsFilePresent(self._path):
                 err = "db file is missing"; break
 
-            # Open/create db file
-            if not self._db.Open():
+            # Open/create db file, pooled db is opened only once
+            if self._db_pooled:
+                self._db = Pool.GetDb(self._path)
+                if not self._db:
+                    err = "open failed"; break
+            elif not self._db.Open():
                 err = "open failed"; break
 
             # Read user from db
@@ -845,7 +3169,8 @@ class ActionDb(Action):
         if self._db:
             if self._db._dirty:
                 self._db.Commit()
-            self._db.Close()
+            if not self._db_pooled:
+                self._db.Close()
             self._db = None
 
         # Delete db
@@ -895,6 +3220,153 @@ class ActionDb(Action):
             self.LogErr("Failed to get sensor by name :: " + err)
         return sensor
 
+    def CreateSensorOptions(self):
+        # Table is created on demand in DBs that predate it
+        return self._db.CreateTable("sensor_options", \
+          "sensor integer, name text, value text, unique(sensor, name)", True)
+
+    def GetSensorOptions(self, sensor_id):
+        rows = self._db.ReadRows("SELECT name, value FROM sensor_options WHERE sensor=?",
+                                 (sensor_id,))
+        return OrderedDict(rows or [])
+
+    def SetSensorOption(self, sensor_id, name, value):
+        return self.CreateSensorOptions() and \
+               self._db.WriteRow("sensor_options", (sensor_id, name, value), True)
+
+    def ReadSensorStats(self, sensor_id, query):
+        # Cached result or None, result is valid until DB changes
+        entry = SensorStats._cache.get((self._path, sensor_id, query))
+        if not entry or entry[0] != SensorStats.GetDbStamp(self._path):
+            return None
+        return entry[1]
+
+    def WriteSensorStats(self, sensor_id, query, result, stamp):
+        # Stamp is taken before points are read, so that concurrent change drops result
+        cache = SensorStats._cache
+        cache[(self._path, sensor_id, query)] = (stamp, result)
+        while len(cache) > SensorStats.CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def ClearSensorStats(self, sensor_id):
+        # Cached results are dropped whenever sensor gets new data, also before commit
+        cache = SensorStats._cache
+        for key in [k for k in cache.keys() if k[:2] == (self._path, sensor_id)]:
+            del cache[key]
+        return True
+
+    def GetSensorSource(self, sensor):
+        # Table & condition selecting points of the sensor, layout is looked up once
+        if "layout" not in sensor:
+            options = self.GetSensorOptions(sensor["id"])
+            sensor["layout"] = options.get("layout", DbLayout.DEFAULT)
+        return DbLayout.GetTable(sensor["layout"], sensor["id"]), \
+               DbLayout.GetCond(sensor["layout"], sensor["id"])
+
+    def DecodeChunks(self, sensor, blobs):
+        # Values of integer columns are restored from float64
+        rows = []
+        for (blob,) in blobs:
+            points = DbChunk.Decode(blob)
+            if points == None:
+                return None
+            rows += points
+        ints = [SensorType.TYPES[sensor["type"]][c] == "integer" \
+                for c in SensorType.GetColumns(sensor["type"])]
+        if any(ints):
+            rows = [tuple([row[0]] + [int(v) if i else v for v, i in zip(row[1:], ints)]) \
+                    for row in rows]
+        return rows
+
+    def ReadPoints(self, sensor, time_from, time_to):
+        # Rows of time & values ordered by time, sealed chunks that touch the range are
+        # decoded, newer points come from the table of the sensor
+        table, cond = self.GetSensorSource(sensor)
+        chunks = DbChunk.GetTable(sensor["id"])
+        select = "SELECT " + ", ".join(["time"] + SensorType.GetColumns(sensor["type"]))
+        rows = []
+        if self._db.IsTablePresent(chunks):
+            blobs = self._db.ReadRows("SELECT data FROM " + chunks + \
+              " WHERE time_last >= ? AND time_first <= ? ORDER BY time_first",
+              (time_from, time_to))
+            rows = self.DecodeChunks(sensor, blobs or [])
+            if blobs == None or rows == None:
+                return None
+            rows = [row for row in rows if time_from <= row[0] <= time_to]
+        hot = self._db.ReadRows(select + " FROM " + table + " WHERE " + cond + \
+          " AND time >= ? AND time <= ? ORDER BY time", (time_from, time_to))
+        return rows + hot if hot != None else None
+
+    def SetIterErr(self, err):
+        # First error of points that are read lazily, checked once they are consumed
+        self._iter_err = self._iter_err or err
+
+    def IterPoints(self, sensor, time_from, time_to):
+        # Same as ReadPoints, but only one chunk or batch of rows is held at a time,
+        # iteration stops at the first error, see SetIterErr
+        table, cond = self.GetSensorSource(sensor)
+        chunks = DbChunk.GetTable(sensor["id"])
+        select = "SELECT " + ", ".join(["time"] + SensorType.GetColumns(sensor["type"]))
+        blobs = []
+        if self._db.IsTablePresent(chunks):
+            blobs = self._db.IterRows("SELECT data FROM " + chunks + \
+              " WHERE time_last >= ? AND time_first <= ? ORDER BY time_first",
+              (time_from, time_to), self.SetIterErr)
+        hot = self._db.IterRows(select + " FROM " + table + " WHERE " + cond + \
+          " AND time >= ? AND time <= ? ORDER BY time", (time_from, time_to), self.SetIterErr)
+        if blobs == None or hot == None:
+            return None
+        def points():
+            for blob in blobs:
+                rows = self.DecodeChunks(sensor, [blob])
+                if rows == None:
+                    self.SetIterErr("decode error :: name=" + sensor["name"])
+                    return
+                yield from (row for row in rows if time_from <= row[0] <= time_to)
+            if not self._iter_err:
+                yield from hot
+        return points()
+
+    def ReadPointNear(self, sensor, time, before):
+        # Returns list with the closest point before/after given time, if there is one
+        table, cond = self.GetSensorSource(sensor)
+        chunks = DbChunk.GetTable(sensor["id"])
+        select = "SELECT " + ", ".join(["time"] + SensorType.GetColumns(sensor["type"]))
+        op, order = ("<", " DESC") if before else (">", "")
+        rows = self._db.ReadRows(select + " FROM " + table + " WHERE " + cond + \
+          " AND time " + op + " ? ORDER BY time" + order + " LIMIT 1", (time,))
+        if rows == None:
+            return None
+        if self._db.IsTablePresent(chunks):
+            blobs = self._db.ReadRows("SELECT data FROM " + chunks + \
+              (" WHERE time_first < ? ORDER BY time_first DESC" if before else \
+               " WHERE time_last > ? ORDER BY time_first") + " LIMIT 1", (time,))
+            points = self.DecodeChunks(sensor, blobs or [])
+            if blobs == None or points == None:
+                return None
+            rows += [p for p in points if (p[0] < time if before else p[0] > time)]
+        if not rows:
+            return []
+        return [max(rows) if before else min(rows)]
+
+    def GetSensorSize(self, sensor):
+        # Points in the table of the sensor & in its sealed chunks
+        table, cond = self.GetSensorSource(sensor)
+        size = self._db.GetTableSize(table, cond if cond != "1" else None)
+        chunks = DbChunk.GetTable(sensor["id"])
+        if size == None or not self._db.IsTablePresent(chunks):
+            return size
+        rows = self._db.ReadRows("SELECT COALESCE(SUM(size), 0) FROM " + chunks)
+        return size + rows[0][0] if rows else None
+
+    def GetSealedTime(self, sensor):
+        # Time of the last sealed point, 0 if nothing is sealed
+        chunks = DbChunk.GetTable(sensor["id"])
+        if not self._db.IsTablePresent(chunks):
+            return 0
+        rows = self._db.ReadRows("SELECT COALESCE(MAX(time_last), 0) FROM " + chunks)
+        return rows[0][0] if rows else None
+
 #---------------------------------------------------------------------------------------------------
 class ActionDbCreate(ActionDb):
     def __init__(self, path, auth_token):
@@ -919,6 +3391,10 @@ class ActionDbCreate(ActionDb):
               "name text primary key unique, type text, owner integer"):
                 err = "create sensors error"; break
 
+            # Create "sensor_options" table
+            if not self.CreateSensorOptions():
+                err = "create sensor options error"; break
+
             break # while
         if err:
             self.SetErr("Failed to create db :: " + err)
@@ -927,16 +3403,30 @@ class ActionDbCreate(ActionDb):
 
 #---------------------------------------------------------------------------------------------------
 class ActionDbSensorCreate(ActionDb):
-    def __init__(self, path, auth_token, sensor_name, sensor_type):
+    def __init__(self, path, auth_token, sensor_name, sensor_type,
+                 sensor_filter=BacklogFilter.DEFAULT, db_layout=DbLayout.DEFAULT):
         self._sensor_name = sensor_name
         self._sensor_type = sensor_type
+        self._sensor_filter = sensor_filter
+        self._db_layout = db_layout
         super(ActionDbSensorCreate, self).__init__("db-sensor-create",
           OrderedDict({"db-path":path, "auth-token":auth_token, 
-                       "sensor-name":sensor_name, "sensor-type":sensor_type}))
+                       "sensor-name":sensor_name, "sensor-type":sensor_type,
+                       "backlog-filter":sensor_filter, "db-layout":db_layout}))
 
     def Run(self):
         err = None
         while True:
+            # Validate filter applied by client
+            if BacklogFilter.Parse(self._sensor_filter) == None:
+                err = "bad filter"; break
+
+            # Type defines columns of sensor table
+            if not SensorType.IsValid(self._sensor_type):
+                err = "unknown sensor type :: type=" + str(self._sensor_type); break
+            if not DbLayout.IsValid(self._db_layout, self._sensor_type):
+                err = "unsupported layout :: layout=" + str(self._db_layout); break
+
             # Register sensor
             if not self._db.WriteRow("sensors", \
               (self._sensor_name, self._sensor_type, self._user["id"])):
@@ -948,9 +3438,17 @@ class ActionDbSensorCreate(ActionDb):
                 err = "bad table size"; break
 
             # Create table for storing sensor data
-            if not self._db.CreateTable("sensor_" + str(sensor_id),
-              "time integer unique, value real"):
+            if not DbLayout.CreateTable(self._db, self._db_layout, self._sensor_type,
+              DbLayout.GetTable(self._db_layout, sensor_id)):
                 err = "create sensor error"; break
+            if self._db_layout != DbLayout.DEFAULT and \
+              not self.SetSensorOption(sensor_id, "layout", self._db_layout):
+                err = "write sensor options error"; break
+
+            # Record filter, so that values can be reconstructed on read
+            if self._sensor_filter and \
+              not self.SetSensorOption(sensor_id, "filter", self._sensor_filter):
+                err = "write sensor options error"; break
 
             break # while
         if err:
@@ -977,8 +3475,9 @@ class ActionDbSensorWrite(ActionDb):
             if sensor["owner"] != self._user["id"]:
                 err = "owner mismatch"; break
 
-            # Convert data to json
-            data = Utils.StrToJson(self._data)
+            # Convert data to json, unless it was parsed already, e.g. by batch
+            data = self._data if isinstance(self._data, list) else \
+                   Utils.StrToJson(self._data)
             if not data:
                 err = "data not a json"; break
 
@@ -986,84 +3485,746 @@ class ActionDbSensorWrite(ActionDb):
             if not isinstance(data, list):
                 err = "data is not a list"; break
 
+            # Validate whole batch before anything gets written
+            if not SensorType.IsValid(sensor["type"]):
+                err = "unsupported sensor type"; break
+            idx = DataValidator.ValidateBatch(sensor["type"], data)
+            if idx != None:
+                err = "bad " + sensor["type"] + " data :: index=" + str(idx); break
+
             # Name of the destination table
-            dest_table = "sensor_" + str(sensor["id"])
+            dest_table, _ = self.GetSensorSource(sensor)
+
+            # Sealed chunks are never changed, entries that fall into them are skipped
+            # & reported so that the rest of the batch, e.g. a drained backlog, is stored
+            time_sealed = self.GetSealedTime(sensor)
+            if time_sealed == None:
+                err = "read error"; break
+            data_sealed = 0
+            if time_sealed:
+                size = len(data)
+                data = [e for e in data if e["time"] > time_sealed]
+                data_sealed = size - len(data)
+            if data_sealed:
+                self.LogErr("Skipping sealed entries :: name=" + sensor["name"] + \
+                                                     " size=" + str(data_sealed) + \
+                                                     " time-sealed=" + str(time_sealed))
 
             # Get original size of the table
-            table_size = self._db.GetTableSize(dest_table)
+            table_size = self.GetSensorSize(sensor)
             if table_size == None:
                 err = "table size error"; break
 
-            # Write data to sensor table row-by-row
-            for entry in data:
-                # Write temperature sensor
-                values = None
-                if sensor["type"] == "temperature":
-                    if not DataValidator.ValidateSensorTemperature(entry):
-                        err = "bad temperature data"; break
-                    values = (entry["time"], entry["value"])
-
-                # Unsupported sensor
-                else:
-                    err = "unsupported sensor type"; break
-
-                # Write sensor data
-                if not self._db.WriteRow(dest_table, values):
+            # Write data to sensor table, one row per entry
+            if data:
+                if not self._db.WriteRows(dest_table, DbLayout.GetRows(sensor["layout"],
+                  sensor["id"], SensorType.EntriesToRows(sensor["type"], data))):
                     err = "write error"; break
-            if err: break
+                if not self.ClearSensorStats(sensor["id"]):
+                    err = "clear stats error"; break
+
+                # Keep latest entry of the sensor at hand
+                if not LastValues.Write(self._db,
+                  OrderedDict({sensor["name"] : LastValues.GetLatest(data)})):
+                    err = "write last value error"; break
+                LastValues.Update(sensor["name"], data)
 
             # Set out
             data_written = len(data)
             self.SetOut(OrderedDict({"size" : data_written + table_size,
-                                     "new-entries" : data_written,}))
+                                     "new-entries" : data_written,
+                                     "skipped-entries" : data_sealed}))
 
             break # while
         if err:
             self.SetErr("Failed to write sensor :: " + err)
 
+#---------------------------------------------------------------------------------------------------
+class ActionDbSensorSetFilter(ActionDb):
+    def __init__(self, path, auth_token, sensor_name, sensor_filter):
+        self._sensor_name = sensor_name
+        self._sensor_filter = sensor_filter
+        super(ActionDbSensorSetFilter, self).__init__("db-sensor-set-filter",
+          OrderedDict({"db-path":path, "auth-token":auth_token,
+                       "sensor-name":sensor_name, "backlog-filter":sensor_filter}))
+
+    def Run(self):
+        err = None
+        while True:
+            # Find sensor
+            sensor = self.GetSensorByName(self._sensor_name)
+            if not sensor:
+                err = "no sensor"; break
+
+            # Make sure that user owns sensor
+            if sensor["owner"] != self._user["id"]:
+                err = "owner mismatch"; break
+
+            # Validate filter applied by client
+            if BacklogFilter.Parse(self._sensor_filter) == None:
+                err = "bad filter"; break
+
+            # Record filter
+            if not self.SetSensorOption(sensor["id"], "filter", self._sensor_filter):
+                err = "write sensor options error"; break
+
+            self.SetOut(self.GetSensorOptions(sensor["id"]))
+            break # while
+        if err:
+            self.SetErr("Failed to set sensor filter :: " + err)
+
+#---------------------------------------------------------------------------------------------------
+class ActionDbSensorRead(ActionDb):
+    def __init__(self, path, auth_token, sensor_name, range_from, range_to, range_size):
+        self._sensor_name = sensor_name
+        self._range_from = Utils.StrToInt(range_from)
+        self._range_to = Utils.StrToInt(range_to)
+        self._range_size = Utils.StrToInt(range_size)
+        super(ActionDbSensorRead, self).__init__("db-sensor-read",
+          OrderedDict({"db-path":path, "auth-token":auth_token,
+                       "sensor-name":sensor_name, "range-from":range_from,
+                       "range-to":range_to, "range-size":range_size}))
+
+    def Reconstruct(points, time_from, time_to, size, mode, columns=["value"]):
+        import bisect
+
+        # Values between stored points are restored as steps or lines, nothing is
+        # made up before the first or after the last stored point. Points are rows
+        # of time & values of all columns.
+        times = [p[0] for p in points]
+        step = (time_to - time_from) / (size - 1) if size > 1 else 0
+        data = []
+        for i in range(size):
+            time = int(round(time_from + i * step))
+            idx = bisect.bisect_right(times, time) - 1
+            if idx < 0 or time > times[-1]:
+                continue
+            p0 = points[idx]
+            values = p0[1:]
+            if mode == "linear" and idx + 1 < len(points) and time != p0[0]:
+                p1 = points[idx + 1]
+                ratio = (time - p0[0]) / (p1[0] - p0[0])
+                values = [v0 + (v1 - v0) * ratio for v0, v1 in zip(p0[1:], p1[1:])]
+            data.append(OrderedDict([("time", time)] + list(zip(columns, values))))
+        return data
+
+    def Run(self):
+        err = None
+        while True:
+            # Find sensor
+            sensor = self.GetSensorByName(self._sensor_name)
+            if not sensor:
+                err = "no sensor"; break
+
+            # Make sure that user owns sensor
+            if sensor["owner"] != self._user["id"]:
+                err = "owner mismatch"; break
+
+            if self._range_size < 0:
+                err = "bad range size"; break
+
+            # Filter applied by client defines how skipped values are restored
+            options = self.GetSensorOptions(sensor["id"])
+            sensor_filter = options.get("filter", BacklogFilter.DEFAULT)
+            mode = BacklogFilter.GetReconstruction(sensor_filter)
+
+            # Columns are given by sensor type
+            if not SensorType.IsValid(sensor["type"]):
+                err = "unsupported sensor type"; break
+            columns = SensorType.GetColumns(sensor["type"])
+
+            # Read stored points, points around the range are needed to restore its edges
+            time_to = self._range_to or (1 << 62)
+            points = self.ReadPoints(sensor, self._range_from, time_to)
+            if points == None:
+                err = "read error"; break
+            if self._range_size:
+                before = self.ReadPointNear(sensor, self._range_from, True)
+                after = self.ReadPointNear(sensor, time_to, False)
+                if before == None or after == None:
+                    err = "read error"; break
+                points = before + points + after
+
+            # Either stored points or values reconstructed on evenly spaced times
+            if not self._range_size:
+                data = SensorType.RowsToEntries(sensor["type"], points)
+            elif not points:
+                data = []
+            else:
+                data = ActionDbSensorRead.Reconstruct(points,
+                  self._range_from or points[0][0], self._range_to or points[-1][0],
+                  self._range_size, mode, columns)
+
+            self.SetOut(OrderedDict({
+                "size" : len(data),
+                "filter" : sensor_filter,
+                "reconstruction" : mode if self._range_size else "none",
+                "data" : data}))
+            break # while
+        if err:
+            self.SetErr("Failed to read sensor :: " + err)
+
+#---------------------------------------------------------------------------------------------------
+class ActionDbSensorStats(ActionDb):
+    def __init__(self, path, auth_token, sensor_names, range_from, range_to, group, stats):
+        self._sensor_names = sensor_names
+        self._range_from = Utils.StrToInt(range_from)
+        self._range_to = Utils.StrToInt(range_to)
+        self._group = Utils.StrToInt(group)
+        self._stats = stats
+        super(ActionDbSensorStats, self).__init__("db-sensor-stats",
+          OrderedDict({"db-path":path, "auth-token":auth_token,
+                       "sensor-name":sensor_names, "range-from":range_from,
+                       "range-to":range_to, "group":group, "stats":stats}))
+
+    def Run(self):
+        err = None
+        while True:
+            stats = SensorStats.Parse(self._stats)
+            if not stats:
+                err = "bad stats"; break
+            if self._group < 0:
+                err = "bad group"; break
+
+            # Results are cached per sensor & query until sensor gets new data
+            time_to = self._range_to or (1 << 62)
+            query = "from=" + str(self._range_from) + ",to=" + str(time_to) + \
+                    ",group=" + str(self._group) + ",stats=" + self._stats
+            out = OrderedDict()
+            cached = 0
+            for name in self._sensor_names.split(","):
+                # Find sensor
+                sensor = self.GetSensorByName(name)
+                if not sensor:
+                    err = "no sensor :: name=" + name; break
+
+                # Make sure that user owns sensor
+                if sensor["owner"] != self._user["id"]:
+                    err = "owner mismatch :: name=" + name; break
+
+                if not SensorType.IsValid(sensor["type"]):
+                    err = "unsupported sensor type :: name=" + name; break
+
+                result = self.ReadSensorStats(sensor["id"], query)
+                if result != None:
+                    cached += 1
+                else:
+                    stamp = SensorStats.GetDbStamp(self._path)
+                    points = self.ReadPoints(sensor, self._range_from, time_to)
+                    if points == None:
+                        err = "read error :: name=" + name; break
+                    result = SensorStats.Compute(points, SensorType.GetColumns(sensor["type"]),
+                                                 self._group, stats)
+                    self.WriteSensorStats(sensor["id"], query, result, stamp)
+                out[name] = result
+            if err:
+                break
+
+            # Set out
+            self.SetOut(OrderedDict({"group"   : self._group,
+                                     "stats"   : [key for key, _, _ in stats],
+                                     "cached"  : cached,
+                                     "sensors" : out}))
+            break # while
+        if err:
+            self.SetErr("Failed to compute sensor stats :: " + err)
+
+#---------------------------------------------------------------------------------------------------
+class ActionDbSensorAlign(ActionDb):
+    # Sensors resampled onto common grid of times, one column per sensor & value
+    MODES = ["step", "linear"]
+    MAX_SIZE = 100000
+
+    def __init__(self, path, auth_token, sensor_names, range_from, range_to, step,
+                 align_mode, gap_limit):
+        self._sensor_names = sensor_names
+        self._range_from = Utils.StrToInt(range_from)
+        self._range_to = Utils.StrToInt(range_to)
+        self._step = Utils.StrToInt(step)
+        self._align_mode = align_mode
+        self._gap_limit = Utils.StrToInt(gap_limit)
+        super(ActionDbSensorAlign, self).__init__("db-sensor-align",
+          OrderedDict({"db-path":path, "auth-token":auth_token,
+                       "sensor-name":sensor_names, "range-from":range_from,
+                       "range-to":range_to, "step":step, "align-mode":align_mode,
+                       "gap-limit":gap_limit}))
+
+    def Align(streams, modes, grid, gap_limit):
+        # Streaming merge, every stream of points ordered by time is walked once &
+        # only points around current grid time are kept. Values are restored the same
+        # way as by db-sensor-read, points further apart than gap limit mark a gap.
+        columns = [[[] for _ in range(width)] for width, _ in streams]
+        state = [[None, next(points, None), points] for _, points in streams]
+        for time in grid:
+            for k, st in enumerate(state):
+                prev, nxt, points = st
+                while nxt != None and nxt[0] <= time:
+                    prev, nxt = nxt, next(points, None)
+                st[0], st[1] = prev, nxt
+
+                values = None
+                if prev != None and prev[0] == time:
+                    values = prev[1:]
+                elif prev != None and nxt != None and \
+                  (not gap_limit or nxt[0] - prev[0] <= gap_limit):
+                    values = prev[1:]
+                    if modes[k] == "linear":
+                        ratio = (time - prev[0]) / (nxt[0] - prev[0])
+                        values = [v0 + (v1 - v0) * ratio for v0, v1 in zip(prev[1:], nxt[1:])]
+                for i, column in enumerate(columns[k]):
+                    column.append(values[i] if values != None else None)
+        return columns
+
+    def Run(self):
+        import itertools
+
+        err = None
+        while True:
+            if self._step <= 0:
+                err = "bad step"; break
+            if self._align_mode and self._align_mode not in ActionDbSensorAlign.MODES:
+                err = "bad align mode"; break
+            if self._gap_limit < 0:
+                err = "bad gap limit"; break
+
+            # Find sensors
+            sensors = []
+            for name in self._sensor_names.split(","):
+                sensor = self.GetSensorByName(name)
+                if not sensor:
+                    err = "no sensor :: name=" + name; break
+                if sensor["owner"] != self._user["id"]:
+                    err = "owner mismatch :: name=" + name; break
+                if not SensorType.IsValid(sensor["type"]):
+                    err = "unsupported sensor type :: name=" + name; break
+                sensors.append(sensor)
+            if err:
+                break
+
+            # Unbounded range spans stored points of all sensors
+            time_from, time_to = self._range_from, self._range_to
+            if not time_from or not time_to:
+                first = [self.ReadPointNear(s, 0, False) for s in sensors]
+                last = [self.ReadPointNear(s, 1 << 62, True) for s in sensors]
+                if None in first or None in last:
+                    err = "read error"; break
+                time_from = time_from or min([p[0][0] for p in first if p], default=0)
+                time_to = time_to or max([p[0][0] for p in last if p], default=0)
+
+            # Grid is aligned to multiples of step
+            grid = range(time_from + (-time_from) % self._step, time_to + 1, self._step)
+            if len(grid) > ActionDbSensorAlign.MAX_SIZE:
+                err = "too many grid points :: size=" + str(len(grid)); break
+
+            # Each stream holds points of the range & points around it
+            streams = []
+            modes = []
+            frame = OrderedDict({"time" : list(grid)})
+            for sensor in sensors:
+                before = self.ReadPointNear(sensor, time_from, True)
+                points = self.IterPoints(sensor, time_from, time_to)
+                after = self.ReadPointNear(sensor, time_to, False)
+                if before == None or points == None or after == None:
+                    err = "read error :: name=" + sensor["name"]; break
+                columns = SensorType.GetColumns(sensor["type"])
+                streams.append((len(columns), itertools.chain(before, points, after)))
+                options = self.GetSensorOptions(sensor["id"])
+                modes.append(self._align_mode or BacklogFilter.GetReconstruction(
+                             options.get("filter", BacklogFilter.DEFAULT)))
+                for c in columns:
+                    frame[sensor["name"] + ("." + c if columns != ["value"] else "")] = None
+            if err:
+                break
+
+            # Fill columns of the frame
+            names = list(frame.keys())[1:]
+            columns = [c for cs in ActionDbSensorAlign.Align(streams, modes, grid,
+                                                             self._gap_limit) for c in cs]
+            if self._iter_err:
+                err = "read error :: " + self._iter_err; break
+            frame.update(zip(names, columns))
+
+            # Set out
+            self.SetOut(OrderedDict({"step"  : self._step,
+                                     "modes" : OrderedDict(zip([s["name"] for s in sensors],
+                                                               modes)),
+                                     "size"  : len(grid),
+                                     "frame" : frame}))
+            break # while
+        if err:
+            self.SetErr("Failed to align sensors :: " + err)
+
+#---------------------------------------------------------------------------------------------------
+class ActionDbSensorSeal(ActionDb):
+    def __init__(self, path, auth_token, sensor_name, seal_age):
+        self._sensor_name = sensor_name
+        self._seal_age = Utils.StrToInt(seal_age)
+        super(ActionDbSensorSeal, self).__init__("db-sensor-seal",
+          OrderedDict({"db-path":path, "auth-token":auth_token,
+                       "sensor-name":sensor_name, "seal-age":seal_age}))
+
+    def Run(self):
+        err = None
+        while True:
+            # Find sensor
+            sensor = self.GetSensorByName(self._sensor_name)
+            if not sensor:
+                err = "no sensor"; break
+
+            # Make sure that user owns sensor
+            if sensor["owner"] != self._user["id"]:
+                err = "owner mismatch"; break
+
+            if not SensorType.IsValid(sensor["type"]):
+                err = "unsupported sensor type"; break
+            columns = SensorType.GetColumns(sensor["type"])
+
+            # Chunk table is created on first seal
+            table, cond = self.GetSensorSource(sensor)
+            chunks = DbChunk.GetTable(sensor["id"])
+            if not self._db.CreateTable(chunks, DbChunk.SCHEME, True):
+                err = "create chunk table error"; break
+
+            # Only full chunks of points older than seal age are sealed, recent points
+            # stay in sensor table where they can be written & read row by row
+            time_seal = int(time.time()) - self._seal_age
+            select = "SELECT " + ", ".join(["time"] + columns) + " FROM " + table + \
+                     " WHERE " + cond + " AND time <= ? ORDER BY time LIMIT ?"
+            sealed = 0
+            while True:
+                rows = self._db.ReadRows(select, (time_seal, DbChunk.SIZE))
+                if rows == None:
+                    err = "read error"; break
+                if len(rows) < DbChunk.SIZE:
+                    break
+                chunk = (rows[0][0], rows[-1][0], len(rows),
+                         DbChunk.Encode(rows, len(columns)))
+                if not self._db.WriteRow(chunks, chunk):
+                    err = "write chunk error"; break
+                if not self._db.Execute("DELETE FROM " + table + " WHERE " + cond + \
+                                        " AND time <= ?", (rows[-1][0],)):
+                    err = "delete error"; break
+                sealed += len(rows)
+            if err:
+                self._db.Rollback()
+                break
+
+            # Set out
+            stats = self._db.ReadRows("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM " + chunks)
+            size = self.GetSensorSize(sensor)
+            if not stats or size == None:
+                err = "table size error"; break
+            self.SetOut(OrderedDict({"sealed-entries" : sealed,
+                                     "chunks"         : stats[0][0],
+                                     "chunk-entries"  : stats[0][1],
+                                     "size"           : size}))
+            break # while
+        if err:
+            self.SetErr("Failed to seal sensor :: " + err)
+
+#---------------------------------------------------------------------------------------------------
+class ActionDbMigrate(ActionDb):
+    # Points are copied to the new layout in batches, each committed on its own, so that
+    # writers are blocked only briefly. Sensor is switched to the new layout in one final
+    # transaction that also copies points written in the meantime.
+    BATCH_SIZE = 10000
+
+    def __init__(self, path, auth_token, sensor_name, db_layout):
+        self._sensor_name = sensor_name
+        self._db_layout = db_layout
+        super(ActionDbMigrate, self).__init__("db-migrate",
+          OrderedDict({"db-path":path, "auth-token":auth_token,
+                       "sensor-name":sensor_name, "db-layout":db_layout}))
+
+    def GetSensors(self):
+        # Given sensor or all sensors of the user
+        if self._sensor_name:
+            sensor = self.GetSensorByName(self._sensor_name)
+            return [sensor] if sensor else None
+        rows = self._db.ReadRows("SELECT rowid, * FROM sensors WHERE owner=? ORDER BY rowid",
+                                 (self._user["id"],))
+        sensors = [DataValidator.ValidateSensor(\
+          {"id":row[0], "name":row[1], "type":row[2], "owner":row[3]}) for row in rows or []]
+        return sensors if rows != None and all(sensors) else None
+
+    def Migrate(self, sensor):
+        # Returns number of batches or None
+        src_table, src_cond = self.GetSensorSource(sensor)
+        src, dst = sensor["layout"], self._db_layout
+        dst_final = DbLayout.GetTable(dst, sensor["id"])
+        dst_table = dst_final if dst == "points" else dst_final + "_migrate"
+        columns = ", ".join(["time"] + SensorType.GetColumns(sensor["type"]))
+        if dst == "points":
+            columns = str(sensor["id"]) + ", " + columns
+
+        # Rowid grows with every insert, so points written during migration are found
+        # after the last copied one. Time does so only for points written in order.
+        key = "rowid" if src == "table" else "time"
+        insert = "INSERT OR IGNORE INTO " + dst_table + " SELECT " + columns + \
+                 " FROM " + src_table + " WHERE " + src_cond + " AND " + key + " > ?"
+
+        err = batches = None
+        while True:
+            # Start from scratch, leftovers of interrupted migration are dropped
+            if dst == "points":
+                if not DbLayout.CreateTable(self._db, dst, sensor["type"], dst_table) or \
+                   not self._db.Execute("DELETE FROM " + dst_table + " WHERE " + \
+                                        DbLayout.GetCond(dst, sensor["id"])):
+                    err = "create table error"; break
+            elif not self._db.Execute("DROP TABLE IF EXISTS " + dst_table) or \
+                 not DbLayout.CreateTable(self._db, dst, sensor["type"], dst_table):
+                err = "create table error"; break
+            if not self._db.Commit():
+                err = "commit error"; break
+
+            # Copy batches, last key of the batch is looked up in the index
+            last = -1
+            batches = 0
+            while True:
+                rows = self._db.ReadRows("SELECT " + key + " FROM " + src_table + \
+                  " WHERE " + src_cond + " AND " + key + " > ? ORDER BY " + key + \
+                  " LIMIT 1 OFFSET ?", (last, ActionDbMigrate.BATCH_SIZE - 1))
+                if rows == None:
+                    err = "read error"; break
+                if not rows:
+                    break
+                if not self._db.Execute(insert + " AND " + key + " <= ?", (last, rows[0][0])) or \
+                   not self._db.Commit():
+                    err = "copy error"; break
+                last = rows[0][0]
+                batches += 1
+            if err:
+                break
+
+            # Switch layout, writers are locked out until commit
+            if not self._db.Execute("BEGIN IMMEDIATE"):
+                err = "lock error"; break
+            while True:
+                if not self._db.Execute(insert, (last if key == "rowid" else -1,)):
+                    err = "copy error"; break
+                if src == "points":
+                    ok = self._db.Execute("DELETE FROM " + src_table + " WHERE " + src_cond)
+                else:
+                    ok = self._db.Execute("DROP TABLE " + src_table)
+                if not ok:
+                    err = "drop error"; break
+                if dst != "points" and not self._db.Execute( \
+                  "ALTER TABLE " + dst_table + " RENAME TO " + dst_final):
+                    err = "rename error"; break
+                if not self.SetSensorOption(sensor["id"], "layout", dst):
+                    err = "write sensor options error"; break
+                if not self._db.Commit():
+                    err = "commit error"
+                break # while
+            if err:
+                self._db.Rollback()
+            break # while
+        if err:
+            self.LogErr("Failed to migrate sensor :: " + err + " name=" + sensor["name"])
+        return batches if not err else None
+
+    def Run(self):
+        err = None
+        while True:
+            sensors = self.GetSensors()
+            if not sensors:
+                err = "no sensor"; break
+
+            # Make sure that user owns sensors
+            if any(s["owner"] != self._user["id"] for s in sensors):
+                err = "owner mismatch"; break
+            if not DbLayout.IsValid(self._db_layout, "temperature"):
+                err = "unknown layout :: layout=" + str(self._db_layout); break
+
+            # Migrate sensors one by one, sensors already in the layout are skipped, as well
+            # as those of types that don't fit it, unless sensor was given explicitly
+            out = OrderedDict()
+            time_start = time.time()
+            for sensor in sensors:
+                self.GetSensorSource(sensor)
+                status = OrderedDict({"from" : sensor["layout"], "batches" : 0})
+                valid = SensorType.IsValid(sensor["type"]) and \
+                        DbLayout.IsValid(self._db_layout, sensor["type"])
+                if not valid and self._sensor_name:
+                    err = "unsupported layout :: layout=" + self._db_layout; break
+                if valid and sensor["layout"] != self._db_layout:
+                    status["batches"] = self.Migrate(sensor)
+                    if status["batches"] == None:
+                        err = "migration error :: name=" + sensor["name"]; break
+                    sensor["layout"] = self._db_layout
+                status["to"] = sensor["layout"]
+                status["size"] = self.GetSensorSize(sensor)
+                out[sensor["name"]] = status
+            if err:
+                break
+
+            # Set out
+            self.SetOut(OrderedDict({"layout"  : self._db_layout,
+                                     "sensors" : out,
+                                     "time-ms" : int((time.time() - time_start) * 1000)}))
+            break # while
+        if err:
+            self.SetErr("Failed to migrate db :: " + err)
+
 #---------------------------------------------------------------------------------------------------
 class ActionBacklog(Action):
-    def __init__(self, cmd, args):
+    # Optional backlog arguments and their defaults
+    OPTS = OrderedDict({
+        "backlog-store" : "",
+        "backlog-sync" : BacklogSync.DEFAULT,
+        "backlog-caps" : BacklogCaps.DEFAULT,
+        "backlog-format" : "json",
+        "backlog-filter" : BacklogFilter.DEFAULT,
+        "backlog-reorder" : BacklogReorder.DEFAULT})
+
+    def GetOpts(args):
+        return OrderedDict([(k, args.get(k) if args.get(k) != None else v)
+                            for k, v in ActionBacklog.OPTS.items()])
+
+    def __init__(self, cmd, args, opts):
         self._backlog_dir = args["backlog-path"]
-        self._sensor_name = args["sensor-name"]
+        self._sensor_name = args.get("sensor-name")
+        self._backlog_store = opts["backlog-store"]
+        self._backlog_sync = opts["backlog-sync"]
+        self._backlog_caps = opts["backlog-caps"]
+        self._backlog_format = opts["backlog-format"]
+        self._backlog_filter = opts["backlog-filter"]
+        self._backlog_reorder = opts["backlog-reorder"]
         self._backlog = None
+        args.update(opts)
         super(ActionBacklog, self).__init__(cmd, args)
 
-    def Prepare(self):
-        # Call parent
-        Action.Prepare(self)
-        if not self.Ok():
+    def Prepare(self):
+        # Call parent
+        Action.Prepare(self)
+        if not self.Ok():
+            return
+
+        # Validate durability policy
+        if not BacklogSync.Parse(self._backlog_sync):
+            self.SetErr("Bad backlog sync policy :: sync=" + str(self._backlog_sync))
+            return
+
+        # Validate size caps
+        if BacklogCaps.Parse(self._backlog_caps) == None:
+            self.SetErr("Bad backlog caps :: caps=" + str(self._backlog_caps))
+            return
+
+        # Validate change-based filter
+        if BacklogFilter.Parse(self._backlog_filter) == None:
+            self.SetErr("Bad backlog filter :: filter=" + str(self._backlog_filter))
+            return
+
+        # Validate reorder window
+        if BacklogReorder.Parse(self._backlog_reorder) == None:
+            self.SetErr("Bad backlog reorder :: reorder=" + str(self._backlog_reorder))
+            return
+
+        # Validate format of the records
+        if self._backlog_format not in ["json", "binary"] or \
+          self._backlog_format == "binary" and self._backlog_store:
+            self.SetErr("Bad backlog format :: format=" + str(self._backlog_format))
+            return
+
+        # Validate name of the stream
+        if self._backlog_store and self._sensor_name != None and \
+          not BacklogStore.IsNameValid(self._sensor_name):
+            self.SetErr("Bad stream name :: name=" + str(self._sensor_name))
             return
 
         # Create backlog
         LogTab.PushLogTab(self)
-        self._backlog = Backlog(self._backlog_dir, self._sensor_name)
+        if self._backlog_store:
+            def cb():
+                return BacklogStore(self._backlog_dir, self._backlog_store,
+                  self._backlog_sync, self._backlog_caps)
+            key = (self._backlog_dir, self._backlog_store)
+        else:
+            def cb():
+                backlog = BacklogBinary if self._backlog_format == "binary" else Backlog
+                return backlog(self._backlog_dir, self._sensor_name,
+                  self._backlog_sync, self._backlog_caps)
+            key = (self._backlog_dir, self._sensor_name, self._backlog_format)
+
+        # Pooled backlog is locked only once, it is keyed by its files so that
+        # policies of the current action are applied to the shared object
+        if Pool.IsEnabled():
+            self._backlog = Pool.GetBacklog(key, cb)
+            if not self._backlog:
+                self.SetErr("Failed to lock backlog")
+                return
+            self._backlog.SetPolicy(self._backlog_sync, self._backlog_caps)
+        else:
+            self._backlog = cb()
+            if not self._backlog.Lock():
+                self.SetErr("Failed to lock backlog")
+                return
 
-        # Acquire lock
-        if not self._backlog.Lock():
-            self.SetErr("Failed to lock backlog")
+        # Store holds streams of all sensors
+        if self._backlog_store and self._sensor_name != None:
+            self._backlog = self._backlog.Stream(self._sensor_name)
+            self._backlog.Lock()
 
     def Finalize(self):
         # Release lock
-        if self._backlog:
+        if self._backlog and not Pool.IsEnabled():
             self._backlog.Unlock()
 
         Action.Finalize(self)
 
+    def Filter(self, name, data):
+        # Returns entries that pass the filter and the filter to commit once they are written
+        f = BacklogFilter(self._backlog_filter,
+              self._backlog_dir + "/" + str(name) + BacklogFilter.STATE_EXTENSION)
+        if not f.IsEnabled() or not isinstance(data, list):
+            return data, None
+        return f.Apply(data), f
+
+    def Reorder(self, name, data, time_last):
+        # Returns entries that left the reorder window and the window to commit
+        # once they are written
+        r = BacklogReorder(self._backlog_reorder, self._backlog_dir + "/" + str(name))
+        if not r.IsEnabled() or not isinstance(data, list):
+            return data, None
+        return r.Apply(data, time_last), r
+
+    def SetReorderStatus(status, r):
+        if r:
+            status["buffered-entries"] = r.GetBufferSize()
+            status["late-entries"] = r.GetLateSize()
+
 #---------------------------------------------------------------------------------------------------
 class ActionBacklogWrite(ActionBacklog):
-    def __init__(self, backlog_dir, sensor_name, data):
+    def __init__(self, backlog_dir, sensor_name, data, opts):
         self._data = data
         super(ActionBacklogWrite, self).__init__("backlog-write",
-          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name, "data":data}))
+          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name, "data":data}),
+          opts)
 
     def Run(self):
         err = None
         while True:
+            data = self._data
+            if isinstance(data, str):
+                data = Utils.StrToJson(data)
+
+            # Hold back entries within reorder window, so that late ones can be merged
+            status = self._backlog.GetStatus() or {}
+            ordered, r = self.Reorder(self._sensor_name, data, status.get("time-last", 0))
+
+            # Drop entries that do not change the value enough
+            kept, f = self.Filter(self._sensor_name, ordered)
+
             # Write to backlog
-            rc, entries_num = self._backlog.Write(self._data)
+            rc, entries_num = self._backlog.Write(kept) if kept != [] else (True, 0)
             if not rc:
-                err = "write error"; break
+                err = "write error :: " + str(self._backlog._err); break
+            if f and not f.Commit():
+                err = "filter error"; break
+            if r and not r.Commit():
+                err = "reorder error"; break
+            LastValues.Update(self._sensor_name, ordered)
+            Subscribers.Publish(self._sensor_name, kept)
 
             # Get status
             status = self._backlog.GetStatus()
@@ -1073,6 +4234,79 @@ class ActionBacklogWrite(ActionBacklog):
             # Set status
             status["new-entries"] = entries_num
             status.move_to_end("new-entries")
+            if f:
+                status["filtered-entries"] = len(ordered) - len(kept)
+            ActionBacklog.SetReorderStatus(status, r)
+            if self._backlog._compacted:
+                status["compacted-entries"] = self._backlog._compacted
+            self.SetOut(status)
+
+            break # while
+        if err:
+            self.SetErr("Failed to write backlog :: " + err);
+
+            # Report what backlog already holds, so that client can skip it
+            self.SetOut(self._backlog.GetStatus())
+
+#---------------------------------------------------------------------------------------------------
+class ActionBacklogWriteMulti(ActionBacklog):
+    def __init__(self, backlog_dir, data, opts):
+        self._data = data
+        super(ActionBacklogWriteMulti, self).__init__("backlog-write-multi",
+          OrderedDict({"backlog-path":backlog_dir, "data":data}), opts)
+
+    def Prepare(self):
+        # Streams of many sensors can only be written to the store
+        if not self._backlog_store:
+            Action.Prepare(self)
+            self.SetErr("Error, backlog store is required")
+            return
+        ActionBacklog.Prepare(self)
+
+    def Run(self):
+        err = None
+        while True:
+            # Data must be a dict of sensor name -> list of entries
+            data = self._data
+            if isinstance(data, str):
+                data = Utils.StrToJson(data)
+            if not data or not isinstance(data, dict):
+                err = "data is not a dict"; break
+
+            # Validate names of the streams
+            for name in data.keys():
+                if not BacklogStore.IsNameValid(name):
+                    err = "bad stream name :: name=" + str(name); break
+            if err: break
+
+            # Hold back entries within reorder window & drop entries that do not
+            # change the value enough
+            filters = []
+            windows = OrderedDict()
+            ordered = OrderedDict()
+            for name in data.keys():
+                meta = self._backlog.GetStreamMeta(name) or {}
+                data[name], r = self.Reorder(name, data[name], meta.get("time-last", 0))
+                if r:
+                    windows[name] = r
+                ordered[name] = data[name]
+                data[name], f = self.Filter(name, data[name])
+                if f:
+                    filters.append(f)
+
+            # Write all streams at once
+            status = self._backlog.WriteMulti(data)
+            if not status:
+                err = "write error :: " + str(self._backlog._err); break
+            if not all([f.Commit() for f in filters]):
+                err = "filter error"; break
+            if not all([r.Commit() for r in windows.values()]):
+                err = "reorder error"; break
+            for name, entries in ordered.items():
+                LastValues.Update(name, entries)
+                Subscribers.Publish(name, data[name])
+            for name, r in windows.items():
+                ActionBacklog.SetReorderStatus(status[name], r)
             self.SetOut(status)
 
             break # while
@@ -1081,9 +4315,9 @@ class ActionBacklogWrite(ActionBacklog):
 
 #---------------------------------------------------------------------------------------------------
 class ActionBacklogClear(ActionBacklog):
-    def __init__(self, backlog_dir, sensor_name):
+    def __init__(self, backlog_dir, sensor_name, opts):
         super(ActionBacklogClear, self).__init__("backlog-clear",
-          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name}))
+          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name}), opts)
 
     def Run(self):
         err = None
@@ -1100,17 +4334,33 @@ class ActionBacklogClear(ActionBacklog):
         if err:
             self.SetErr("Failed to clear backlog :: " + err)
 
+#---------------------------------------------------------------------------------------------------
+class ActionBacklogStatus(ActionBacklog):
+    def __init__(self, backlog_dir, sensor_name, opts):
+        super(ActionBacklogStatus, self).__init__("backlog-status",
+          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name}), opts)
+
+    def Run(self):
+        if not self.SetOut(self._backlog.GetStatus()):
+            self.SetErr("Failed to get backlog status :: no status")
+
 #---------------------------------------------------------------------------------------------------
 class ActionBacklogRead(ActionBacklog):
-    def __init__(self, backlog_dir, sensor_name):
+    def __init__(self, backlog_dir, sensor_name, range_from, range_to, opts):
+        self._range_from = Utils.StrToInt(range_from)
+        self._range_to = Utils.StrToInt(range_to)
         super(ActionBacklogRead, self).__init__("backlog-read",
-          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name}))
+          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name,
+                       "range-from":range_from, "range-to":range_to}), opts)
 
     def Run(self):
         err = None
         while True:
             # Read backlog
-            data = self._backlog.Read()
+            if self._range_from or self._range_to:
+                data = self._backlog.ReadRange(self._range_from, self._range_to)
+            else:
+                data = self._backlog.Read()
             if not data:
                 err = "no data"; break
 
@@ -1127,42 +4377,194 @@ class ActionBacklogRead(ActionBacklog):
         if err:
             self.SetErr("Failed to read backlog :: " + err)
 
+#---------------------------------------------------------------------------------------------------
+class ActionBacklogUpload(ActionBacklog):
+    CHUNK_SIZE = 500
+    TIMEOUT = 30
+
+    def __init__(self, backlog_dir, sensor_name, proto, addr, port, chunk_size, opts,
+                 retry_policy=Retry.DEFAULT):
+        self._proto = proto
+        self._addr = addr
+        self._port = port
+        self._chunk_size = Utils.StrToInt(chunk_size)
+        self._retry_policy = retry_policy
+        super(ActionBacklogUpload, self).__init__("upload-backlog",
+          OrderedDict({"backlog-path":backlog_dir, "sensor-name":sensor_name,
+                       "proto":proto, "addr":addr, "port":port,
+                       "chunk-size":chunk_size, "retry-policy":retry_policy}), opts)
+
+    def SendRequest(self, connection, body):
+        # Returns response status & error, status is None when request may be retried
+        try:
+            connection.request("POST", "/api", body=body,
+              headers={"Content-type":"application/json"})
+            resp = connection.getresponse()
+            resp_data = resp.read()
+        except:
+            return None, "send error"
+
+        status = Utils.StrToJson(resp_data)
+        if resp.status != 200 or not status or not isinstance(status, dict):
+            return None, "bad response :: reason=" + str(resp.reason) + \
+                                       " status=" + str(resp.status)
+        if not status.get("success"):
+            return status, "server error :: " + str(status.get("error"))
+        return status, None
+
+    def GetWatermark(status):
+        # Time of the last entry stored on server, reported even by failed writes
+        out = status.get("out") if status else None
+        return out.get("time-last", 0) if isinstance(out, dict) else 0
+
+    def Run(self):
+        import http.client
+
+        chunks = entries = time_acked = watermark = 0
+        err = None
+        while True:
+            if not self._chunk_size or self._chunk_size <= 0:
+                err = "bad chunk size"; break
+            if Retry.Parse(self._retry_policy) == None:
+                err = "bad retry policy :: policy=" + str(self._retry_policy); break
+            retry = Retry(self._retry_policy, self._addr, self._port)
+
+            # Single keep-alive connection for all requests
+            if self._proto == "https":
+                connection = http.client.HTTPSConnection(self._addr, self._port,
+                  timeout=ActionBacklogUpload.TIMEOUT)
+            else:
+                connection = http.client.HTTPConnection(self._addr, self._port,
+                  timeout=ActionBacklogUpload.TIMEOUT)
+            name = Utils.JsonToStr(self._sensor_name).encode("utf-8")
+
+            # Transport failures are retried with backoff on the same connection,
+            # which reconnects once closed, server errors are final
+            result = [None, None]
+            def Send(body):
+                result[:] = self.SendRequest(connection, body)
+                if result[0] == None:
+                    connection.close()
+                    return result[1]
+                return None
+
+            # Entries up to server watermark were already acknowledged, e.g. by upload
+            # that failed before trimming, servers without status get everything
+            err = retry.Run(lambda: Send(
+              b'{"action": "backlog-status", "sensor-name": ' + name + b'}'))
+            if err:
+                connection.close(); break
+            status = result[0]
+            watermark = time_acked = ActionBacklogUpload.GetWatermark(status)
+
+            # Stream newer entries, stop at first chunk that was not acknowledged
+            reader = self._backlog.ReadChunks(self._chunk_size,
+              watermark + 1 if watermark else 0)
+            try:
+                for chunk, size, time_last in reader:
+                    # Records are spliced into request as they are stored, without decoding
+                    body = b'{"action": "backlog-write", "sensor-name": ' + name + \
+                           b', "data": ' + chunk + b'}'
+                    err = retry.Run(lambda: Send(body)) or result[1]
+                    if err: break
+                    chunks += 1
+                    entries += size
+                    time_acked = time_last
+            except:
+                err = "read error"
+
+            # Unmap backlog before it gets trimmed
+            reader.close()
+            connection.close()
+            break # while
+
+        # Drop acknowledged entries even if upload did not finish
+        if time_acked and not self._backlog.Trim(time_acked):
+            err = "trim error" + (" :: " + err if err else "")
+        if err:
+            self.SetErr("Failed to upload backlog :: " + err + \
+                        " :: uploaded-entries=" + str(entries))
+            return
+
+        # Set status
+        status = self._backlog.GetStatus()
+        if not status:
+            self.SetErr("Failed to upload backlog :: no status")
+            return
+        status["watermark"] = watermark
+        status["uploaded-chunks"] = chunks
+        status["uploaded-entries"] = entries
+        self.SetOut(status)
+
+#---------------------------------------------------------------------------------------------------
+class ActionSensorsCurrent(ActionDb):
+    def __init__(self, db_path, auth_token):
+        super(ActionSensorsCurrent, self).__init__("sensors-current",
+          OrderedDict({"db-path":db_path, "auth-token":auth_token}))
+
+    def Run(self):
+        err = None
+        while True:
+            # Only sensors owned by the user are reported
+            rows = self._db.ReadRows("SELECT name FROM sensors WHERE owner=?",
+                                     (self._user["id"],))
+            if rows == None:
+                err = "read sensors error"; break
+            names = set([row[0] for row in rows])
+
+            # Server answers from memory, otherwise the table is read
+            values = LastValues.Get() if LastValues.IsEnabled() else \
+                     LastValues.Read(self._db)
+            if values == None:
+                err = "read error"; break
+
+            now = int(time.time())
+            sensors = OrderedDict()
+            for name in sorted([n for n in values.keys() if n in names]):
+                entry = OrderedDict({"time" : values[name]["time"],
+                                     "age"  : now - values[name]["time"]})
+                entry.update([(k, v) for k, v in values[name].items() if k != "time"])
+                sensors[name] = entry
+            self.SetOut(OrderedDict({"size" : len(sensors), "sensors" : sensors}))
+            break # while
+        if err:
+            self.SetErr("Failed to read current sensors :: " + err)
+
 #---------------------------------------------------------------------------------------------------
 class ActionReadSensorDs18b20(Action):
     DS18B20_PATH = "/sys/bus/w1/devices"
     DS18B20_DATA = "temperature" # "w1_slave"
 
-    def __init__(self, id, random):
+    def __init__(self, id, random, path=DS18B20_PATH):
         self._id = id
         self._random = random
+        self._path = path
         super(ActionReadSensorDs18b20, self).__init__("sensor-ds18b20",
-          OrderedDict({"sensor-id":id, "random":random}))
+          OrderedDict({"sensor-id":id, "random":random, "ds18b20-path":path}))
 
-    def Run(self):
-        value = None
-        if self._random:
-            value = random.randrange(-10, 100)
+    def ReadProbe(path, id, rand):
+        # Returns value & error, reading blocks for the whole w1 conversion
+        if rand:
+            return random.randrange(-10, 100), None
 
-        else:
-            err = None
-            while True:
-                # Load kernel modules
-#                LogTab.PushLogTab(self)
-#                if not ShellCmd("sudo modprobe w1-gpio && sudo modprobe w1-therm").Ok():
-#                    err = "load modules error"; break
+        # Load kernel modules
+#        LogTab.PushLogTab(self)
+#        if not ShellCmd("sudo modprobe w1-gpio && sudo modprobe w1-therm").Ok():
+#            return None, "load modules error"
 
-                # Read sensor data
-                value_raw = Utils.ReadFile( \
-                  self.DS18B20_PATH + "/" + str(self._id) + "/" + self.DS18B20_DATA)
+        # Read sensor data
+        value_raw = Utils.ReadFile( \
+          path + "/" + str(id) + "/" + ActionReadSensorDs18b20.DS18B20_DATA)
 
-                value = Utils.StrToInt(value_raw)
-                if not value:
-                    err = "no value :: value_raw=" + str(value_raw); break
-                value = value / 1000
+        # Zero is a valid reading, so test raw value instead
+        if not value_raw or not value_raw.strip().lstrip("-").isdigit():
+            return None, "no value :: value_raw=" + str(value_raw)
+        return Utils.StrToInt(value_raw) / 1000, None
 
-                break # while
-            if err:
-                self.SetErr("Failed to read sensor Ds18b20 :: " + err)
+    def Run(self):
+        value, err = ActionReadSensorDs18b20.ReadProbe(self._path, self._id, self._random)
+        if err:
+            self.SetErr("Failed to read sensor Ds18b20 :: " + err)
 
         # Save sensor data
         data = OrderedDict()
@@ -1172,34 +4574,145 @@ class ActionReadSensorDs18b20(Action):
         self.SetOut(data)
 
 #---------------------------------------------------------------------------------------------------
-class ActionReadSensorWttrinTemp(Action):
-    WTTRIN_URL = "https://wttr.in"
-    WTTRIN_CACHE = "/tmp/wttrin.json"
+class ActionSampleMulti(Action):
+    # Samples many sensors at once & writes them to their backlogs in one batch.
+    # Sensors are given as comma separated list of <sensor-name>:<source>.
+    def __init__(self, cmd, backlog_dir, sensors, source_args, opts):
+        self._backlog_dir = backlog_dir
+        self._sensors = sensors
+        self._opts = opts
+        args = OrderedDict({"backlog-path":backlog_dir, "sensors":sensors})
+        args.update(source_args)
+        args.update(opts)
+        super(ActionSampleMulti, self).__init__(cmd, args)
+
+    def ParseSensors(sensors):
+        sources = OrderedDict()
+        for item in sensors.split(","):
+            name, sep, source = item.strip().partition(":")
+            if not sep or not name or not source or name in sources:
+                return None
+            sources[name] = source
+        return sources
+
+    def Sample(self, sources):
+        # Override, returns dict of sensor name -> (value, error)
+        return None
+
+    def Run(self):
+        status = OrderedDict()
+        err = None
+        while True:
+            sources = ActionSampleMulti.ParseSensors(self._sensors)
+            if not sources:
+                err = "bad sensors :: sensors=" + str(self._sensors); break
+
+            # All sensors share one timestamp taken when sampling starts
+            time_sample = Utils.GetUnixTimestamp()
+            time_start = time.time()
+            values = self.Sample(sources)
+
+            data = OrderedDict()
+            sensors = OrderedDict()
+            for name, (value, err_sensor) in values.items():
+                if err_sensor:
+                    sensors[name] = OrderedDict({"error" : err_sensor})
+                    continue
+                sensors[name] = OrderedDict({"value" : value})
+                data[name] = [OrderedDict({"time" : time_sample, "value" : value})]
+            status["time"] = time_sample
+            status["sample-time"] = round(time.time() - time_start, 3)
+            status["sensors"] = sensors
+            if not data:
+                err = "no values"; break
+
+            # Write all values at once when store is used, otherwise backlog by backlog
+            if self._opts["backlog-store"]:
+                LogTab.PushLogTab(self)
+                action = ActionBacklogWriteMulti(self._backlog_dir, data, self._opts)
+                if not action.Ok():
+                    err = action.Err(); break
+                for name, s in action.OutJson().items():
+                    sensors[name]["backlog"] = s
+            else:
+                for name, entries in data.items():
+                    LogTab.PushLogTab(self)
+                    action = ActionBacklogWrite(self._backlog_dir, name, entries, self._opts)
+                    sensors[name]["backlog"] = action.OutJson() if action.Ok() \
+                                                 else OrderedDict({"error" : action.Err()})
+                    if not action.Ok():
+                        err = "write error :: sensor=" + name
+                if err: break
+
+            # Report sensors that failed
+            failed = [name for name, s in sensors.items() if "error" in s]
+            if failed:
+                err = "read error :: sensors=" + ",".join(failed); break
+
+            break # while
+        self.SetOut(status)
+        if err:
+            self.SetErr("Failed to sample sensors :: " + err)
+
+#---------------------------------------------------------------------------------------------------
+class ActionSampleDs18b20Multi(ActionSampleMulti):
+    # Sources are probe ids
+    def __init__(self, backlog_dir, sensors, random, path, opts):
+        self._random = random
+        self._path = path
+        super(ActionSampleDs18b20Multi, self).__init__("sample-ds18b20-multi",
+          backlog_dir, sensors, OrderedDict({"random":random, "ds18b20-path":path}), opts)
+
+    def Sample(self, sources):
+        from concurrent.futures import ThreadPoolExecutor
 
-    def __init__(self, id):
+        # Conversions of all probes run concurrently
+        with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+            futures = OrderedDict([(name, pool.submit(ActionReadSensorDs18b20.ReadProbe,
+                                      self._path, id, self._random))
+                                   for name, id in sources.items()])
+        return OrderedDict([(name, future.result()) for name, future in futures.items()])
+
+#---------------------------------------------------------------------------------------------------
+class ActionReadSensorWttrinTemp(Action):
+    def __init__(self, id, url=Wttrin.URL, ttl=Wttrin.TTL, sensor_type="temperature"):
         self._id = id
+        self._url = url
+        self._ttl = Utils.StrToInt(ttl)
+        self._sensor_type = sensor_type
         super(ActionReadSensorWttrinTemp, self).__init__("sensor-wttrin-temp",
-          OrderedDict({"sensor-id":id}))
+          OrderedDict({"sensor-id":id, "wttrin-url":url, "wttrin-ttl":ttl,
+                       "sensor-type":sensor_type}))
+
+    def GetFields(sensor_type):
+        # Returns wttr.in fields read by sensor type, mapped to keys of its entries
+        if not SensorType.IsValid(sensor_type):
+            return None
+        columns = SensorType.GetColumns(sensor_type)
+        if columns == ["value"]:
+            field = "temp" if sensor_type == "temperature" else sensor_type
+            fields = OrderedDict({"value" : field})
+        else:
+            fields = OrderedDict([(c, c) for c in columns])
+        return fields if set(fields.values()) <= set(Wttrin.FIELDS.keys()) else None
 
     def Run(self):
-        value = None
+        values = None
         err = None
         while True:
-            LogTab.PushLogTab(self)
-            # Read wttr.in --->  https://wttr.in/Riga?format=j1
-            url = self.WTTRIN_URL + "/" + self._id + "?format=j1"
-            if not ShellCmd("curl " + url + " -o " + self.WTTRIN_CACHE).Ok():
-                err = "curl fetch error"; break
+            fields = ActionReadSensorWttrinTemp.GetFields(self._sensor_type)
+            if not fields:
+                err = "unsupported sensor type :: type=" + str(self._sensor_type); break
 
-            cmd = ShellCmd("cat " + self.WTTRIN_CACHE + " | jq '.current_condition[0].temp_C | tonumber'")
-            if not cmd.Ok():
-                err = "json parse error"; break
+            # Read wttr.in --->  https://wttr.in/Riga?format=j1
+            LogTab.PushLogTab(self)
+            body, err = Wttrin(self._id, self._url, self._ttl).Fetch()
+            if err: break
 
-            # Read sensor data
-            value_raw = cmd.OutStr()
-            value = Utils.StrToInt(value_raw)
-            if not value:
-                err = "no value :: value=" + str(value_raw); break
+            # Read sensor data, all fields of multi-value sensor come from single fetch
+            values = Wttrin.GetFields(body, list(fields.values()))
+            if not values:
+                err = "no value"; break
 
             break # while
         if err:
@@ -1207,25 +4720,63 @@ class ActionReadSensorWttrinTemp(Action):
 
         # Save sensor data
         data = OrderedDict()
-        if value != None:
+        if values != None:
             data["time"] = Utils.GetUnixTimestamp()
-            data["value"] = value
+            for key, field in fields.items():
+                data[key] = values[field]
         self.SetOut(data)
 
+#---------------------------------------------------------------------------------------------------
+class ActionSampleWttrinMulti(ActionSampleMulti):
+    # Sources are weather fields of one location, all fed by single fetch
+    def __init__(self, backlog_dir, sensors, id, url, ttl, opts):
+        self._id = id
+        self._url = url
+        self._ttl = Utils.StrToInt(ttl)
+        super(ActionSampleWttrinMulti, self).__init__("sample-wttrin-multi",
+          backlog_dir, sensors,
+          OrderedDict({"sensor-id":id, "wttrin-url":url, "wttrin-ttl":ttl}), opts)
+
+    def Sample(self, sources):
+        LogTab.PushLogTab(self)
+        body, err = Wttrin(self._id, self._url, self._ttl).Fetch()
+        values = OrderedDict()
+        for name, field in sources.items():
+            if err:
+                values[name] = (None, err)
+            elif field not in Wttrin.FIELDS:
+                values[name] = (None, "unknown field :: field=" + field)
+            else:
+                v = Wttrin.GetFields(body, [field])
+                values[name] = (v[field], None) if v else (None, "no value")
+        return values
+
 #---------------------------------------------------------------------------------------------------
 class ActionHttpServer(Action):
-    ALLOWED_ACTIONS = ["backlog-write"]
+    ALLOWED_ACTIONS = ["backlog-write", "backlog-write-multi", "backlog-status",
+                       "sensors-current"]
     OVERRIDE_ARGS = None
-
-    def __init__(self, cmd, addr, port, backlog_path, db_path):
+    SUBSCRIBE_PATH = "/api/subscribe"
+    # Subscribers should pass auth-token in this header, browser EventSource can not set
+    # headers, so query is accepted as well, but then the token is part of the URL and
+    # may end up in logs of proxies
+    AUTH_HEADER = "X-Auth-Token"
+    REDACTED = "<redacted>"
+    # Requests are handled in threads, so that subscribers can be streamed to, but
+    # actions run one at a time
+    _lock = None
+
+    def __init__(self, cmd, addr, port, backlog_path, db_path, backlog_opts):
         self._addr = addr
         self._port = port
+        self._backlog_sync = backlog_opts["backlog-sync"]
 
         # Prepare list of overrides
         ActionHttpServer.OVERRIDE_ARGS = {
             "backlog-path" : backlog_path, 
             "db-path" : db_path
         }
+        ActionHttpServer.OVERRIDE_ARGS.update(backlog_opts)
         out.Write("Override map: ")
         for key, value in ActionHttpServer.OVERRIDE_ARGS.items():
             out.Write(" >> " + str(key) + " -> " + str(value))
@@ -1233,13 +4784,32 @@ class ActionHttpServer(Action):
         super(ActionHttpServer, self).__init__(cmd, 
           OrderedDict({"addr":addr, "port":port}))
 
+    def Prepare(self):
+        # Call parent
+        Action.Prepare(self)
+        if not self.Ok():
+            return
+
+        # Latest entries of sensors are served from memory
+        LastValues.Enable(ActionHttpServer.OVERRIDE_ARGS["db-path"])
+
+        import threading
+        ActionHttpServer._lock = threading.Lock()
+
+        # Coalesce backlog writes of all requests into one periodic flush
+        sync = BacklogSync.Parse(self._backlog_sync)
+        if not sync:
+            self.SetErr("Bad backlog sync policy :: sync=" + str(self._backlog_sync))
+        elif sync[0] == "interval":
+            BacklogSync.StartFlusher(sync[1])
+
     def SendResponse(self, action, status_code):
         # Override
         return None
 
     def SendErrorResponse(self, method):
         return self.SendResponse(
-            ActionError(method + " not supported", self.PrepateRequest(method)), 200)
+            ActionError(method + " not supported", {"method" : method}), 200)
 
     def ProcessRequest(self, ip, port, json):
         # Log
@@ -1258,23 +4828,123 @@ class ActionHttpServer(Action):
             json = {}
 
         # Run action & send response
-        return self.SendResponse(
-            RunAction(json, ActionHttpServer.ALLOWED_ACTIONS), 200)
+        with ActionHttpServer._lock:
+            return self.SendResponse(
+              RunAction(json, ActionHttpServer.ALLOWED_ACTIONS), 200)
+
+    def GetOwnedSensors(auth_token):
+        # Names of sensors owned by user of the token, None if token is not valid
+        path = ActionHttpServer.OVERRIDE_ARGS.get("db-path") or ""
+        if not auth_token or not Utils.IsFilePresent(path):
+            return None
+        names = None
+        db = Db(path)
+        if db.Open():
+            row = db.ReadRow("users", ("token", auth_token))
+            rows = db.ReadRows("SELECT name FROM sensors WHERE owner=?", (row[0],)) \
+                   if row else None
+            names = set([r[0] for r in rows]) if rows != None else None
+        db.Close()
+        return names
+
+    def ReadReplay(self, name, time_from, auth_token):
+        # Entries of sensor newer than given time, older ones are moved from backlog to DB,
+        # token & owner of the sensor are checked by caller
+        replay = []
+        args = dict(ActionHttpServer.OVERRIDE_ARGS)
+        args.update({"sensor-name" : name, "range-from" : time_from + 1, "range-to" : 0,
+                     "range-size" : 0, "auth-token" : auth_token})
+        for action_name in ["db-sensor-read", "backlog-read"]:
+            try:
+                action = RunActionOne(action_name, dict(args))
+            except:
+                log.Err("Failed to read replay :: action=" + action_name + " name=" + name)
+                continue
+            out = action.OutJson() if action.Ok() else None
+            if out and out.get("data"):
+                replay.append((name, out["data"]))
+        return replay
+
+    def RedactUrl(line):
+        import re
+        return re.sub(r"(auth-token=)[^&\s]*", r"\g<1>" + ActionHttpServer.REDACTED, line)
+
+    def ProcessSubscribe(self, ip, port, query, last_event_id=None, auth_token=None):
+        # Returns action with error or stream of Server-Sent Events. Query holds comma-
+        # separated names of sensors (all sensors of the user if empty), time to resume
+        # from, size of the buffer & what to do when it overflows, resume needs names.
+        # Token from header takes precedence over the one in query, neither is logged
+        # nor echoed.
+        auth_token = auth_token or query.get("auth-token")
+        query = OrderedDict([(k, ActionHttpServer.REDACTED if k == "auth-token" else v)
+                             for k, v in query.items()])
+        log.Dbg("." * 80)
+        log.Dbg("Incoming subscription :: "                         + \
+                "time=" + str(Utils.GetTimestamp())                 + \
+                ", ip=" + str(ip)                                   + \
+                ", port=" + str(port)                               + \
+                ", query=" + Utils.JsonToStr(query))
+
+        names = list(filter(None, query.get("sensor-name", "").split(",")))
+        time_from = Utils.StrToInt(last_event_id or query.get("range-from", 0))
+        size = Utils.StrToInt(query.get("buffer-size", Subscribers.BUFFER_SIZE))
+        policy = query.get("overflow", Subscription.POLICIES[0])
+        err = None
+        while True:
+            if not all([BacklogStore.IsNameValid(n) and "/" not in n for n in names]):
+                err = "bad sensor name"; break
+            if not 0 < size <= Subscribers.BUFFER_MAX:
+                err = "bad buffer size"; break
+            if policy not in Subscription.POLICIES:
+                err = "bad overflow policy"; break
+            if time_from and not names:
+                err = "resume needs sensor names"; break
+
+            # Only sensors of the user are streamed & replayed
+            with ActionHttpServer._lock:
+                owned = ActionHttpServer.GetOwnedSensors(auth_token)
+            if owned == None:
+                err = "bad auth-token"; break
+            foreign = [n for n in names if n not in owned]
+            if foreign:
+                err = "owner mismatch :: name=" + foreign[0]; break
+            names = names or sorted(owned)
+            break # while
+        if err:
+            return ActionError("Failed to subscribe :: " + err, query), None
+
+        def read_replay():
+            replay = []
+            with ActionHttpServer._lock:
+                for name in names:
+                    replay += self.ReadReplay(name, time_from, auth_token)
+            return replay
+        return None, Subscribers.Stream(names, size, policy, time_from, read_replay)
 
 #---------------------------------------------------------------------------------------------------
 class ActionHttpServerFlask(ActionHttpServer):
-    def __init__(self, addr, port, backlog_path, db_path):
+    def __init__(self, addr, port, backlog_path, db_path, backlog_opts):
         super(ActionHttpServerFlask, self).__init__("http-server-flask", 
-          addr, port, backlog_path, db_path)
+          addr, port, backlog_path, db_path, backlog_opts)
 
     def SendResponse(self, action, status_code):
-        from flask import make_response, jsonify
+        from flask import make_response
 
-        return make_response(jsonify(action._status), status_code)
+        return make_response(action.StatusToBytes(), status_code,
+          {"Content-type":"application/json"})
 
     def Run(self):
         from flask import Flask
         from flask_restful import Api, Resource, request
+        import logging
+
+        # Access log must not carry token passed in query of subscription
+        class RedactFilter(logging.Filter):
+            def filter(self, record):
+                record.msg = ActionHttpServer.RedactUrl(record.getMessage())
+                record.args = ()
+                return True
+        logging.getLogger("werkzeug").addFilter(RedactFilter())
 
         p = self
         class RestApi(Resource):
@@ -1305,71 +4975,133 @@ class ActionHttpServerFlask(ActionHttpServer):
             def delete(self):
                 return p.SendErrorResponse("delete")
 
+        def subscribe():
+            from flask import Response, stream_with_context
+
+            action, events = p.ProcessSubscribe(request.environ.get('REMOTE_ADDR'),
+              request.environ.get('REMOTE_PORT'), request.args.to_dict(),
+              request.headers.get("Last-Event-ID"),
+              request.headers.get(ActionHttpServer.AUTH_HEADER))
+            if not events:
+                return p.SendResponse(action, 200)
+            return Response(stream_with_context(events), mimetype="text/event-stream",
+              headers={"Cache-Control":"no-cache", "Access-Control-Allow-Origin":"*"})
+
         app = Flask(APP_NAME)
         api = Api(app)
         api.add_resource(RestApi, "/api")
-        app.run(debug=False, host=self._addr, port=self._port)
+        app.add_url_rule(ActionHttpServer.SUBSCRIBE_PATH, "subscribe", subscribe)
+        app.run(debug=False, host=self._addr, port=self._port, threaded=True)
 
 #---------------------------------------------------------------------------------------------------
 class ActionHttpServerSimple(ActionHttpServer):
-    _httpd = None
+    _local = None
 
-    def __init__(self, addr, port, backlog_path, db_path):
+    def __init__(self, addr, port, backlog_path, db_path, backlog_opts):
         super(ActionHttpServerSimple, self).__init__("http-server-simple", 
-          addr, port, backlog_path, db_path)
+          addr, port, backlog_path, db_path, backlog_opts)
 
     def SendResponse(self, action, status_code):
-        ActionHttpServerSimple._httpd._write_response(
-            Utils.JsonToStr(action._status).encode('utf-8'), status_code)
+        ActionHttpServerSimple._local.httpd._write_response(action.StatusToBytes(), status_code)
 
     def Run(self):
-        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
         from http import HTTPStatus
-        import json
+        from urllib.parse import urlsplit, parse_qsl
+        import threading
+
+        # Handler of the request is kept per thread, so that it can be reached from
+        # SendResponse()
+        ActionHttpServerSimple._local = threading.local()
 
         p = self
         class HttpRequestHandler(BaseHTTPRequestHandler):
+            # Keep connection alive between requests, e.g. chunks of backlog upload
+            protocol_version = "HTTP/1.1"
+            timeout = ActionBacklogUpload.TIMEOUT
+
             def _write_response(self, response, code):
                 self.send_response(HTTPStatus(code).value)
                 self.send_header('Content-type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
                 self.send_header('Access-Control-Allow-Origin', '*')
                 self.end_headers()
                 self.wfile.write(response)
 
+            def log_request(self, code="-", size="-"):
+                # Access log must not carry token passed in query of subscription
+                self.requestline = ActionHttpServer.RedactUrl(self.requestline)
+                BaseHTTPRequestHandler.log_request(self, code, size)
+
+            def do_GET(self):
+                ActionHttpServerSimple._local.httpd = self
+
+                # Subscription is the only resource
+                url = urlsplit(self.path)
+                if url.path != ActionHttpServer.SUBSCRIBE_PATH:
+                    return p.SendErrorResponse("get")
+                ip, port = self.client_address
+                action, events = p.ProcessSubscribe(ip, port, dict(parse_qsl(url.query)),
+                                                    self.headers.get("Last-Event-ID"),
+                                                    self.headers.get(ActionHttpServer.AUTH_HEADER))
+                if not events:
+                    return p.SendResponse(action, 200)
+
+                # Stream events until subscriber goes away
+                self.close_connection = True
+                try:
+                    self.send_response(HTTPStatus.OK.value)
+                    self.send_header('Content-type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.send_header('Access-Control-Allow-Origin', '*')
+                    self.send_header('Connection', 'close')
+                    self.end_headers()
+                    for event in events:
+                        self.wfile.write(event)
+                        self.wfile.flush()
+                except OSError:
+                    pass
+                finally:
+                    events.close()
+
             def do_POST(self):
                 # Init httpd so that it can be reachable from SendResponse()
-                ActionHttpServerSimple._httpd = self
+                ActionHttpServerSimple._local.httpd = self
 
                 # Process request
                 ip, port = self.client_address
                 length = int(self.headers.get('content-length'))
-                message = json.loads(self.rfile.read(length))
+                message = Utils.StrToJson(self.rfile.read(length))
                 p.ProcessRequest(ip, port, message) 
 
             def do_OPTIONS(self):
                 self.send_response(HTTPStatus.NO_CONTENT.value)
                 self.send_header('Access-Control-Allow-Origin', '*')
-                self.send_header('Access-Control-Allow-Methods', 'POST')
-                self.send_header('Access-Control-Allow-Headers', 'content-type')
+                self.send_header('Access-Control-Allow-Methods', 'GET, POST')
+                self.send_header('Access-Control-Allow-Headers',
+                                 'content-type, ' + ActionHttpServer.AUTH_HEADER.lower())
+                self.send_header('Content-Length', '0')
                 self.end_headers()
 
         server_address = (self._addr, self._port)
-        httpd = HTTPServer(server_address, HttpRequestHandler)
+        httpd = ThreadingHTTPServer(server_address, HttpRequestHandler)
+        httpd.daemon_threads = True
         httpd.serve_forever()
 
 #---------------------------------------------------------------------------------------------------
 class ActionHttpClient(Action):
-    def __init__(self, proto, addr, port, auth_token, data):
+    def __init__(self, proto, addr, port, auth_token, data, retry_policy=Retry.DEFAULT):
         self._proto = proto
         self._addr = addr
         self._port = port
         self._auth_token = auth_token
         self._data = data
+        self._retry_policy = retry_policy
         super(ActionHttpClient, self).__init__("http-client", 
           OrderedDict({"proto":proto, "addr":addr, "port":port, 
-                       "auth-token":auth_token, "data":data}))
+                       "auth-token":auth_token, "data":data, "retry-policy":retry_policy}))
 
-    def Run(self):
+    def Send(self):
         from urllib import request
         from urllib import error
 
@@ -1383,7 +5115,7 @@ class ActionHttpClient(Action):
               data=self._data.encode("utf-8"))
             resp = None
             try:
-                resp = request.urlopen(req)
+                resp = request.urlopen(req, timeout=ActionBacklogUpload.TIMEOUT)
                 resp_data = resp.read()
             except error.HTTPError as e:
                 # Bad HTTP status
@@ -1405,9 +5137,305 @@ class ActionHttpClient(Action):
                                      " status=" + str(resp.status); break
 
             break # while
+        return err
+
+    def Run(self):
+        if Retry.Parse(self._retry_policy) == None:
+            self.SetErr("Bad retry policy :: policy=" + str(self._retry_policy))
+            return
+
+        # Failed requests are retried with backoff, unless server is known to be down
+        err = Retry(self._retry_policy, self._addr, self._port).Run(self.Send)
         if err:
             self.SetErr("Failed to run http client :: " + err)
 
+#---------------------------------------------------------------------------------------------------
+class ActionClientAgent(Action):
+    STATUS_FILE = "/tmp/" + APP_NAME + "-client-agent.json"
+    SAMPLE_INTERVAL = 60
+    UPLOAD_INTERVAL = 60
+    # Single attempt per tick so that sampling is not blocked, backoff skips ticks instead
+    UPLOAD_RETRY = "attempts:1"
+
+    def __init__(self, config):
+        self._config = config
+        self._sensors = []
+        self._reload = True
+        self._stop = False
+        super(ActionClientAgent, self).__init__("client-agent",
+          OrderedDict({"config":config}))
+
+    def LoadConfig(self):
+        import glob
+
+        # Config is either a single file or a dir of configs
+        paths = sorted(glob.glob(self._config + "/*.cfg")) \
+                  if Utils.IsDirPresent(self._config) else [self._config]
+
+        # Keep statistics & schedules of sensors that survive reload
+        prev = OrderedDict([(s["name"], s) for s in self._sensors])
+
+        sensors = []
+        for path in paths:
+            cfg = Utils.ReadConfig(path)
+
+            # Ignore configs without sensors, e.g. server.cfg
+            if not cfg.get("SENSOR_NAME") or not cfg.get("SENSOR_ID"):
+                continue
+
+            # Paths are relative to config location, same as in wrappers
+            data_dir = os.path.dirname(os.path.abspath(path))
+            sensor = OrderedDict({
+                "name" : cfg["SENSOR_NAME"],
+                "config" : path,
+                "cfg" : cfg,
+                "server" : cfg.get("SERVER_ENABLED") == "true",
+                "backlog-path" : data_dir + "/backlog-client",
+                "db-path" : data_dir + "/piot.sqlite",
+                "opts" : ActionBacklog.GetOpts({
+                    "backlog-store" : cfg.get("BACKLOG_STORE"),
+                    "backlog-sync" : cfg.get("BACKLOG_SYNC"),
+                    "backlog-caps" : cfg.get("BACKLOG_CAPS"),
+                    "backlog-format" : cfg.get("BACKLOG_FORMAT"),
+                    "backlog-filter" : cfg.get("BACKLOG_FILTER"),
+                    "backlog-reorder" : cfg.get("BACKLOG_REORDER")}),
+                "sched-sample" : Scheduler(
+                    Utils.StrToInt(cfg.get("SENSOR_INTERVAL")) or \
+                      ActionClientAgent.SAMPLE_INTERVAL),
+                "sched-upload" : Scheduler(
+                    Utils.StrToInt(cfg.get("UPLOAD_INTERVAL")) or \
+                      ActionClientAgent.UPLOAD_INTERVAL,
+                    Utils.StrToInt(cfg.get("UPLOAD_JITTER"))),
+                "stats" : OrderedDict({"samples" : 0, "samples-failed" : 0,
+                                       "samples-missed" : 0, "sample-lag" : 0,
+                                       "uploads" : 0, "uploads-failed" : 0,
+                                       "uploads-missed" : 0, "upload-lag" : 0})})
+
+            if sensor["name"] in prev:
+                p = prev[sensor["name"]]
+                sensor["stats"] = p["stats"]
+                for key in ["sched-sample", "sched-upload"]:
+                    if sensor[key].IsSame(p[key]):
+                        sensor[key] = p[key]
+
+            # In serverless deployment sensor data goes directly to DB
+            if not sensor["server"]:
+                self.PrepareDb(sensor)
+            sensors.append(sensor)
+
+        # Start new schedules
+        time_cur = Utils.GetTimestamp()
+        for sensor in sensors:
+            for sched in [sensor["sched-sample"], sensor["sched-upload"]]:
+                if not sched.GetTimeDue():
+                    sched.Start(time_cur)
+
+        self.LogInf("Loaded client agent config :: path=" + self._config + \
+                                                 " sensors=" + str(len(sensors)))
+        self._sensors = sensors
+
+    def PrepareDb(self, sensor):
+        cfg = sensor["cfg"]
+        token = cfg.get("SERVER_AUTH_TOKEN")
+        LogTab.PushLogTab(self)
+        if not Utils.IsFilePresent(sensor["db-path"]):
+            ActionDbCreate(sensor["db-path"], token)
+        LogTab.PushLogTab(self)
+        ActionDbSensorCreate(sensor["db-path"], token, sensor["name"],
+          cfg.get("SENSOR_TYPE", "temperature"))
+
+    def Sample(self, sensor):
+        cfg = sensor["cfg"]
+        LogTab.PushLogTab(self)
+        if cfg.get("SENSOR_SOURCE") == "wttrin":
+            action = ActionReadSensorWttrinTemp(cfg["SENSOR_ID"], Wttrin.URL, Wttrin.TTL,
+              cfg.get("SENSOR_TYPE") or "temperature")
+        else:
+            action = ActionReadSensorDs18b20(cfg["SENSOR_ID"],
+              cfg.get("SENSOR_RANDOM") == "--random")
+        if not action.Ok():
+            return None, action.Err()
+        return action.OutJson(), None
+
+    def Store(self, sensor, entry):
+        LogTab.PushLogTab(self)
+        if sensor["server"]:
+            action = ActionBacklogWrite(sensor["backlog-path"], sensor["name"], [entry],
+              sensor["opts"])
+        else:
+            action = ActionDbSensorWrite(sensor["db-path"],
+              sensor["cfg"].get("SERVER_AUTH_TOKEN"), sensor["name"], Utils.JsonToStr([entry]))
+        return action.Err() if not action.Ok() else None
+
+    def Upload(self, sensor):
+        cfg = sensor["cfg"]
+        err = None
+        while True:
+            # Stream backlog to server, acknowledged entries are dropped locally
+            LogTab.PushLogTab(self)
+            action = ActionBacklogUpload(sensor["backlog-path"], sensor["name"],
+              cfg.get("SERVER_PROTO", "http"), cfg.get("SERVER_ADDR", "localhost"),
+              Utils.StrToInt(cfg.get("SERVER_PORT")), ActionBacklogUpload.CHUNK_SIZE,
+              sensor["opts"], cfg.get("UPLOAD_RETRY") or ActionClientAgent.UPLOAD_RETRY)
+            if not action.Ok():
+                err = action.Err(); break
+
+            break # while
+        return err
+
+    def GetExceptionErr():
+        ex_type, ex_value, _ = sys.exc_info()
+        err = "unhandled exception :: type=" + str(ex_type) + ", value=" + str(ex_value)
+        log.Err("Client agent tick failed :: " + err)
+        return err
+
+    def Tick(self, sensor, time_cur):
+        stats = sensor["stats"]
+
+        # Sample sensor & store value
+        sched = sensor["sched-sample"]
+        if sched.IsDue(time_cur):
+            stats["samples-missed"] += sched.Advance(time_cur)
+            stats["sample-lag"] = round(sched.GetLag(), 3)
+
+            # Failure of one sensor must not stop the agent
+            entry = None
+            try:
+                entry, err = self.Sample(sensor)
+                if entry:
+                    err = self.Store(sensor, entry)
+            except:
+                err = ActionClientAgent.GetExceptionErr()
+            if err:
+                stats["samples-failed"] += 1
+                stats["error"] = err
+            else:
+                # Entries of multi-column types, e.g. weather, have no single value
+                values = OrderedDict([(k, v) for k, v in entry.items() if k != "time"])
+                stats["samples"] += 1
+                stats["time-sample"] = entry["time"]
+                stats["value"] = values["value"] if list(values.keys()) == ["value"] \
+                                                 else values
+
+        # Upload backlog
+        sched = sensor["sched-upload"]
+        if sensor["server"] and sched.IsDue(time_cur):
+            stats["uploads-missed"] += sched.Advance(time_cur)
+            stats["upload-lag"] = round(sched.GetLag(), 3)
+
+            try:
+                err = self.Upload(sensor)
+            except:
+                err = ActionClientAgent.GetExceptionErr()
+            if err:
+                stats["uploads-failed"] += 1
+                stats["error"] = err
+            else:
+                stats["uploads"] += 1
+                stats["time-upload"] = Utils.GetUnixTimestamp()
+
+    def WriteStatus(self):
+        status = OrderedDict({
+            "pid" : os.getpid(),
+            "config" : self._config,
+            "time-cur" : Utils.GetUnixTimestamp(),
+            "sensors" : OrderedDict([(s["name"], s["stats"]) for s in self._sensors])})
+        Utils.ReplaceFile(ActionClientAgent.STATUS_FILE, Utils.JsonToStr(status))
+
+    def Run(self):
+        import signal
+
+        def on_reload(signum, frame):
+            self._reload = True
+        def on_stop(signum, frame):
+            self._stop = True
+        signal.signal(signal.SIGHUP, on_reload)
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+
+        while not self._stop:
+            # Reload config
+            if self._reload:
+                self._reload = False
+                self.LoadConfig()
+
+            # Run sensors that are due
+            time_cur = Utils.GetTimestamp()
+            for sensor in self._sensors:
+                self.Tick(sensor, time_cur)
+            self.WriteStatus()
+
+            # Sleep until next sensor is due, wake up periodically to handle signals
+            time_next = min([min(s["sched-sample"].GetTimeDue(),
+                                 s["sched-upload"].GetTimeDue() if s["server"] \
+                                   else s["sched-sample"].GetTimeDue()) \
+                             for s in self._sensors] or \
+                            [time_cur + ActionClientAgent.SAMPLE_INTERVAL])
+            while not self._stop and not self._reload and Utils.GetTimestamp() < time_next:
+                time.sleep(min(1, max(0, time_next - Utils.GetTimestamp())))
+
+        self.LogInf("Client agent stopped")
+        self.SetOut(OrderedDict({"stopped" : Utils.GetUnixTimestamp()}))
+
+#---------------------------------------------------------------------------------------------------
+class ActionBatch(Action):
+    # Long running actions and nested batches are not allowed
+    ALLOWED_ACTIONS = [
+        "db-create", "db-sensor-create", "db-sensor-write", "db-sensor-read",
+        "db-sensor-set-filter", "db-sensor-seal", "db-migrate", "db-sensor-stats",
+        "db-sensor-align",
+        "backlog-read", "backlog-write", "backlog-write-multi", "backlog-clear",
+        "backlog-status", "sensors-current",
+        "read-sensor-ds18b20", "sample-ds18b20-multi",
+        "read-sensor-wttrin", "sample-wttrin-multi",
+        "http-client", "upload-backlog"]
+
+    def __init__(self, batch_path, defaults):
+        self._batch_path = batch_path
+        self._defaults = defaults
+        super(ActionBatch, self).__init__("batch",
+          OrderedDict({"batch-path":batch_path}))
+
+    def Run(self):
+        stream = None
+        actions = failed = 0
+        err = None
+        try:
+            while True:
+                # Read requests from stdin or from file
+                if self._batch_path == "-":
+                    stream = sys.stdin
+                else:
+                    if not Utils.IsFilePresent(self._batch_path):
+                        err = "batch file is missing"; break
+                    stream = open(self._batch_path, "r")
+
+                # DB connections and backlog locks are shared by all actions
+                Pool.Enable()
+
+                # One request per line, one result per line
+                for line in stream:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    args = Utils.StrToJson(line)
+                    if isinstance(args, dict):
+                        args = OrderedDict(list(self._defaults.items()) + list(args.items()))
+                    action = RunAction(args, ActionBatch.ALLOWED_ACTIONS)
+                    actions += 1
+                    if not action.Ok():
+                        failed += 1
+
+                break # while
+        finally:
+            Pool.Close()
+            if stream and stream != sys.stdin:
+                stream.close()
+        if err:
+            self.SetErr("Failed to run batch :: " + err)
+            return
+        self.SetOut(OrderedDict({"actions" : actions, "failed" : failed}))
+
 #---------------------------------------------------------------------------------------------------
 def RunAction(args, allowed=None, override_args=None):
     action = None
@@ -1447,7 +5475,7 @@ def RunAction(args, allowed=None, override_args=None):
         action = ActionError(err, args);
 
     # Log to terminal
-    out.Write(Utils.JsonToStr(action._status), flush=True)
+    out.Write(action.FormatStatus(args.get("format"), args.get("fields")), flush=True)
     return action
 
 #---------------------------------------------------------------------------------------------------
@@ -1469,7 +5497,9 @@ def RunActionOne(name, args):
             args.get("db-path"),
             args.get("auth-token"),
             args.get("sensor-name"),
-            args.get("sensor-type"))
+            args.get("sensor-type"),
+            args.get("backlog-filter") or BacklogFilter.DEFAULT,
+            args.get("db-layout") or DbLayout.DEFAULT)
 
     # db-sensor-write
     elif name == "db-sensor-write":
@@ -1481,13 +5511,60 @@ def RunActionOne(name, args):
 
     # db-sensor-read
     elif name == "db-sensor-read":
-#            action = ActionDbSensorRead(
-#                args.get("auth-token"), 
-#                args.get("sensor-name"), 
-#                args.get("range-from"), 
-#                args.get("range-to"), 
-#                args.get("range-size"))
-        pass
+        action = ActionDbSensorRead(
+            args.get("db-path"),
+            args.get("auth-token"),
+            args.get("sensor-name"),
+            args.get("range-from") or 0,
+            args.get("range-to") or 0,
+            args.get("range-size") or 0)
+
+    # db-sensor-set-filter
+    elif name == "db-sensor-set-filter":
+        action = ActionDbSensorSetFilter(
+            args.get("db-path"),
+            args.get("auth-token"),
+            args.get("sensor-name"),
+            args.get("backlog-filter") or BacklogFilter.DEFAULT)
+
+    # db-sensor-stats
+    elif name == "db-sensor-stats":
+        action = ActionDbSensorStats(
+            args.get("db-path"),
+            args.get("auth-token"),
+            args.get("sensor-name"),
+            args.get("range-from") or 0,
+            args.get("range-to") or 0,
+            args.get("group") or 0,
+            args.get("stats") or SensorStats.DEFAULT)
+
+    # db-sensor-align
+    elif name == "db-sensor-align":
+        action = ActionDbSensorAlign(
+            args.get("db-path"),
+            args.get("auth-token"),
+            args.get("sensor-name"),
+            args.get("range-from") or 0,
+            args.get("range-to") or 0,
+            args.get("step") or 60,
+            args.get("align-mode") or "",
+            args.get("gap-limit") or 0)
+
+    # db-sensor-seal
+    elif name == "db-sensor-seal":
+        action = ActionDbSensorSeal(
+            args.get("db-path"),
+            args.get("auth-token"),
+            args.get("sensor-name"),
+            DbChunk.SEAL_AGE if args.get("seal-age") == None else args.get("seal-age"))
+
+    # db-migrate
+    elif name == "db-migrate":
+        action = ActionDbMigrate(
+            args.get("db-path"),
+            args.get("auth-token"),
+            args.get("sensor-name") or "",
+            args.get("db-layout") or DbLayout.DEFAULT)
 
     #-----------------------------------------------------------------------------------------------
     # HTTP
@@ -1497,7 +5574,8 @@ def RunActionOne(name, args):
         a = (args.get("addr"),
              args.get("port"),
              args.get("backlog-path"),
-             args.get("db-path"))
+             args.get("db-path"),
+             ActionBacklog.GetOpts(args))
         action = \
             ActionHttpServerSimple(*a) if name == "http-server"        else \
             ActionHttpServerSimple(*a) if name == "http-server-simple" else \
@@ -1511,7 +5589,27 @@ def RunActionOne(name, args):
             args.get("addr"),
             args.get("port"), 
             args.get("auth-token"),
-            args.get("data"))
+            args.get("data"),
+            args.get("retry-policy") or Retry.DEFAULT)
+
+    #-----------------------------------------------------------------------------------------------
+    # AGENT
+    #-----------------------------------------------------------------------------------------------
+    # client-agent
+    elif name == "client-agent":
+        action = ActionClientAgent(
+            args.get("config"))
+
+    #-----------------------------------------------------------------------------------------------
+    # BATCH
+    #-----------------------------------------------------------------------------------------------
+    # batch
+    elif name == "batch":
+        defaults = OrderedDict([(k, v) for k, v in args.items() \
+                                  if k not in ["action", "batch-path", "format", "fields"]])
+        action = ActionBatch(
+            args.get("batch-path") or "-",
+            defaults)
 
     #-----------------------------------------------------------------------------------------------
     # BACKLOG
@@ -1520,34 +5618,94 @@ def RunActionOne(name, args):
     elif name == "backlog-read":
         action = ActionBacklogRead(
             args.get("backlog-path"),
-            args.get("sensor-name"));
+            args.get("sensor-name"),
+            args.get("range-from") or 0,
+            args.get("range-to") or 0,
+            ActionBacklog.GetOpts(args));
 
     # backlog-write
     elif name == "backlog-write":
         action = ActionBacklogWrite(
             args.get("backlog-path"),
             args.get("sensor-name"),
-            args.get("data"));
+            args.get("data"),
+            ActionBacklog.GetOpts(args));
+
+    # backlog-write-multi
+    elif name == "backlog-write-multi":
+        action = ActionBacklogWriteMulti(
+            args.get("backlog-path"),
+            args.get("data"),
+            ActionBacklog.GetOpts(args));
+
+    # upload-backlog
+    elif name == "upload-backlog":
+        action = ActionBacklogUpload(
+            args.get("backlog-path"),
+            args.get("sensor-name"),
+            args.get("proto"),
+            args.get("addr"),
+            args.get("port"),
+            args.get("chunk-size") or ActionBacklogUpload.CHUNK_SIZE,
+            ActionBacklog.GetOpts(args),
+            args.get("retry-policy") or Retry.DEFAULT);
+
+    # backlog-status
+    elif name == "backlog-status":
+        action = ActionBacklogStatus(
+            args.get("backlog-path"),
+            args.get("sensor-name"),
+            ActionBacklog.GetOpts(args));
 
     # backlog-clear
     elif name == "backlog-clear":
         action = ActionBacklogClear(
             args.get("backlog-path"),
-            args.get("sensor-name"));
+            args.get("sensor-name"),
+            ActionBacklog.GetOpts(args));
 
     #-----------------------------------------------------------------------------------------------
     # SENSORS
     #-----------------------------------------------------------------------------------------------
+    # sensors-current
+    elif name == "sensors-current":
+        action = ActionSensorsCurrent(
+            args.get("db-path"),
+            args.get("auth-token"))
+
     # read-sensor-ds18b20
     elif name == "read-sensor-ds18b20":
         action = ActionReadSensorDs18b20(
             args.get("sensor-id"),
-            args.get("random"))
+            args.get("random"),
+            args.get("ds18b20-path") or ActionReadSensorDs18b20.DS18B20_PATH)
+
+    # sample-ds18b20-multi
+    elif name == "sample-ds18b20-multi":
+        action = ActionSampleDs18b20Multi(
+            args.get("backlog-path"),
+            args.get("sensors"),
+            args.get("random"),
+            args.get("ds18b20-path") or ActionReadSensorDs18b20.DS18B20_PATH,
+            ActionBacklog.GetOpts(args))
 
     # read-sensor-wttrin
     elif name == "read-sensor-wttrin":
         action = ActionReadSensorWttrinTemp(
-            args.get("sensor-id"))
+            args.get("sensor-id"),
+            args.get("wttrin-url") or Wttrin.URL,
+            Wttrin.TTL if args.get("wttrin-ttl") == None else args.get("wttrin-ttl"),
+            args.get("sensor-type") or "temperature")
+
+    # sample-wttrin-multi
+    elif name == "sample-wttrin-multi":
+        action = ActionSampleWttrinMulti(
+            args.get("backlog-path"),
+            args.get("sensors"),
+            args.get("sensor-id"),
+            args.get("wttrin-url") or Wttrin.URL,
+            Wttrin.TTL if args.get("wttrin-ttl") == None else args.get("wttrin-ttl"),
+            ActionBacklog.GetOpts(args))
     return action
 
 #---------------------------------------------------------------------------------------------------
@@ -1559,18 +5717,63 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Piot2 tool')
     parser.add_argument('--action', action='store', 
         help='Name of the action to perform')
+    parser.add_argument('--format', action='store', default="json", choices=["json", "shell"],
+        help='Format of the result, shell prints one <key>=<value> per line')
+    parser.add_argument('--fields', action='store', default="",
+        help='Comma-separated list of output keys to print, all if empty')
     parser.add_argument('--sensor-id', action='store', 
         help='Unique id of the sensor')
     parser.add_argument('--sensor-name', action='store', 
-        help='Name of the sensor in db')
+        help='Name of the sensor in db, comma-separated names where action accepts more')
     parser.add_argument('--sensor-type', action='store', 
-        help='Type of the sensor')
+        help='Type of the sensor: ' + ", ".join(SensorType.TYPES.keys()))
     parser.add_argument('--data', action='store', 
         help='Data in JSON format')
     parser.add_argument('--db-path', action='store', 
         help='Path to DB')
+    parser.add_argument('--db-layout', action='store', default=DbLayout.DEFAULT,
+        help='Storage layout of sensor points: ' + ", ".join(DbLayout.LAYOUTS))
     parser.add_argument('--backlog-path', action='store', default="backlog-client",
         help='Location of backlog')
+    parser.add_argument('--backlog-store', action='store', default="",
+        help='Name of the store holding backlogs of all sensors, one file per sensor if empty')
+    parser.add_argument('--backlog-format', action='store', default="json",
+        help='Encoding of backlog records: json or binary (single-value sensors only)')
+    parser.add_argument('--backlog-sync', action='store', default=BacklogSync.DEFAULT,
+        help='Durability of backlog writes: none, always, interval:<ms> or entries:<num>')
+    parser.add_argument('--backlog-caps', action='store', default=BacklogCaps.DEFAULT,
+        help='Backlog size caps, e.g. entries:<num>,bytes:<num>,age:<sec>')
+    parser.add_argument('--backlog-reorder', action='store', default=BacklogReorder.DEFAULT,
+        help='Window for entries arriving out of order, e.g. window:<sec>, ' +
+             'older entries are moved to side file')
+    parser.add_argument('--backlog-filter', action='store', default=BacklogFilter.DEFAULT,
+        help='Change-based filter, e.g. deadband:<tolerance> or swinging-door:<tolerance>, ' +
+             'optionally with ,heartbeat:<sec>')
+    parser.add_argument('--range-size', action='store', type=int, default=0,
+        help='Number of evenly spaced values reconstructed over the time range, stored values if 0')
+    parser.add_argument('--range-from', action='store', type=int, default=0,
+        help='Start of the time range, unbounded if 0')
+    parser.add_argument('--range-to', action='store', type=int, default=0,
+        help='End of the time range (inclusive), unbounded if 0')
+    parser.add_argument('--group', action='store', type=int, default=0,
+        help='Size of time buckets of sensor stats in seconds, whole range if 0')
+    parser.add_argument('--stats', action='store', default=SensorStats.DEFAULT,
+        help='Comma-separated sensor stats: ' + ", ".join(SensorStats.SIMPLE) +
+             ', p<percent>, hdd:<base>')
+    parser.add_argument('--step', action='store', type=int, default=60,
+        help='Interval in seconds of the common time grid of aligned sensors')
+    parser.add_argument('--align-mode', action='store', default="",
+        help='How aligned values are restored: ' + ", ".join(ActionDbSensorAlign.MODES) +
+             ', given by filter of each sensor if empty')
+    parser.add_argument('--gap-limit', action='store', type=int, default=0,
+        help='Points further apart in seconds are not interpolated, unlimited if 0')
+    parser.add_argument('--seal-age', action='store', type=int, default=DbChunk.SEAL_AGE,
+        help='Age in seconds after which DB points are sealed into compressed chunks')
+    parser.add_argument('--chunk-size', action='store', type=int, default=ActionBacklogUpload.CHUNK_SIZE,
+        help='Number of backlog entries sent to server in one request')
+    parser.add_argument('--retry-policy', action='store', default=Retry.DEFAULT,
+        help='Retry of failed requests to server, e.g. attempts:<n>,backoff:<ms>,' +
+             'backoff-max:<ms>,breaker:<failures>,cooldown:<sec>')
     parser.add_argument('--proto', action='store', default="http", 
         help='Transport protocol (HTTP or HTTPS)')
     parser.add_argument('--auth-token', action='store', 
@@ -1579,8 +5782,20 @@ if __name__ == "__main__":
         help='Address of the server')
     parser.add_argument('--port', action='store', type=int, default=8000, 
         help='Listening port of the server')
+    parser.add_argument('--sensors', action='store',
+        help='Comma separated list of <sensor-name>:<sensor-id> sampled at once')
+    parser.add_argument('--ds18b20-path', action='store', default=ActionReadSensorDs18b20.DS18B20_PATH,
+        help='Location of ds18b20 probes, e.g. fake sysfs tree for testing')
+    parser.add_argument('--wttrin-url', action='store', default=Wttrin.URL,
+        help='Base URL of wttr.in, e.g. local stub server for testing')
+    parser.add_argument('--wttrin-ttl', action='store', type=int, default=Wttrin.TTL,
+        help='Seconds for which fetched wttr.in weather is reused')
     parser.add_argument('--random', action='store_true', 
         help='Force sensor to report random data instead of reading real values')
+    parser.add_argument('--config', action='store', 
+        help='Path to config file or to dir of config files')
+    parser.add_argument('--batch-path', action='store', default="-",
+        help='File with one JSON action request per line, stdin if "-"')
     parser.add_argument('--clean-log', action='store_true', 
         help='Clean log file')
 